@@ -0,0 +1,123 @@
+from constants import CHARGING, NORMAL, RECOVERING
+from event_solver import ticks_for
+from odds_engine import bet_odds
+from race_engine import TICK_SECONDS
+from track import SEGMENTS
+import math
+import numpy as np
+import time
+
+# Closed-form odds, for when the field has only just appeared and the Monte Carlo estimate
+# is still running. Every pig leaves the gate charging, recovers, and from then on cycles
+# through NORMAL running, a charge and a recovery. Only the NORMAL stretch is random: it
+# lasts until a charge check comes up, checks being one every charge check interval that
+# each succeed with probability spirit, so its length is geometric. Renewal-reward theory
+# turns that cycle into a mean rate of progress and its variance, which give each pig's
+# expected finishing time and spread. The field is then ranked as a Plackett-Luce race
+# (finishing times with Gumbel noise of the field's spread), for which the win chances are a
+# softmax of the expected times and Harville's formulas for second and third are exact.
+
+MIN_SPREAD = TICK_SECONDS  # Finishing times are only resolved to the tick
+# Soft weights: a softmax of (expected time / scale), scale = spread * sqrt(6) / pi is a
+# Gumbel with the field's spread as its standard deviation
+GUMBEL_SCALE = math.sqrt(6) / math.pi
+STRAIGHT_METERS = sum(segment.end - segment.start for segment in SEGMENTS if not segment.is_turn)
+TURN_METERS = sum(segment.end - segment.start for segment in SEGMENTS if segment.is_turn)
+HARVILLE_ARRAY_SIZE = 64  # Fields this big work out the pairwise third-place sums with numpy
+HARVILLE_BLOCK = 512  # Rows of those sums worked out at a time
+
+
+class AnalyticEstimate:
+    # Same face as odds_engine.OddsEstimate; p_place and p_show are cumulative
+    def __init__(self, p_win, p_place, p_show, expected_times, time_deviations, elapsed):
+        self.samples = 0
+        self.elapsed = elapsed
+        self.seed = None
+        self.trifectas = None
+        self.p_win = p_win
+        self.p_place = p_place
+        self.p_show = p_show
+        self.expected_times = expected_times
+        self.time_deviations = time_deviations
+
+    def odds(self, bet_type="Win"):
+        return bet_odds(self, bet_type)
+
+
+def finish_time_moments(racer, weather_condition, track_condition, dt=TICK_SECONDS):
+    # Expected finishing time and its variance for one pig
+    base_speed = racer.base_speed_mps
+    course = NORMAL * (STRAIGHT_METERS / (base_speed * racer.get_speed_modifier(weather_condition, track_condition))
+                       + TURN_METERS / (base_speed * racer.get_speed_modifier(weather_condition, track_condition, is_turn=True)))
+    # Durations land on whole ticks, as they do in the engine
+    charge = ticks_for(racer.endurance, dt) * dt
+    recover = ticks_for(racer.vigor, dt) * dt
+    charged = CHARGING * charge
+    recovered = RECOVERING * recover
+    # Pigs that finish before their first recovery is over do so on a fixed schedule
+    if course <= charged:
+        return course / CHARGING, 0.0
+    remaining = course - charged - recovered
+    if remaining <= 0:
+        return charge + (course - charged) / RECOVERING, 0.0
+    # The charge check timer runs through the charge and the recovery, so the first NORMAL
+    # tick always checks; each failed check then costs another check interval
+    check = ticks_for(racer.charge_check_interval / 1000, dt) * dt
+    spirit = racer.spirit
+    normal_mean = dt + check * (1 - spirit) / spirit
+    normal_variance = check * check * (1 - spirit) / (spirit * spirit)
+    cycle_time = normal_mean + charge + recover
+    rate = (NORMAL * normal_mean + charged + recovered) / cycle_time
+    # Only the NORMAL stretch varies, and it runs at NORMAL against the mean rate
+    variance_rate = (NORMAL - rate) ** 2 * normal_variance / cycle_time
+    return charge + recover + remaining / rate, variance_rate * remaining / rate ** 3
+
+
+def harville(p_win):
+    # Plackett-Luce / Harville chances of each pig finishing exactly second and exactly third.
+    # With S = sum over j of p_j / (1 - p_j), P(i second) = p_i (S - p_i / (1 - p_i)); third
+    # needs the ordered pairs ahead of it, W[j, k] = p_j p_k / ((1 - p_j)(1 - p_j - p_k)),
+    # as P(i third) = p_i (sum of W - row i - column i).
+    ahead = [p / max(1 - p, 1e-12) for p in p_win]
+    total_ahead = sum(ahead)
+    second = [p * (total_ahead - a) for p, a in zip(p_win, ahead)]
+    if len(p_win) >= HARVILLE_ARRAY_SIZE:
+        row_sums, column_sums, pair_total = pair_sums_array(np.array(p_win), np.array(ahead))
+    else:
+        pairs = [[a * q / max(1 - p - q, 1e-12) for q in p_win] for p, a in zip(p_win, ahead)]
+        for j, row in enumerate(pairs):
+            row[j] = 0.0
+        row_sums = [sum(row) for row in pairs]
+        column_sums = [sum(column) for column in zip(*pairs)]
+        pair_total = sum(row_sums)
+    third = [max(p * (pair_total - row - column), 0.0) for p, row, column in zip(p_win, row_sums, column_sums)]
+    return second, third
+
+
+def pair_sums_array(p, ahead):
+    # The pairwise sums for big fields, a block of rows at a time to keep the memory down
+    n = len(p)
+    row_sums = np.empty(n)
+    column_sums = np.zeros(n)
+    for start in range(0, n, HARVILLE_BLOCK):
+        rows = slice(start, min(start + HARVILLE_BLOCK, n))
+        pairs = ahead[rows, None] * p[None, :] / np.maximum(1 - p[rows, None] - p[None, :], 1e-12)
+        np.fill_diagonal(pairs[:, start:], 0.0)
+        row_sums[rows] = pairs.sum(axis=1)
+        column_sums += pairs.sum(axis=0)
+    return row_sums, column_sums, row_sums.sum()
+
+
+def analytic_probabilities(racers, weather_condition, track_condition, dt=TICK_SECONDS):
+    started = time.perf_counter()
+    moments = [finish_time_moments(racer, weather_condition, track_condition, dt) for racer in racers]
+    means = [mean for mean, _ in moments]
+    scale = max(math.sqrt(sum(variance for _, variance in moments) / max(len(moments), 1)), MIN_SPREAD) * GUMBEL_SCALE
+    fastest = min(means, default=0.0)
+    weights = [math.exp((fastest - mean) / scale) for mean in means]
+    total = sum(weights)
+    p_win = [weight / total for weight in weights]
+    second, third = harville(p_win)
+    p_place = [min(p + q, 1.0) for p, q in zip(p_win, second)]
+    p_show = [min(p + q, 1.0) for p, q in zip(p_place, third)]
+    return AnalyticEstimate(p_win, p_place, p_show, means, [math.sqrt(variance) for _, variance in moments], time.perf_counter() - started)
@@ -0,0 +1,293 @@
+from batch_engine import BatchRace
+from constants import PLAYER_START_BANK, DEFAULT_BET_SIZE, BET_AMOUNTS, HOUSE_MARGIN
+from odds_engine import OddsEstimate, field_stats, odds_from_probabilities, simulate_placings
+from race_engine import choose_conditions, generate_field, new_seed, seeded_rng
+from settlement import BET_TYPES, BET_MULTIPLIER_ARRAY, MIN_BET, settle_many
+import argparse
+import json
+import numpy as np
+import sys
+import time
+
+# Betting strategy backtests. A corpus is a set of races, each with the odds the house
+# offered and where every pig finished, held as [races x lanes] arrays. A backtest deals the
+# corpus out to a number of independent bankrolls and plays a policy through it one race at
+# a time, settling every bankroll's bet at once by the rules in settlement.py, so a million
+# races take a thousand steps of array work rather than a million Python iterations.
+#
+#   python backtest.py --fields 200 --races-per-field 5000 --pigs 8 --seed 1 --save corpus.npz
+#   python backtest.py --corpus corpus.npz --policy favourite --bet-type Show --paths 1000
+#   python backtest.py --corpus runs.jsonl --policy kelly --kelly-fraction 0.5
+#
+# A corpus can be simulated (each field is priced from one batch of races and raced in
+# another, so the odds never know the results) or read from batch_runner.py output.
+
+PRICING_SAMPLES = 2000  # Simulated races used to price each field in a simulated corpus
+
+
+class Corpus:
+    # odds, p_win, p_place and p_show are per lane as the house priced them (p_place and
+    # p_show cumulative, as in odds_engine); places are 1-based finishing positions. Fields
+    # smaller than the widest one are padded with empty lanes that have place 0 and no odds.
+    def __init__(self, odds, places, p_win, p_place, p_show):
+        self.odds = odds
+        self.places = places
+        self.p_win = p_win
+        self.p_place = p_place
+        self.p_show = p_show
+
+    def __len__(self):
+        return len(self.places)
+
+    @property
+    def lanes(self):
+        return self.places > 0
+
+    def bet_odds(self, bet_type):
+        # The odds offered on every lane for a bet type (an index into BET_TYPES): the Win odds
+        # as recorded, Place and Show priced from the house's chances of those exact places
+        if bet_type == 0:
+            return self.odds
+        return np.where(self.lanes, odds_from_probabilities(exact_place_probability(self, bet_type), BET_MULTIPLIER_ARRAY[bet_type]), np.nan)
+
+    def take(self, rows):
+        return Corpus(self.odds[rows], self.places[rows], self.p_win[rows], self.p_place[rows], self.p_show[rows])
+
+    def save(self, path):
+        np.savez_compressed(path, odds=self.odds, places=self.places, p_win=self.p_win, p_place=self.p_place, p_show=self.p_show)
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith('.jsonl'):
+            return cls.from_records(path)
+        with np.load(path) as data:
+            return cls(data['odds'], data['places'], data['p_win'], data['p_place'], data['p_show'])
+
+    @classmethod
+    def from_records(cls, path):
+        # batch_runner.py JSONL output; races run without odds are skipped
+        rows = []
+        with open(path) as records:
+            for line in records:
+                record = json.loads(line)
+                if 'odds' in record:
+                    rows.append(record)
+        width = max((record['pigs'] for record in rows), default=0)
+        corpus = empty_corpus(len(rows), width)
+        for row, record in enumerate(rows):
+            pigs = record['pigs']
+            corpus.odds[row, :pigs] = record['odds']
+            corpus.p_win[row, :pigs] = record['p_win']
+            corpus.p_place[row, :pigs] = record['p_place']
+            corpus.p_show[row, :pigs] = record['p_show']
+            corpus.places[row, record['finish_order']] = np.arange(1, pigs + 1)
+        return corpus
+
+
+def empty_corpus(races, width):
+    return Corpus(np.full((races, width), np.nan), np.zeros((races, width), dtype=np.int32),
+                  np.zeros((races, width)), np.zeros((races, width)), np.zeros((races, width)))
+
+
+def simulate_corpus(fields, races_per_field, num_pigs=8, seed=None, pricing_samples=PRICING_SAMPLES):
+    # Each field is drawn from its own seed like a game race, priced the way the window
+    # prices it, then raced races_per_field times on the batch engine
+    seed = seed if seed is not None else new_seed()
+    corpus = empty_corpus(fields * races_per_field, num_pigs)
+    for field in range(fields):
+        field_seed = seed + field
+        racers = generate_field(num_pigs, seed=field_seed)
+        weather, track = choose_conditions(seeded_rng(field_seed, 'conditions'))
+        stats = field_stats(racers)
+        counts = simulate_placings(stats, weather[1], track[1], pricing_samples, [field_seed, 0])
+        estimate = OddsEstimate(counts, pricing_samples, 0.0, field_seed)
+        tiled = {stat: np.tile(values, (races_per_field, 1)) for stat, values in stats.items()}
+        batch = BatchRace(weather_impact=np.full(races_per_field, weather[1]), track_impact=np.full(races_per_field, track[1]),
+                          rng=np.random.default_rng([field_seed, 1]), **tiled)
+        order = batch.run()
+        rows = slice(field * races_per_field, (field + 1) * races_per_field)
+        corpus.odds[rows] = estimate.odds()
+        corpus.p_win[rows] = estimate.p_win
+        corpus.p_place[rows] = estimate.p_place
+        corpus.p_show[rows] = estimate.p_show
+        places = np.empty_like(order)
+        np.put_along_axis(places, order, np.arange(1, num_pigs + 1), axis=1)
+        corpus.places[rows] = places
+    return corpus
+
+
+def exact_place_probability(corpus, bet_type):
+    # The house's chance of each pig finishing in exactly the place the bet type pays on
+    if bet_type == 0:
+        return corpus.p_win
+    if bet_type == 1:
+        return corpus.p_place - corpus.p_win
+    return corpus.p_show - corpus.p_place
+
+
+def stake_to_bet_amount(stake):
+    # Round a stake down to the nearest amount the game offers, 0 if it is below the smallest
+    amounts = np.array(BET_AMOUNTS, dtype=np.float64)
+    index = np.searchsorted(amounts, stake, side='right') - 1
+    return np.where(index >= 0, amounts[np.maximum(index, 0)], 0.0)
+
+
+# Policies see the races in front of every bankroll (a Corpus with one row per bankroll)
+# and the banks, and return each bankroll's bet: bet type (index into BET_TYPES), lane and
+# amount, an amount of 0 meaning no bet.
+
+def favourite(bet_type="Show", amount=DEFAULT_BET_SIZE):
+    # Always back the pig with the lowest odds for a flat stake
+    bet_type = BET_TYPES.index(bet_type)
+
+    def policy(races, bank):
+        odds = np.where(races.lanes, races.odds, np.inf)
+        return np.full(len(races), bet_type), np.argmin(odds, axis=1), np.full(len(races), float(amount))
+    return policy
+
+
+def kelly(bet_type="Win", fraction=1.0):
+    # Back the pig with the biggest edge under the house's own probabilities, staking the
+    # Kelly fraction of the bank, rounded down to a stake the game offers
+    bet_type = BET_TYPES.index(bet_type)
+    multiplier = BET_MULTIPLIER_ARRAY[bet_type]
+
+    def policy(races, bank):
+        p = exact_place_probability(races, bet_type)
+        returns = np.where(races.lanes, races.bet_odds(bet_type) * multiplier, 0.0)
+        edge = p * returns - 1
+        lane = np.argmax(edge, axis=1)
+        rows = np.arange(len(races))
+        best_edge = edge[rows, lane]
+        best_return = returns[rows, lane]
+        kelly_fraction = np.where((best_edge > 0) & (best_return > 1), best_edge / np.maximum(best_return - 1, 1e-12), 0.0)
+        return np.full(len(races), bet_type), lane, stake_to_bet_amount(fraction * kelly_fraction * bank)
+    return policy
+
+
+POLICIES = {'favourite': favourite, 'kelly': kelly}
+
+
+def expected_returns(corpus):
+    # [bet types x races x lanes]: what a unit stake on each bet is expected to return under
+    # the house's own chances, NaN on empty lanes
+    return np.stack([np.where(corpus.lanes, exact_place_probability(corpus, bet_type) * corpus.bet_odds(bet_type) * BET_MULTIPLIER_ARRAY[bet_type], np.nan)
+                     for bet_type in range(len(BET_TYPES))])
+
+
+def check_house_edge(corpus, margin=HOUSE_MARGIN):
+    # The best expected return per unit staked of any bet in the corpus. Every bet is priced
+    # to return 1 - margin at most, so no policy, however it picks and sizes its bets, can
+    # expect to come out ahead; a corpus with a better bet in it was priced wrongly.
+    best = float(np.nanmax(expected_returns(corpus))) if len(corpus) else 0.0
+    if best > 1 - margin + 1e-9:
+        raise ValueError(f"a bet in the corpus is expected to return {best:.3f} per unit staked, more than the {1 - margin:.3f} the house margin allows")
+    return best
+
+
+class BacktestResult:
+    def __init__(self, banks, staked, returned, ruined):
+        self.banks = banks  # [races + 1, bankrolls]: every bankroll before and after each race
+        self.staked = staked
+        self.returned = returned
+        self.ruined = ruined  # Bankrolls that could no longer cover their policy's stake
+
+    @property
+    def roi(self):
+        staked = self.staked.sum()
+        return (self.returned.sum() - staked) / staked if staked else 0.0
+
+    @property
+    def ruin_probability(self):
+        return self.ruined.mean()
+
+    def trajectory_percentiles(self, percentiles=(5, 25, 50, 75, 95)):
+        return np.percentile(self.banks, percentiles, axis=1)
+
+
+def backtest(corpus, policy, paths=1000, bank=PLAYER_START_BANK, seed=None):
+    # Shuffle the corpus, deal it out to paths bankrolls (races that don't divide evenly are
+    # left out) and play the policy through it. A bankroll that can't cover the stake its
+    # policy asks for, or the smallest bet, is ruined and stops betting; no bet is ever
+    # bigger than the bank. A policy choosing not to bet (a stake of 0) is not ruin.
+    rng = np.random.default_rng(seed)
+    steps = len(corpus) // paths
+    deal = rng.permutation(len(corpus))[:steps * paths].reshape(steps, paths)
+    banks = np.empty((steps + 1, paths))
+    banks[0] = bank
+    staked = np.zeros(paths)
+    returned = np.zeros(paths)
+    ruined = np.zeros(paths, dtype=bool)
+    rows = np.arange(paths)
+    current = banks[0].copy()
+    for step in range(steps):
+        races = corpus.take(deal[step])
+        bet_types, lanes, amounts = policy(races, current)
+        ruined |= (current < MIN_BET) | (amounts > current)
+        amounts = np.where(ruined, 0.0, amounts)
+        betting = amounts > 0
+        odds = np.stack([races.bet_odds(bet_type) for bet_type in range(len(BET_TYPES))])
+        payouts = settle_many(bet_types, amounts, odds[bet_types, rows, lanes], races.places[rows, lanes])
+        # The stake comes off to the cent, and a win is credited to the whole dollar
+        after_stake = np.round(current - amounts, 2)
+        current = np.where(betting & (payouts > 0), np.round(after_stake + payouts), np.where(betting, after_stake, current))
+        staked += amounts
+        returned += payouts
+        banks[step + 1] = current
+    # Whoever is left unable to stake what the policy would ask of them on the last races is
+    # ruined too, as the bank only moves when a bet goes down
+    if steps:
+        _, _, amounts = policy(races, current)
+        ruined |= amounts > current
+    ruined |= current < MIN_BET
+    return BacktestResult(banks, staked, returned, ruined)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest a betting policy over simulated or recorded races.")
+    parser.add_argument('--corpus', help="corpus to load: a .npz saved by --save, or batch_runner.py JSONL output")
+    parser.add_argument('--fields', type=int, default=100, help="fields to simulate when no corpus is given")
+    parser.add_argument('--races-per-field', type=int, default=1000)
+    parser.add_argument('--pigs', type=int, default=8)
+    parser.add_argument('--pricing-samples', type=int, default=PRICING_SAMPLES)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--save', help="save the simulated corpus to this .npz")
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='favourite')
+    parser.add_argument('--bet-type', choices=BET_TYPES, default=None)
+    parser.add_argument('--stake', type=float, default=DEFAULT_BET_SIZE, help="flat stake for the favourite policy")
+    parser.add_argument('--kelly-fraction', type=float, default=1.0)
+    parser.add_argument('--paths', type=int, default=1000, help="independent bankrolls to deal the corpus out to")
+    parser.add_argument('--bank', type=float, default=PLAYER_START_BANK)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.corpus:
+        corpus = Corpus.load(args.corpus)
+    else:
+        corpus = simulate_corpus(args.fields, args.races_per_field, args.pigs, args.seed, args.pricing_samples)
+        if args.save:
+            corpus.save(args.save)
+    print(f"Corpus of {len(corpus)} races ready in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    try:
+        best_return = check_house_edge(corpus)
+    except ValueError as error:
+        print(f"Mispriced corpus: {error}", file=sys.stderr)
+        return 1
+    if args.policy == 'favourite':
+        policy = favourite(args.bet_type or "Show", args.stake)
+    else:
+        policy = kelly(args.bet_type or "Win", args.kelly_fraction)
+    started = time.perf_counter()
+    result = backtest(corpus, policy, min(args.paths, max(len(corpus), 1)), args.bank, args.seed)
+    elapsed = time.perf_counter() - started
+    final = result.banks[-1]
+    print(f"Backtested {result.banks.shape[0] - 1} races on each of {result.banks.shape[1]} bankrolls in {elapsed:.2f}s")
+    print(f"Staked ${result.staked.sum():,.2f}, returned ${result.returned.sum():,.2f}, ROI {result.roi:+.2%}")
+    print(f"Best expected return on any bet ${best_return:.3f} per $1 staked, so every policy's expected ROI is at most {best_return - 1:+.1%}")
+    print(f"Ruin probability {result.ruin_probability:.2%}")
+    print("Final bank percentiles: " + ", ".join(f"p{q} ${value:,.2f}" for q, value in zip((5, 25, 50, 75, 95), np.percentile(final, (5, 25, 50, 75, 95)))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+from constants import ENERGY_MIN, ENERGY_MAX, END_MIN, END_MAX, VIG_MIN, VIG_MAX, CHARGING_MIN, CHARGING_MAX, SPEED_MAX, SPEED_MIN, NORMAL, CHARGING, RECOVERING, WEATHER_CONDITIONS, TRACK_CONDITIONS, AGILITY_MIN, AGILITY_MAX, TURN_PENALTY
+from race_engine import TICK_SECONDS, Race, RaceFrame, RaceState, generate_weights
+import numpy as np
+from track import SEGMENT_ENDS, TURNS
+
+# Struct-of-arrays version of race_engine for bulk simulation. Every stat and every piece
+# of race state is a [races x pigs] array, and one call to step() advances every pig of
+# every race by one tick with a handful of vectorized operations.
+
+# Integer codes for the string states used by Racer
+READY_STATE = 0
+CHARGING_STATE = 1
+NORMAL_STATE = 2
+RECOVERING_STATE = 3
+STATE_NAMES = ('READY', 'CHARGING', 'NORMAL', 'RECOVERING')
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+# Speed multiplier for each state code; READY pigs charge out of the gate
+STATE_MULTIPLIERS = np.array([CHARGING, CHARGING, NORMAL, RECOVERING], dtype=np.float64)
+SEGMENT_END_ARRAY = np.array(SEGMENT_ENDS, dtype=np.float64)
+LAST_SEGMENT = len(SEGMENT_ENDS) - 1
+
+
+class BatchRace:
+    def __init__(self, top_speed, agility, endurance, vigor, spirit, energy, weather_impact, track_impact, rng=None):
+        # Stats are [races x pigs] (a 1-D field is treated as a single race); the condition
+        # impacts are one value per race
+        self.top_speed = np.atleast_2d(np.asarray(top_speed, dtype=np.float64))
+        shape = self.top_speed.shape
+        self.agility = np.broadcast_to(np.asarray(agility, dtype=np.float64), shape).copy()
+        self.endurance = np.broadcast_to(np.asarray(endurance, dtype=np.float64), shape).copy()
+        self.vigor = np.broadcast_to(np.asarray(vigor, dtype=np.float64), shape).copy()
+        self.spirit = np.broadcast_to(np.asarray(spirit, dtype=np.float64), shape).copy()
+        self.energy = np.broadcast_to(np.asarray(energy, dtype=np.float64), shape).copy()
+        self.weather_impact = np.broadcast_to(np.asarray(weather_impact, dtype=np.float64).reshape(-1, 1), (shape[0], 1)).copy()
+        self.track_impact = np.broadcast_to(np.asarray(track_impact, dtype=np.float64).reshape(-1, 1), (shape[0], 1)).copy()
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # Nothing below changes during a race, so it is worked out once up front
+        self.base_speed_mps = np.minimum((self.top_speed * 1000) / 3600, 60)
+        self.speed_modifier = self.get_speed_modifier()
+        self.turn_speed_modifier = self.get_speed_modifier(is_turn=True)
+        # [races x pigs x segments] cruising speed on every segment of the track
+        self.segment_speed_mps = np.stack([self.base_speed_mps * (self.turn_speed_modifier if is_turn else self.speed_modifier) for is_turn in TURNS], axis=-1)
+        self.charge_check_interval = self.energy * 100
+        self.start()
+
+    @property
+    def shape(self):
+        return self.top_speed.shape
+
+    @classmethod
+    def from_racers(cls, racers, weather_condition, track_condition, num_races=1, rng=None):
+        # Run the same field under the same conditions num_races times side by side
+        def column(stat):
+            return np.tile([getattr(racer, stat) for racer in racers], (num_races, 1))
+        return cls(column('top_speed'), column('agility'), column('endurance'), column('vigor'),
+                   column('spirit'), column('energy'), np.full(num_races, weather_condition[1]),
+                   np.full(num_races, track_condition[1]), rng=rng)
+
+    @classmethod
+    def random_fields(cls, num_races, num_pigs, rng=None, weather_condition=None, track_condition=None):
+        # Independent random fields and conditions, drawn like race_engine.generate_field
+        rng = rng if rng is not None else np.random.default_rng()
+        shape = (num_races, num_pigs)
+        top_speed = rng.uniform(SPEED_MIN, SPEED_MAX, shape)
+        agility = rng.uniform(AGILITY_MIN, AGILITY_MAX, shape)
+        endurance = rng.uniform(END_MIN, END_MAX, shape)
+        vigor = rng.uniform(VIG_MIN, VIG_MAX, shape)
+        spirit = rng.uniform(CHARGING_MIN, CHARGING_MAX, shape)
+        energy = rng.uniform(ENERGY_MIN, ENERGY_MAX, shape)
+        if weather_condition is None:
+            weather_impact = choose_impacts(WEATHER_CONDITIONS, num_races, rng)
+        else:
+            weather_impact = np.full(num_races, weather_condition[1])
+        if track_condition is None:
+            track_impact = choose_impacts(TRACK_CONDITIONS, num_races, rng)
+        else:
+            track_impact = np.full(num_races, track_condition[1])
+        return cls(top_speed, agility, endurance, vigor, spirit, energy, weather_impact, track_impact, rng=rng)
+
+    def get_speed_modifier(self, is_turn=False):
+        # Vectorized Racer.get_speed_modifier
+        base_impact = (self.weather_impact + self.track_impact) / 2
+        if is_turn:
+            base_impact = base_impact * TURN_PENALTY
+        agility_factor = (self.agility - 50) / 50
+        return np.maximum(1 - base_impact * (1 - agility_factor), 0.3)
+
+    def start(self):
+        shape = self.shape
+        self.distance_covered = np.zeros(shape)
+        self.segment = np.zeros(shape, dtype=np.intp)
+        # Speed and end of the segment each pig is on, only touched when it moves onto the next
+        self.cruise_speed_mps = self.segment_speed_mps[..., 0].copy()
+        self.segment_end = np.full(shape, SEGMENT_END_ARRAY[0])
+        self.state = np.full(shape, READY_STATE, dtype=np.int8)
+        self.state_timer = np.zeros(shape)
+        self.charge_check_timer = np.zeros(shape)
+        self.running = np.ones(shape, dtype=bool)
+        self.finish_tick = np.full(shape, -1, dtype=np.int64)
+        self.finish_time = np.full(shape, np.inf)
+        self.ticks = 0
+
+    def restore(self, state, dt=TICK_SECONDS):
+        # Put every race at the moment a race_engine.RaceState was saved, so from there on each
+        # runs out the rest of that race with its own charge rolls. The state is only read, and
+        # restoring again starts the forks over.
+        shape = self.shape
+        finish_times = np.array([np.inf if time is None else time for time in state.finish_times])
+        finished = np.isfinite(finish_times)
+        self.distance_covered = np.broadcast_to(np.asarray(state.distances, dtype=np.float64), shape).copy()
+        self.segment = np.broadcast_to(np.asarray(state.segments, dtype=np.intp), shape).copy()
+        self.cruise_speed_mps = np.take_along_axis(self.segment_speed_mps, self.segment[..., None], axis=-1)[..., 0]
+        self.cruise_speed_mps[:, finished] = 0
+        self.segment_end = SEGMENT_END_ARRAY[self.segment]
+        self.segment_end[:, finished] = np.inf
+        self.state = np.broadcast_to(np.array([STATE_CODES[name] for name in state.states], dtype=np.int8), shape).copy()
+        self.state_timer = np.broadcast_to(np.asarray(state.state_timers, dtype=np.float64), shape).copy()
+        self.charge_check_timer = np.broadcast_to(np.asarray(state.charge_check_timers, dtype=np.float64), shape).copy()
+        self.running = np.broadcast_to(~finished, shape).copy()
+        self.ticks = round(state.clock / dt)
+        self.finish_tick = np.broadcast_to(np.where(finished, np.ceil(np.where(finished, finish_times, 0) / dt - 1e-9), -1).astype(np.int64), shape).copy()
+        self.finish_time = np.broadcast_to(finish_times, shape).copy()
+
+    @property
+    def finished(self):
+        return not self.running.any()
+
+    def step(self, dt=TICK_SECONDS):
+        # One tick of Racer.step for every pig at once. Every mask is taken from the state at
+        # the start of the tick, which mirrors the if/elif chain in Racer.step. Transitions
+        # are rare, so they are applied through flat index lists rather than full-size masks.
+        self.ticks += 1
+        if self.ticks == 1:
+            # Every pig leaves the gate charging on the first tick
+            self.state[self.state == READY_STATE] = CHARGING_STATE
+        state = self.state
+        self.state_timer += dt
+        self.charge_check_timer += dt * 1000
+        speed_multiplier = STATE_MULTIPLIERS[state]
+
+        check = np.flatnonzero((state == NORMAL_STATE) & (self.charge_check_timer >= self.charge_check_interval))
+        tired = np.flatnonzero((state == CHARGING_STATE) & (self.state_timer >= self.endurance))
+        rested = np.flatnonzero((state == RECOVERING_STATE) & (self.state_timer >= self.vigor))
+        flat_state = state.reshape(-1)
+        flat_timer = self.state_timer.reshape(-1)
+        if check.size:
+            # Charge checks only roll the dice for the pigs that are actually due one
+            self.charge_check_timer.reshape(-1)[check] = 0
+            charge = check[self.rng.random(check.size) < self.spirit.reshape(-1)[check]]
+            flat_state[charge] = CHARGING_STATE
+            flat_timer[charge] = 0
+        if tired.size:
+            flat_state[tired] = RECOVERING_STATE
+            flat_timer[tired] = 0
+        if rested.size:
+            flat_state[rested] = NORMAL_STATE
+            flat_timer[rested] = 0
+
+        # Finished pigs have a zero cruise speed, so they stay on the line
+        actual_speed_mps = speed_multiplier * self.cruise_speed_mps
+        self.distance_covered += actual_speed_mps * dt
+        boundary = np.flatnonzero(self.distance_covered >= self.segment_end)
+        crossed = np.zeros(self.shape, dtype=bool)
+        if boundary.size:
+            # Time each of them ran past the end of the segment, which is left for the next one
+            remaining = (self.distance_covered.reshape(-1)[boundary] - self.segment_end.reshape(-1)[boundary]) / actual_speed_mps.reshape(-1)[boundary]
+            self.cross_boundaries(boundary, remaining, dt, speed_multiplier.reshape(-1), crossed)
+        return crossed
+
+    def cross_boundaries(self, boundary, remaining, dt, speed_multiplier, crossed):
+        # The few pigs that reach the end of a segment this tick: run them to the boundary,
+        # then on at the next segment's speed for the rest of the tick, or stop them on the
+        # line if it was the last segment
+        flat_distance = self.distance_covered.reshape(-1)
+        flat_segment = self.segment.reshape(-1)
+        flat_speeds = self.segment_speed_mps.reshape(-1, len(SEGMENT_ENDS))
+        flat_cruise = self.cruise_speed_mps.reshape(-1)
+        flat_end = self.segment_end.reshape(-1)
+        while boundary.size:
+            flat_distance[boundary] = SEGMENT_END_ARRAY[flat_segment[boundary]]
+            at_line = flat_segment[boundary] == LAST_SEGMENT
+            if at_line.any():
+                finishers = boundary[at_line]
+                self.finish_tick.reshape(-1)[finishers] = self.ticks
+                self.finish_time.reshape(-1)[finishers] = self.ticks * dt - remaining[at_line]
+                self.running.reshape(-1)[finishers] = False
+                crossed.reshape(-1)[finishers] = True
+                flat_cruise[finishers] = 0
+                flat_end[finishers] = np.inf
+                boundary, remaining = boundary[~at_line], remaining[~at_line]
+            flat_segment[boundary] += 1
+            flat_cruise[boundary] = flat_speeds[boundary, flat_segment[boundary]]
+            flat_end[boundary] = SEGMENT_END_ARRAY[flat_segment[boundary]]
+            speed = flat_cruise[boundary] * speed_multiplier[boundary]
+            reach = (flat_end[boundary] - flat_distance[boundary]) / speed
+            short = reach > remaining
+            flat_distance[boundary[short]] += speed[short] * remaining[short]
+            # Only a segment shorter than one tick's run would send anyone round again
+            boundary, remaining = boundary[~short], remaining[~short] - reach[~short]
+
+    def run(self, dt=TICK_SECONDS):
+        self.start()
+        while not self.finished:
+            self.step(dt)
+        return self.finish_order()
+
+    def run_until_placed(self, places, dt=TICK_SECONDS):
+        # Step only until the first places pigs of every race are home, for when nothing
+        # further down matters; the rest are left where they are, still running
+        home = (~self.running).sum(axis=1)
+        while home.min() < places:
+            crossed = self.step(dt)
+            if crossed.any():
+                home += crossed.sum(axis=1)
+
+    def finish_order(self):
+        # Pig indices per race, winner first, by exact crossing time like race_engine.Race
+        return np.argsort(self.finish_time, axis=-1, kind='stable')
+
+    def placings(self):
+        # Finishing position (0 = winner) of every pig, the inverse of finish_order
+        order = self.finish_order()
+        placings = np.empty_like(order)
+        np.put_along_axis(placings, order, np.arange(order.shape[1])[None, :], axis=1)
+        return placings
+
+
+class FieldRace(Race):
+    # race_engine.Race with the field held in arrays, for fields of hundreds or thousands of
+    # pigs. It runs exactly the same seeded race, bit for bit, because every pig does the
+    # same float operations in the same order and still rolls its charge checks from its own
+    # stream; only the few pigs due a roll or crossing a segment boundary are handled one at
+    # a time. Racer objects are written back as each pig finishes.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.standings = None  # The arrays only exist once the race has started
+
+    def start(self):
+        super().start()
+        racers = self.racers
+        n = len(racers)
+        self.elapsed = 0.0
+        self.distance = np.zeros(n)
+        self.segment = np.zeros(n, dtype=np.intp)
+        self.state = np.full(n, READY_STATE, dtype=np.int8)
+        self.state_timer = np.zeros(n)
+        self.charge_check_timer = np.zeros(n)
+        self.running = np.ones(n, dtype=bool)
+        self.segment_speed_mps = np.array([racer.segment_speeds for racer in racers], dtype=np.float64).reshape(n, len(SEGMENT_ENDS))
+        self.cruise_speed_mps = self.segment_speed_mps[:, 0].copy()
+        self.segment_end = np.full(n, SEGMENT_END_ARRAY[0])
+        self.endurance = np.array([racer.endurance for racer in racers], dtype=np.float64)
+        self.vigor = np.array([racer.vigor for racer in racers], dtype=np.float64)
+        self.charge_check_interval = np.array([racer.charge_check_interval for racer in racers], dtype=np.float64)
+        self.finish_times = [None] * n
+        # Running lanes in standings order as of the last snapshot
+        self.standings = np.arange(n)
+
+    def step(self, dt=TICK_SECONDS):
+        self.clock += dt
+        self.elapsed += dt
+        running = self.running
+        state = self.state
+        self.state_timer += dt
+        self.charge_check_timer += dt * 1000
+        speed_multiplier = STATE_MULTIPLIERS[state]
+        # Every transition is decided from the state at the start of the tick, like Racer.step
+        ready = np.flatnonzero(running & (state == READY_STATE))
+        check = np.flatnonzero(running & (state == NORMAL_STATE) & (self.charge_check_timer >= self.charge_check_interval))
+        tired = np.flatnonzero(running & (state == CHARGING_STATE) & (self.state_timer >= self.endurance))
+        rested = np.flatnonzero(running & (state == RECOVERING_STATE) & (self.state_timer >= self.vigor))
+        state_changes = []
+        state[ready] = CHARGING_STATE
+        state_changes.extend((self.racers[lane], 'CHARGING') for lane in ready.tolist())
+        if check.size:
+            self.charge_check_timer[check] = 0
+            for lane in check.tolist():
+                racer = self.racers[lane]
+                if racer.rng.random() < racer.spirit:
+                    state[lane] = CHARGING_STATE
+                    self.state_timer[lane] = 0
+                    state_changes.append((racer, 'CHARGING'))
+        state[tired] = RECOVERING_STATE
+        self.state_timer[tired] = 0
+        state_changes.extend((self.racers[lane], 'RECOVERING') for lane in tired.tolist())
+        state[rested] = NORMAL_STATE
+        self.state_timer[rested] = 0
+        state_changes.extend((self.racers[lane], 'NORMAL') for lane in rested.tolist())
+
+        actual_speed_mps = self.cruise_speed_mps * speed_multiplier
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reach = (self.segment_end - self.distance) / actual_speed_mps
+        boundary = running & (reach <= dt)
+        moving = running & ~boundary
+        self.distance[moving] += actual_speed_mps[moving] * dt
+        finishers = []
+        for lane in np.flatnonzero(boundary).tolist():
+            if self.cross_boundaries(lane, dt, float(speed_multiplier[lane])):
+                finishers.append(self.racers[lane])
+        finishers.sort(key=lambda racer: racer.time)
+        self.finish_order.extend(finishers)
+        return state_changes, finishers
+
+    def cross_boundaries(self, lane, dt, speed_multiplier):
+        # The rest of Racer.step's movement for one pig that reaches the end of its segment
+        # this tick. Returns True if that was the line.
+        remaining = dt
+        distance = float(self.distance[lane])
+        segment = int(self.segment[lane])
+        while True:
+            actual_speed_mps = float(self.segment_speed_mps[lane, segment]) * speed_multiplier
+            reach = (SEGMENT_ENDS[segment] - distance) / actual_speed_mps
+            if reach > remaining:
+                distance += actual_speed_mps * remaining
+                break
+            distance = SEGMENT_ENDS[segment]
+            remaining -= reach
+            if segment == LAST_SEGMENT:
+                self.distance[lane] = distance
+                self.finish(lane, self.elapsed - remaining)
+                return True
+            segment += 1
+        self.distance[lane] = distance
+        self.segment[lane] = segment
+        self.cruise_speed_mps[lane] = self.segment_speed_mps[lane, segment]
+        self.segment_end[lane] = SEGMENT_ENDS[segment]
+        return False
+
+    def finish(self, lane, time):
+        self.running[lane] = False
+        self.finish_times[lane] = time
+        racer = self.racers[lane]
+        racer.running = False
+        racer.time = time
+        racer.elapsed = self.elapsed
+        racer.distance_covered = float(self.distance[lane])
+        racer.segment = LAST_SEGMENT
+        racer.state = STATE_NAMES[self.state[lane]]
+        racer.state_timer = float(self.state_timer[lane])
+        racer.charge_check_timer = float(self.charge_check_timer[lane])
+
+    def save_state(self):
+        if self.standings is None:
+            return super().save_state()
+        return RaceState(self.clock, tuple(self.distance.tolist()), tuple(self.segment.tolist()),
+                         tuple(map(STATE_NAMES.__getitem__, self.state.tolist())), tuple(self.state_timer.tolist()),
+                         tuple(self.charge_check_timer.tolist()), tuple(self.finish_times))
+
+    def snapshot(self):
+        # The standings barely change from one snapshot to the next, so the last order is
+        # re-sorted as it stands: a stable sort of nearly sorted input is close to linear
+        if self.standings is None:
+            return super().snapshot()
+        standings = self.standings[self.running[self.standings]]
+        standings = standings[np.argsort(-self.distance[standings], kind='stable')]
+        self.standings = standings
+        finish_order = tuple(racer.lane for racer in self.finish_order)
+        return RaceFrame(self.clock,
+                         tuple(self.distance.tolist()),
+                         tuple(map(STATE_NAMES.__getitem__, self.state.tolist())),
+                         finish_order + tuple(standings.tolist()),
+                         finish_order,
+                         tuple(self.finish_times))
+
+
+def choose_impacts(conditions, num_races, rng):
+    # Vectorized race_engine.weighted_choice, returning the condition multipliers
+    weights = np.asarray(generate_weights(len(conditions)))
+    return rng.choice(np.asarray(list(conditions.values())), size=num_races, p=weights / weights.sum())
+
+
+def simulate_races(num_races, num_pigs, rng=None, dt=TICK_SECONDS):
+    # Race num_races independent random fields and return the finished BatchRace
+    batch = BatchRace.random_fields(num_races, num_pigs, rng=rng)
+    batch.run(dt)
+    return batch
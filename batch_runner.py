@@ -0,0 +1,151 @@
+from batch_engine import FieldRace
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from constants import WEATHER_CONDITIONS, TRACK_CONDITIONS, LARGE_FIELD_SIZE
+from odds_engine import STATS, OddsEstimate, field_stats, simulate_placings
+from race_engine import Race, new_seed
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Headless batch runs from the command line, for calibration jobs on machines without a
+# display. Nothing here imports PyQt5. Races are handed out to the workers in chunks and
+# written out in order as each chunk comes back, with only a few chunks in flight at a
+# time, so a run of any length uses the same memory.
+#
+#   python batch_runner.py --races 100000 --workers 8 --pigs 8 --seed 1 --format csv -o runs.csv
+#
+# Race i of a run with --seed S has seed S + i, which main.py --seed replays.
+
+CHUNK_SIZE = 50  # Races per work item
+CHUNKS_PER_WORKER = 2  # Chunks kept in flight per worker
+ODDS_SAMPLES = 1000  # Simulated races per field when pricing each race, 0 for none
+CSV_COLUMNS = ('seed', 'weather', 'track', 'pigs', 'winner', 'winning_time', 'finish_order', 'finish_times', 'names', 'odds', 'p_win', 'p_place', 'p_show') + STATS
+
+
+def run_race(seed, num_pigs=None, weather_condition=None, track_condition=None, odds_samples=ODDS_SAMPLES):
+    # One race, priced beforehand the way the window prices it, as a plain record. Lists
+    # other than finish_order are in lane order.
+    race_class = FieldRace if num_pigs is not None and num_pigs > LARGE_FIELD_SIZE else Race
+    race = race_class.from_seed(seed, num_pigs, weather_condition, track_condition)
+    record = {'seed': seed, 'weather': race.weather_condition[0], 'track': race.track_condition[0], 'pigs': len(race.racers)}
+    if odds_samples:
+        started = time.perf_counter()
+        counts = simulate_placings(field_stats(race.racers), race.weather_condition[1], race.track_condition[1], odds_samples, seed)
+        estimate = OddsEstimate(counts, odds_samples, time.perf_counter() - started, seed)
+        record.update(odds=estimate.odds(), p_win=estimate.p_win, p_place=estimate.p_place, p_show=estimate.p_show)
+    race.run()
+    record['finish_order'] = [racer.lane for racer in race.finish_order]
+    record['finish_times'] = [racer.time for racer in race.racers]
+    record['names'] = [racer.name for racer in race.racers]
+    record.update(field_stats(race.racers))
+    return record
+
+
+def run_chunk(seeds, num_pigs, weather_condition, track_condition, odds_samples):
+    # Worker entry point
+    return [run_race(seed, num_pigs, weather_condition, track_condition, odds_samples) for seed in seeds]
+
+
+def chunked_seeds(first_seed, races, chunk_size=CHUNK_SIZE):
+    for start in range(0, races, chunk_size):
+        yield [first_seed + i for i in range(start, min(start + chunk_size, races))]
+
+
+def run_batch(races, first_seed=None, num_pigs=None, weather_condition=None, track_condition=None, odds_samples=ODDS_SAMPLES, workers=1):
+    # Yields one record per race, in seed order, as they are finished
+    first_seed = first_seed if first_seed is not None else new_seed()
+    chunks = chunked_seeds(first_seed, races)
+    options = (num_pigs, weather_condition, track_condition, odds_samples)
+    if workers <= 1:
+        for seeds in chunks:
+            yield from run_chunk(seeds, *options)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+        for seeds in chunks:
+            pending.append(executor.submit(run_chunk, seeds, *options))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class JsonlWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, record):
+        self.out.write(json.dumps(record) + '\n')
+
+
+class CsvWriter:
+    # One row per race; the per-pig lists are joined with '|'
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, CSV_COLUMNS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, record):
+        row = dict(record)
+        if record['finish_order']:
+            winner = record['finish_order'][0]
+            row['winner'] = record['names'][winner]
+            row['winning_time'] = record['finish_times'][winner]
+        for column in CSV_COLUMNS:
+            if isinstance(row.get(column), list):
+                row[column] = '|'.join(str(value) for value in row[column])
+        self.writer.writerow(row)
+
+
+WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter}
+
+
+def condition(conditions, name):
+    if name is None:
+        return None
+    if name not in conditions:
+        raise argparse.ArgumentTypeError(f"unknown condition {name!r}, expected one of: {', '.join(conditions)}")
+    return (name, conditions[name])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run races headless and write one result record per race.")
+    parser.add_argument('-n', '--races', type=int, default=1000, help="number of races to run")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="worker processes (1 runs in this process)")
+    parser.add_argument('--pigs', type=int, default=None, help="pigs per race (default: a random field per race)")
+    parser.add_argument('--weather', type=lambda name: condition(WEATHER_CONDITIONS, name), default=None, help="fix the weather for every race")
+    parser.add_argument('--track', type=lambda name: condition(TRACK_CONDITIONS, name), default=None, help="fix the track condition for every race")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the first race; race i gets seed + i")
+    parser.add_argument('--odds-samples', type=int, default=ODDS_SAMPLES, help="simulated races to price each field with, 0 to skip the odds")
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS), default='jsonl')
+    parser.add_argument('-o', '--output', default='-', help="file to write to (default: stdout)")
+    args = parser.parse_args(argv)
+    for option, value, least in (('--races', args.races, 1), ('--workers', args.workers, 1), ('--pigs', args.pigs, 1), ('--odds-samples', args.odds_samples, 0)):
+        if value is not None and value < least:
+            parser.error(f"{option} must be at least {least}, not {value}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    first_seed = args.seed if args.seed is not None else new_seed()
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    started = time.perf_counter()
+    try:
+        writer = WRITERS[args.format](out)
+        for count, record in enumerate(run_batch(args.races, first_seed, args.pigs, args.weather, args.track, args.odds_samples, args.workers), 1):
+            writer.write(record)
+            if count % CHUNK_SIZE == 0:
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Ran {args.races} races from seed {first_seed} in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+from analytic_odds import analytic_probabilities
+from batch_engine import FieldRace
+from constants import ODDS_SAMPLES, ODDS_TIME_BUDGET, LARGE_FIELD_SIZE
+from odds_engine import estimate_probabilities, get_executor, shutdown_executor
+from race_engine import Race
+from race_recording import RaceTape
+from settlement import BET_TYPES, settle_many
+import argparse
+import json
+import numpy as np
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Benchmarks for the hot paths: the engine's tick, whole races at three field sizes, pricing
+# a field, settling bets and drawing a frame in the window. Every fixture is built from a
+# fixed seed, so runs on the same machine measure the same work. The window benchmarks run
+# on Qt's offscreen platform unless QT_QPA_PLATFORM says otherwise.
+#
+#   python benchmarks.py --save benchmark_baseline.json
+#   python benchmarks.py --compare benchmark_baseline.json --threshold 0.2
+#
+# Each benchmark reports the best time per operation over its repeats, which is the least
+# noisy figure on a shared machine. A comparison flags anything that got slower than the
+# baseline by more than the threshold and exits with status 1 if anything did.
+
+BENCH_SEED = 1234  # Seed every fixture is built from
+REGRESSION_THRESHOLD = 0.2  # Slowdown, as a share of the baseline, that counts as a regression
+REPEAT = 5
+UNLIMITED_BUDGET = 3600  # seconds; an odds time budget no benchmark run gets near
+
+
+# Each benchmark builds its fixture and returns (run, operations per run, unit): run() does
+# the timed work, and times are reported per operation.
+
+def engine_tick():
+    # One tick of race_engine.Race.step, every pig's Racer.step, for a ten-pig field
+    race = Race.from_seed(BENCH_SEED, num_pigs=10)
+    ticks = len(RaceTape.from_race(race).frame_list) - 1
+
+    def run():
+        race.run()
+    return run, ticks, "tick"
+
+
+def race_run(num_pigs):
+    # A whole race, on the engine the window uses for that field size
+    race_class = FieldRace if num_pigs > LARGE_FIELD_SIZE else Race
+
+    def benchmark():
+        race = race_class.from_seed(BENCH_SEED, num_pigs=num_pigs)
+        return race.run, 1, "race"
+    return benchmark
+
+
+def odds_analytic():
+    # The closed-form odds the window shows the moment a field appears
+    race = Race.from_seed(BENCH_SEED, num_pigs=10)
+
+    def run():
+        analytic_probabilities(race.racers, race.weather_condition, race.track_condition)
+    return run, 1, "field"
+
+
+def odds_simulated():
+    # The Monte Carlo odds at the window's sample count, with the time budget out of the way
+    # so every run does the same work. The process pool is started beforehand. The window
+    # stops at ODDS_TIME_BUDGET with whatever samples are in, so a time over the budget
+    # means its odds rest on fewer races than ODDS_SAMPLES on this machine.
+    race = Race.from_seed(BENCH_SEED, num_pigs=10)
+    get_executor().submit(int).result()
+
+    def run():
+        estimate_probabilities(race.racers, race.weather_condition, race.track_condition, samples=ODDS_SAMPLES, time_budget=UNLIMITED_BUDGET, seed=BENCH_SEED)
+    return run, 1, "field"
+
+
+def settle_window():
+    # RaceTrackWidget.handle_pig_finished for every pig of a field, with a Win bet on the winner
+    window = main_window(10)
+    track = window.race_track_widget
+    race = Race.from_seed(BENCH_SEED, num_pigs=10)
+    tape = RaceTape.from_race(race)
+    window.race_controller.frame = tape.frame_list[-1]
+    finishers = [(window.race_controller.pigs[lane].name, tape.frame_list[-1].finish_times[lane]) for lane in tape.frame_list[-1].finish_order]
+    track.selected_pig_widget = window.race_controller.pigs[tape.frame_list[-1].finish_order[0]]
+    track.bet_type = "Win"
+    track.bet_amount = 10
+
+    def run():
+        track.finished_place = 1
+        for name, finish_time in finishers:
+            track.handle_pig_finished(name, finish_time)
+    return run, len(finishers), "pig"
+
+
+def settle_vectorized():
+    # settlement.settle_many over a million bets, as the backtester settles them
+    rng = np.random.default_rng(BENCH_SEED)
+    bets = 1_000_000
+    bet_types = rng.integers(0, len(BET_TYPES), bets)
+    amounts = rng.choice([5.0, 10.0, 25.0], bets)
+    odds = rng.uniform(1.1, 3.0, bets)
+    places = rng.integers(1, 11, bets)
+
+    def run():
+        settle_many(bet_types, amounts, odds, places)
+    return run, bets, "bet"
+
+
+def frame_time(num_pigs):
+    # Applying one RaceFrame in the window and painting it: the lanes for a normal field, the
+    # standings table for a large one. Every frame of the race is applied in turn.
+    def benchmark():
+        app = qt_app()
+        window = main_window(num_pigs)
+        track = window.race_track_widget
+        race_class = FieldRace if num_pigs > LARGE_FIELD_SIZE else Race
+        frames = RaceTape.from_race(race_class.from_seed(BENCH_SEED, num_pigs=num_pigs)).frame_list
+        view = track.standings_view.viewport() if num_pigs > LARGE_FIELD_SIZE else track.track_view
+        app.processEvents()
+
+        def run():
+            for frame in frames:
+                track.apply_frame(frame)
+                view.repaint()
+        return run, len(frames), "frame"
+    return benchmark
+
+
+# Benchmarks whose operation has a time budget in the game, flagged when they go over it
+BUDGETS = {'odds_simulated': ODDS_TIME_BUDGET}
+
+BENCHMARKS = {
+    'engine_tick': engine_tick,
+    'race_run_10': race_run(10),
+    'race_run_100': race_run(100),
+    'race_run_1000': race_run(1000),
+    'odds_analytic': odds_analytic,
+    'odds_simulated': odds_simulated,
+    'settle_window': settle_window,
+    'settle_vectorized': settle_vectorized,
+    'frame_track_10': frame_time(10),
+    'frame_standings_1000': frame_time(1000),
+}
+
+_app = None
+_windows = []
+
+
+def qt_app():
+    global _app
+    if _app is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        _app = QApplication.instance() or QApplication(sys.argv[:1])
+    return _app
+
+
+def main_window(num_pigs):
+    # A shown window on the benchmark seed. Kept until the end, as closing one mid-run would
+    # shut down the odds process pool.
+    qt_app()
+    from main_window import MainWindow
+    window = MainWindow(BENCH_SEED, num_pigs=num_pigs)
+    window.resize(900, 600)
+    window.show()
+    _windows.append(window)
+    return window
+
+
+def measure(benchmark, repeat=REPEAT):
+    run, operations, unit = benchmark()
+    run()  # Warm up
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return {'seconds': min(times) / operations, 'median': statistics.median(times) / operations, 'unit': unit, 'operations': operations, 'repeat': repeat}
+
+
+def environment():
+    import PyQt5.QtCore
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'qt': PyQt5.QtCore.QT_VERSION_STR,
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'cpus': os.cpu_count(),
+        'seed': BENCH_SEED,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def format_seconds(seconds):
+    for scale, suffix in ((1, 's'), (1e-3, 'ms'), (1e-6, 'us')):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f}{suffix}"
+    return f"{seconds / 1e-9:.1f}ns"
+
+
+def budget_note(name, result):
+    budget = BUDGETS.get(name)
+    if budget is None or result['seconds'] <= budget:
+        return ""
+    return f"  OVER BUDGET ({format_seconds(budget)})"
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Returns the names of the benchmarks that regressed
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<22} {format_seconds(result['seconds']):>12}/{result['unit']:<6} (not in baseline){budget_note(name, result)}")
+            continue
+        change = result['seconds'] / before['seconds'] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<22} {format_seconds(result['seconds']):>12}/{result['unit']:<6} baseline {format_seconds(before['seconds']):>12} {change:+8.1%}{flag}{budget_note(name, result)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the engine, odds, settlement and the window's frame time.")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run (default all): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--save', help="write the results to this JSON file as a baseline")
+    parser.add_argument('--compare', help="compare against a baseline saved with --save")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="slowdown that counts as a regression, e.g. 0.2 for 20%%")
+    args = parser.parse_args(argv)
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = {}
+    try:
+        for name in names:
+            results[name] = measure(BENCHMARKS[name], args.repeat)
+            if not args.compare:
+                result = results[name]
+                print(f"{name:<22} {format_seconds(result['seconds']):>12}/{result['unit']:<6} median {format_seconds(result['median'])}{budget_note(name, result)}")
+    finally:
+        for window in _windows:
+            window.close()
+        shutdown_executor()
+    regressions = []
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline['results'], args.threshold)
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}" + (f": {', '.join(regressions)}" if regressions else ""))
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({'environment': environment(), 'results': results}, baseline_file, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
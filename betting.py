@@ -1,6 +1,7 @@
-from constants import DEFAULT_BET_SIZE, PLAYER_START_BANK, WIN_MULT, PLACE_MULT
-from PyQt5.QtWidgets import QComboBox, QWidget, QVBoxLayout, QFrame, QLabel, QHBoxLayout, QApplication
-from PyQt5.QtCore import QThread, pyqtSignal, QObject, QTimer, Qt
+from constants import DEFAULT_BET_SIZE, PLAYER_START_BANK, BET_MULTIPLIERS, BET_AMOUNTS, FORM_RUNS
+from PyQt5.QtWidgets import QComboBox, QWidget, QVBoxLayout, QFrame, QLabel, QHBoxLayout
+from PyQt5.QtCore import pyqtSignal, Qt
+from settlement import EXOTIC_LEGS, EXOTIC_TYPES
 
 class BettingWidget(QWidget):
     pig_selected = pyqtSignal()
@@ -14,7 +15,8 @@ class BettingWidget(QWidget):
         self.racer_details_label = QLabel(self)
         self.racer_details_label.setTextFormat(Qt.RichText)
         self.racer_details_label.setWordWrap(True)
-        self.racer_details_label.setMaximumHeight(100)
+        self.racer_details_label.setMaximumHeight(130)
+        self.form_db = None  # form_db.FormDatabase for the form lines, when there is one
         self.bet_amount = DEFAULT_BET_SIZE
         self.bet_type = "Win"
         self.init_ui()
@@ -36,7 +38,7 @@ class BettingWidget(QWidget):
             dropdown_layout.addWidget(self.bet_selection_label)
             # Dropdown menu for bet amount selection
             self.bet_amount_dropdown = QComboBox(self)
-            bet_amounts = [5, 10, 25, 50, 90]
+            bet_amounts = BET_AMOUNTS
             # make sure the bet is placeable
             for amount in bet_amounts:
                 if self.player_bank >= amount:
@@ -50,7 +52,7 @@ class BettingWidget(QWidget):
             dropdown_layout.addWidget(self.bet_amount_dropdown)
             # Dropdown menu for bet type selection
             self.bet_type_dropdown = QComboBox(self)
-            self.bet_type_dropdown.addItems(['Win', 'Place', 'Show'])  # Adding bet types
+            self.bet_type_dropdown.addItems(['Win', 'Place', 'Show'] + list(EXOTIC_TYPES))  # Adding bet types
             self.bet_type_dropdown.currentIndexChanged.connect(self.bet_type_changed)  # Connect signal to slot
             dropdown_layout.addWidget(self.bet_type_dropdown)
             # Add the horizontal layout to the main vertical layout
@@ -59,27 +61,79 @@ class BettingWidget(QWidget):
             self.setLayout(layout)
 
     def update_bet_amount_options(self, bank):
-        bet_amounts = ['5', '10', '25', '50', '90']
+        bet_amounts = [str(amount) for amount in BET_AMOUNTS]
+        # Stakes come back as the bank recovers
         for amount in bet_amounts:
-            if int(amount) > bank:
-                index = self.bet_amount_dropdown.findText(amount)
-                if index >= 0:
-                    self.bet_amount_dropdown.model().item(index).setEnabled(False)
+            index = self.bet_amount_dropdown.findText(amount)
+            if index >= 0:
+                self.bet_amount_dropdown.model().item(index).setEnabled(int(amount) <= bank)
+        # A stake the bank no longer covers gives way to the largest one it does
+        if int(self.bet_amount_dropdown.currentText()) > bank:
+            affordable = [amount for amount in bet_amounts if int(amount) <= bank and self.bet_amount_dropdown.findText(amount) >= 0]
+            if affordable:
+                self.bet_amount_dropdown.setCurrentIndex(self.bet_amount_dropdown.findText(affordable[-1]))
     
 
-    def show_racer_details(self, pig):
+    def show_racer_details(self, pig, track_condition=None):
+        chances_html = ""
+        if pig.win_probability is not None:
+            chances_html = f"<p><b>Simulated chances:</b> Win {pig.win_probability*100:.1f}%, Top Two {pig.place_probability*100:.1f}%, Top Three {pig.show_probability*100:.1f}%</p>"
+        if pig.bet_odds:
+            # Each bet type is priced from the chance of its own place
+            chances_html += "<p><b>Odds:</b> " + ", ".join(f"{bet_type} {odds:.2f}" for bet_type, odds in pig.bet_odds.items()) + "</p>"
+        if self.form_db is not None:
+            chances_html += self.form_html(pig, track_condition)
         details_html = f"""
         <html>
             <body>
                 <h2>{pig.name}</h2>
                 <p><b>Stats:</b> Top Speed: {pig.display_speed:.1f}, Agility: {pig.agility:.1f}, Endurance: {pig.endurance:.1f}, Vigor: {pig.vigor:.1f}, Spirit: {pig.spirit*100:.1f}, Energy: {pig.energy:.1f}, TPL: {pig.performance_level*100:.1f}%, Odds {pig.odds:.1f}</p>
-                <p>Payout Multipliers for <b>Win</b> are <b>{WIN_MULT}</b>, <b>Place</b> are <b>{PLACE_MULT}</b>, and <b>Show</b> are the odds as listed.</p>
+                {chances_html}
+                <p>Payout Multipliers for <b>Win</b> are <b>{BET_MULTIPLIERS['Win']}</b>, <b>Place</b> are <b>{BET_MULTIPLIERS['Place']}</b>, and <b>Show</b> are <b>{BET_MULTIPLIERS['Show']}</b>, times the odds for that bet.</p>
             </body>
         </html>
         """
         self.racer_details_label.setText(details_html)
         self.pig_selected.emit()
 
+    def form_html(self, pig, track_condition=None):
+        # Latest run last, as form figures are read
+        runs = self.form_db.recent_runs(pig.name, FORM_RUNS)
+        if not runs:
+            return "<p><b>Form:</b> first time out</p>"
+        figures = "-".join(f"{place}/{field_size}" for place, field_size, *_ in reversed(runs))
+        form_html = f"<p><b>Form</b> (last {len(runs)}): {figures}"
+        if track_condition is not None:
+            starts, wins, average_place, best_time = self.form_db.condition_record(pig.name, track=track_condition[0])
+            if starts:
+                form_html += f"; on {track_condition[0]}: {starts} runs, {wins} wins, average place {average_place:.1f}, best {best_time:.2f}s"
+            else:
+                form_html += f"; never run on {track_condition[0]}"
+        return form_html + "</p>"
+
+    def show_ticket(self, bet_type, pigs, odds=None):
+        # An exotic ticket is built one pig at a time, in finishing order; the bet can go
+        # down once every leg is filled in
+        legs = EXOTIC_LEGS[bet_type]
+        names = ", ".join(f"{i + 1}. {pig.name}" for i, pig in enumerate(pigs))
+        if len(pigs) < legs:
+            order = "in any order" if bet_type == "Quinella" else "in finishing order"
+            status = f"Pick {legs - len(pigs)} more, {order}."
+        else:
+            status = f"Odds {odds:.2f}" if odds is not None else "Odds to come"
+        details_html = f"""
+        <html>
+            <body>
+                <h2>{bet_type} ticket</h2>
+                <p>{names}</p>
+                <p>{status}</p>
+            </body>
+        </html>
+        """
+        self.racer_details_label.setText(details_html)
+        if len(pigs) == legs:
+            self.pig_selected.emit()
+
     def clear_racer_details(self):
         self.racer_details_label.clear()
 
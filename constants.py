@@ -1,7 +1,12 @@
 PLAYER_START_BANK = 100 # dollars
 BET_MULTIPLIERS = {"Win": 5, "Place": 3, "Show": 1}
 DEFAULT_BET_SIZE = 10 # dollars
+BET_AMOUNTS = (5, 10, 25, 50, 90)  # dollars, the stakes on offer
 RACE_DISTANCE = 2000  # meters
+FIELD_SIZE_MIN = 5  # a random field has between FIELD_SIZE_MIN and FIELD_SIZE_MAX pigs
+FIELD_SIZE_MAX = 10
+FIELD_SIZE = None  # pigs per race in the window, None for a random field; main.py --pigs N overrides it
+LARGE_FIELD_SIZE = 40  # bigger fields are shown as a standings table and simulated as they play
 SPEED_MIN = 200  # km/h
 SPEED_MAX = 220  # km/h
 AGILITY_MIN = 85
@@ -9,6 +14,7 @@ AGILITY_MAX = 100
 CHARGING_MIN = 0.03
 CHARGING_MAX = 0.15
 TIME_COMPRESSION = 10  # Real-time compression factor
+PLAYBACK_RATES = (1, 4, TIME_COMPRESSION)  # Speeds a race can be watched at, fastest runs TIME_COMPRESSION times real time
 STRAIGHTAWAY_LENGTH = 750
 TURN_LENGTH = 250
 TOTAL_TRACK_LENGTH = 2 * (STRAIGHTAWAY_LENGTH + TURN_LENGTH)
@@ -18,14 +24,27 @@ RECOVERING = 0.75
 SPEED_FACTOR = 1
 ENDURANCE_FACTOR = 1
 AGILITY_FACTOR = 1
+TURN_PENALTY = 2  # Times the straight's condition penalty a pig pays in the turns; above 7/3 the slowest pigs hit the 0.3 floor
 END_MIN = 4
 END_MAX = 7
 VIG_MIN = 5
 VIG_MAX = 8
 ENERGY_MIN = 5
 ENERGY_MAX = 10
-ODDS_MIN = 1.1
 ODDS_MAX = 3
+EXOTIC_ODDS_MAX = 500  # Exacta, Quinella and Trifecta odds are capped here
+HOUSE_MARGIN = 0.15  # Share of the expected Win payout the book keeps
+PARIMUTUEL = False  # Bet into Win/Place/Show pools shared with a crowd instead of at fixed odds; main.py --parimutuel turns it on
+POOL_TAKEOUT = 0.15  # Share of every pool the house keeps
+CROWD_WAGERS = 100000  # Simulated crowd wagers per race in parimutuel mode
+CROWD_BATCH = 5000  # Crowd wagers added to the pools at a time, every CROWD_INTERVAL ms
+CROWD_INTERVAL = 100
+ODDS_SAMPLES = 20000  # Simulated races per field when pricing odds
+ODDS_TIME_BUDGET = 1.5  # seconds, so the odds are in before the bet goes down
+LIVE_ODDS_INTERVAL = 0.1  # seconds between in-running odds updates while a race plays
+LIVE_ODDS_SAMPLES = 2000  # Most races simulated from the current state for one update
+LIVE_ODDS_BUDGET = 0.05  # seconds of simulation per update, so updates keep up with LIVE_ODDS_INTERVAL
+THREAD_STOP_TIMEOUT = 5  # seconds to wait on a worker thread to stop before giving up on it
 SPEED_WEIGHT = 0.05
 AGILITY_WEIGHT = 0.2
 VIGOR_WEIGHT = 0.15
@@ -52,255 +71,10 @@ TRACK_CONDITIONS = {
     "deep snow": 0.8,
     "frozen hard": 0.74,
 }
-PIG_NAMES = [
-    "Hamlet",
-    "Porkchop",
-    "Baconator",
-    "Snout Runner",
-    "Truffle Shuffle",
-    "BakingBits",
-    "Superham",
-    "Sir Oinksalot",
-    "Wilbur Force",
-    "Babe Ruth",
-    "Pigasso",
-    "Swinestein",
-    "Hogwarts",
-    "Piggy Smalls",
-    "Notorious P.I.G.",
-    "Hogzilla",
-    "Snoop Hoggy Hog",
-    "Porky Pint",
-    "Chris P. Bacon",
-    "Ham Solo",
-    "Pigcasso",
-    "Hog Hefner",
-    "Frankenswine",
-    "Curly Tail",
-    "Pigtails",
-    "Pigmalion",
-    "Sausage Roller",
-    "Hambone",
-    "Miss Piggy Bank",
-    "Pork Grind",
-    "Pig Pen",
-    "Rasher",
-    "Swine Flew",
-    "Swinona Ryder",
-    "Chewbacon",
-    "Hoggy Potter",
-    "Scarlett O'Hambra",
-    "Swinona Judd",
-    "Jimmy Dean",
-    "Pig Newton",
-    "Boar-dom Buster",
-    "Grunter Pan",
-    "Hamwise Gamgee",
-    "Porkahontas",
-    "Chorizo Crusader",
-    "Boar-becue",
-    "Pigfoot",
-    "Swine Gogh",
-    "Mudonna",
-    "Porkloin Piper",
-    "Albert Einswine",
-    "Hamibal Lecter",
-    "Abra-ham Lincoln",
-    "Bratwurst Bopper",
-    "Hamela Anderson",
-    "Harry Trotter",
-    "Piggy Azalea",
-    "Jon Ham",
-    "Leonardo DiCapybara",
-    "Marie Hamtoinette",
-    "Pork Twain",
-    "J.R.R. Tolkhogn",
-    "Spamela Hamderson",
-    "Hamlet's Ghost",
-    "Napigleon Bonapork",
-    "Trojan Horsetail",
-    "Ribs Downey Jr.",
-    "Amelia Swinehart",
-    "Oinkstein",
-    "Britney Spareribs",
-    "Pignelope Cruz",
-    "F. Scott Fitzboar",
-    "Hammy Sosa",
-    "Virginia Woof",
-    "Swinburne",
-    "Elvis Pigsley",
-    "Hogney Dangerfield",
-    "Porkahammas",
-    "Hogarth Hughes",
-    "Piggyback Rider",
-    "Kevin Bacon",
-    "Snortin' Norton",
-    "Jennifer Lopigs",
-    "Trotter White",
-    "Winnie the Poohrk",
-    "Jane Porker",
-    "Snoutcast",
-    "Hamela Hamford",
-    "Sly Stallpork",
-    "Porcasso",
-    "Stephen Squealing",
-    "Ruth Bacon Ginsboar",
-    "Neil Porkstrong",
-    "Oscar Mayer Wiener",
-    "Anne of Green Gobbles",
-    "Snouto Domoinko",
-    "Swine Dion",
-    "Porcules",
-    "Quentin Tarantinoise",
-    "Meryl Squeal",
-    "Bacon Bitsy",
-    "Swinestein",
-    "Piggly Wiggly",
-    "Oinkers Ahoy",
-    "Snout Spout",
-    "Hambone Flash",
-    "Curly Tailor",
-    "Trotter Trot",
-    "Sir Oinksalot",
-    "Hoggy Potter",
-    "Mudpie Maverick",
-    "Snortimus Prime",
-    "Snortimus Maximus",
-    "Sow Belly",
-    "Pork Chopin",
-    "Hogwarts Express",
-    "Brisket Bouncer",
-    "Chop Suey",
-    "Sparerib Spike",
-    "Snouter Space",
-    "Pigasso",
-    "Hammibal Lecter",
-    "Porcinetor",
-    "Boar Bunyan",
-    "Sowpreme Court",
-    "Riblet Racer",
-    "Swine Song",
-    "Pigtail Pilot",
-    "Pigadilly Circus",
-    "Chorizo Cruiser",
-    "Porkchop Panache",
-    "Hogwash",
-    "Swine Diner",
-    "Babe Ruth",
-    "Porkerface",
-    "Boar’d Game",
-    "Pigathlon",
-    "Sow-A-Long",
-    "Baconeer",
-    "Swiney Todd",
-    "Porky Pygmalion",
-    "Ham Solo",
-    "Crackling Crusader",
-    "Boaracle",
-    "Porkadot",
-    "Snoutcast",
-    "Hamurai",
-    "Pigwig",
-    "Razorback Racer",
-    "Piglet Poet",
-    "SwineCraft",
-    "PorknitePlayer",
-    "BaconBitsBoss",
-    "PigAxelFoley",
-    "HamletHero",
-    "SwineOfDuty",
-    "PorcinePeaker",
-    "SnoutSniper",
-    "BoarBattler",
-    "RindRacer",
-    "HogOfWar",
-    "SowSprinter",
-    "TrotterTactician",
-    "PigPenPwner",
-    "StyStalker",
-    "MudMaruder",
-    "BoarBuster",
-    "OinkerOperator",
-    "SnoutScout",
-    "RasherReaper",
-    "GruntGamer",
-    "BaconBrawler",
-    "HamHockHacker",
-    "SowSlayer",
-    "RindRipper",
-    "PigtailPwner",
-    "SnortSniper",
-    "BaconBandit",
-    "SwineSoldier",
-    "HambushHunter",
-    "PorcinePirate",
-    "BoarBehemoth",
-    "SlopSergeant",
-    "SwillSniper",
-    "SquealSquad",
-    "PorkPatroller",
-    "HogHarrier",
-    "BoarBlazer",
-    "SwineStriker",
-    "RasherRanger",
-    "PignitionPilot",
-    "HogHavoc",
-    "PorcinePlatoon",
-    "BoarBomber",
-    "SnoutSaber",
-    "RibletRogue",
-    "SausageSpartan",
-    "HogzillaHero",
-    "Hamonizer",
-    "TrotterTrooper",
-    "PiggyPaddler",
-    "CurlyTailCrusher",
-    "Swinestein",
-    "BaconBlast",
-    "HogHearth",
-    "RindRanger",
-    "BoarBoss",
-    "PiggyPwnage",
-    "PorkerPlayer",
-    "SnouterStriker",
-    "BaconBro",
-    "SowSaber",
-    "PigskinPro",
-    "RasherRider",
-    "PorkChopChamp",
-    "HogHurdler",
-    "SwinerStalker",
-    "HamHurdler",
-    "SnoutSkirmisher",
-    "SowSorcerer",
-    "BoarBaron",
-    "RindRebel",
-    "PigletPugilist",
-    "BaconBerserker",
-    "SwineSorcerer",
-    "HamHammer",
-    "PorkyPaladin",
-    "BoarBruiser",
-    "SnoutSummoner",
-    "RasherRogue",
-    "TuskTactician",
-    "PigstickPilot",
-    "PorkyPirate",
-    "HogHoncho",
-    "BoarBuccaneer",
-    "PigtailPlunderer",
-    "SnortSnatcher",
-    "BaconBuccaneer",
-    "Swinosaur",
-    "PorkPlatoon",
-    "TrotterTracker",
-    "RasherRaider",
-    "BoarBandit",
-    "SnoutStorm",
-    "PigletParagon",
-    "SowSpartan",
-    "PorkyKnight",
-    "RindRaider",
-    "TuskTemplar",
-    "BoarBattalion"
-]
+
+RECORDING_DIR = None  # set to a directory to record every race played in the window
+FORM_DB = None  # set to a file to keep a roster and the form of every race played in the window; main.py --form-db PATH overrides it
+FORM_RUNS = 6  # Recent runs shown in a pig's form
+INSTRUMENTATION = False  # gather tick, signal and frame timings; main.py --instrument turns it on
+TRACE_EVENTS = 200000  # Trace events kept for a Chrome trace export, the latest ones
+LOG_LEVEL = "INFO"  # main.py --log-level overrides it
\ No newline at end of file
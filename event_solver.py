@@ -0,0 +1,110 @@
+from constants import TOTAL_TRACK_LENGTH, NORMAL, CHARGING, RECOVERING
+from race_engine import TICK_SECONDS
+import heapq
+import math
+from track import SEGMENT_ENDS
+
+# Event-driven race solver. Between state transitions and segment boundaries a pig's speed
+# is constant (its speed on the segment * state multiplier), so instead of stepping every
+# tick the solver only visits the moments something changes - a charge check coming due,
+# CHARGING running out after endurance, RECOVERING ending after vigor, the end of a track
+# segment, or the finish line - and moves the pig in closed form in between. Transitions
+# land on the same tick boundaries Racer.step would put them on and every pig rolls its
+# charge checks from its own seeded stream, so a seeded race finishes exactly as it does
+# when ticked, in tens of events instead of hundreds of ticks per pig.
+
+SPEED_MULTIPLIERS = {'CHARGING': CHARGING, 'NORMAL': NORMAL, 'RECOVERING': RECOVERING}
+
+
+def ticks_for(seconds, dt):
+    # First tick at which a timer started at zero has reached the given duration
+    return max(1, math.ceil(seconds / dt - 1e-9))
+
+
+class EventSolver:
+    def __init__(self, race, dt=TICK_SECONDS):
+        self.race = race
+        self.dt = dt
+        self.events = 0  # Events processed, for comparing against ticks stepped
+
+    def run(self):
+        race = self.race
+        race.start()
+        dt = self.dt
+        queue = []
+        # Per lane: time the current run started at, distance at that time, state multiplier,
+        # the tick the charge check timer was last reset on, and the transition due next
+        # (tick and kind), which a segment boundary on the way doesn't change
+        plans = []
+        for racer in race.racers:
+            # Pigs leave the gate charging, with both timers counting from the start
+            racer.state = 'CHARGING'
+            plans.append([0.0, 0.0, CHARGING, 0, None, None])
+            self.schedule(queue, racer, plans[racer.lane], ticks_for(racer.endurance, dt), 'tired')
+        while queue:
+            time, tick, lane, kind = heapq.heappop(queue)
+            self.events += 1
+            racer = race.racers[lane]
+            plan = plans[lane]
+            if kind == 'finish':
+                racer.distance_covered = TOTAL_TRACK_LENGTH
+                racer.time = time
+                racer.running = False
+                race.finish_order.append(racer)
+                race.clock = max(race.clock, time)
+                continue
+            if kind == 'segment':
+                # Onto the next segment, mid-tick, at its speed; the pending transition stands
+                plan[0] = time
+                plan[1] = SEGMENT_ENDS[racer.segment]
+                racer.segment += 1
+                self.schedule(queue, racer, plan, plan[4], plan[5])
+                continue
+            # Bring the pig up to the event, then apply the transition
+            plan[1] += self.speed(racer, plan) * (time - plan[0])
+            plan[0] = time
+            if kind == 'check':
+                plan[3] = tick
+                if racer.rng.random() < racer.spirit:
+                    self.change_state(queue, racer, plan, 'CHARGING', tick + ticks_for(racer.endurance, dt), 'tired')
+                else:
+                    self.schedule(queue, racer, plan, tick + self.check_ticks(racer), 'check')
+            elif kind == 'tired':
+                self.change_state(queue, racer, plan, 'RECOVERING', tick + ticks_for(racer.vigor, dt), 'rested')
+            elif kind == 'rested':
+                # The first NORMAL tick is the one after this; it checks straight away if the
+                # charge check timer ran past its interval meanwhile
+                next_check = max(tick + 1, plan[3] + self.check_ticks(racer))
+                self.change_state(queue, racer, plan, 'NORMAL', next_check, 'check')
+        for racer in race.racers:
+            racer.elapsed = racer.time
+        return race.finish_order
+
+    def change_state(self, queue, racer, plan, state, next_tick, next_kind):
+        racer.state = state
+        plan[2] = SPEED_MULTIPLIERS[state]
+        self.schedule(queue, racer, plan, next_tick, next_kind)
+
+    def schedule(self, queue, racer, plan, next_tick, next_kind):
+        # Queue whichever comes first: the next transition, or the pig reaching the end of
+        # its segment (the line, on the last one) at its current speed
+        plan[4] = next_tick
+        plan[5] = next_kind
+        reach_time = plan[0] + (SEGMENT_ENDS[racer.segment] - plan[1]) / self.speed(racer, plan)
+        if reach_time <= next_tick * self.dt:
+            kind = 'finish' if racer.segment == len(SEGMENT_ENDS) - 1 else 'segment'
+            heapq.heappush(queue, (reach_time, next_tick, racer.lane, kind))
+        else:
+            heapq.heappush(queue, (next_tick * self.dt, next_tick, racer.lane, next_kind))
+
+    def check_ticks(self, racer):
+        # Ticks between charge checks: the check timer gains dt * 1000 ms per tick
+        return ticks_for(racer.charge_check_interval / 1000, self.dt)
+
+    def speed(self, racer, plan):
+        return racer.segment_speeds[racer.segment] * plan[2]
+
+
+def solve_race(race, dt=TICK_SECONDS):
+    # Run a race_engine.Race to the finish with the event solver and return the finish order
+    return EventSolver(race, dt).run()
@@ -0,0 +1,119 @@
+from constants import HOUSE_MARGIN, EXOTIC_ODDS_MAX
+from settlement import EXOTIC_LEGS
+import numpy as np
+
+# Pricing for the exotic bets, which are on the order of the first two or three home. There
+# are n(n-1)(n-2) possible trifectas, so orders are never kept as tuples: every ordered
+# pair or triple of lanes has a rank (its permutation index), simulated finishes are
+# counted by rank in an OrderHistogram, and exacta counts are read off the trifecta ranks
+# (a trifecta's rank divided by n - 2 is the rank of its first two). Combinations the
+# simulation never saw, and fields priced in closed form, fall back on Harville's ordering
+# probabilities from the Win chances.
+
+DENSE_ORDER_LIMIT = 1 << 20  # Index spaces up to this size are counted in a flat array
+
+
+def exacta_index(num_pigs, first, second):
+    # Rank of an ordered pair of different lanes, in [0, n(n-1)). Works on arrays too.
+    return first * (num_pigs - 1) + second - (second > first)
+
+
+def trifecta_index(num_pigs, first, second, third):
+    # Rank of an ordered triple of different lanes, in [0, n(n-1)(n-2)). Works on arrays too.
+    return exacta_index(num_pigs, first, second) * (num_pigs - 2) + third - (third > first) - (third > second)
+
+
+def quinella_index(num_pigs, first, second):
+    # A quinella doesn't care about the order, so it takes the rank of the pair in lane order
+    return exacta_index(num_pigs, np.minimum(first, second), np.maximum(first, second))
+
+
+def ticket_index(bet_type, num_pigs, lanes):
+    if bet_type == "Trifecta":
+        return trifecta_index(num_pigs, *lanes)
+    if bet_type == "Quinella":
+        return quinella_index(num_pigs, *lanes)
+    return exacta_index(num_pigs, *lanes)
+
+
+def finish_indices(order):
+    # Trifecta rank of the first three home in each race of a [races x pigs] finish order
+    return trifecta_index(order.shape[1], order[:, 0], order[:, 1], order[:, 2])
+
+
+class OrderHistogram:
+    # How often each permutation index came up. Small index spaces get one slot per index;
+    # big ones keep only the indices that came up, sorted, with their counts, so the cost
+    # follows the number of races simulated rather than the size of the field.
+    def __init__(self, space, indices):
+        if space <= DENSE_ORDER_LIMIT:
+            self.keys = None
+            self.counts = np.bincount(indices, minlength=space)
+        else:
+            self.keys, self.counts = np.unique(indices, return_counts=True)
+
+    def count(self, index):
+        if self.keys is None:
+            return int(self.counts[index])
+        position = np.searchsorted(self.keys, index)
+        return int(self.counts[position]) if position < len(self.keys) and self.keys[position] == index else 0
+
+
+def harville_probability(bet_type, lanes, p_win):
+    # Chance of the lanes coming home in that order when each next place goes to the pigs
+    # left in proportion to their Win chances
+    probability = 1.0
+    taken = 0.0
+    for lane in lanes:
+        probability *= p_win[lane] / max(1 - taken, 1e-12)
+        taken += p_win[lane]
+    if bet_type == "Quinella":
+        first, second = lanes
+        return probability + harville_probability("Exacta", (second, first), p_win)
+    return probability
+
+
+def exotic_odds(probability):
+    # Exotics pay the stake times the odds, priced fair less the house margin. Only the long
+    # shots are capped: a floor under the likeliest tickets would pay more than they are worth.
+    if probability <= 0:
+        return EXOTIC_ODDS_MAX
+    return min((1 - HOUSE_MARGIN) / probability, EXOTIC_ODDS_MAX)
+
+
+class ExoticPrices:
+    # Prices every exotic ticket on one field from the Win chances and, when the field was
+    # simulated, the trifecta ranks of the simulated races
+    def __init__(self, p_win, trifectas=None):
+        self.p_win = p_win
+        self.num_pigs = n = len(p_win)
+        self.samples = len(trifectas) if trifectas is not None and n >= 3 else 0
+        if self.samples:
+            self.trifectas = OrderHistogram(n * (n - 1) * (n - 2), trifectas)
+            self.exactas = OrderHistogram(n * (n - 1), trifectas // (n - 2))
+
+    def count(self, bet_type, lanes):
+        n = self.num_pigs
+        if bet_type == "Trifecta":
+            return self.trifectas.count(trifecta_index(n, *lanes))
+        first, second = lanes
+        count = self.exactas.count(exacta_index(n, first, second))
+        if bet_type == "Quinella":
+            count += self.exactas.count(exacta_index(n, second, first))
+        return count
+
+    def probability(self, bet_type, lanes):
+        if len(set(lanes)) != EXOTIC_LEGS[bet_type] or self.num_pigs < len(lanes):
+            return 0.0
+        count = self.count(bet_type, lanes) if self.samples else 0
+        return count / self.samples if count else harville_probability(bet_type, lanes, self.p_win)
+
+    def odds(self, bet_type, lanes):
+        return exotic_odds(self.probability(bet_type, lanes))
+
+
+def settle_tickets(ticket_indices, outcome_indices, bet_amounts, odds):
+    # Vectorized exotic settlement: a ticket wins when its rank is the rank of the result,
+    # so each ticket costs one comparison. Quinella tickets compare against quinella_index
+    # of the first two home.
+    return np.where(ticket_indices == outcome_indices, np.round(bet_amounts * odds, 2), 0.0)
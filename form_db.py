@@ -0,0 +1,194 @@
+from constants import FORM_RUNS
+from instrumentation import fields
+import instrumentation
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# The roster and form guide, kept in a SQLite database. A pig is known by its name: the first
+# time a name races, its stats go on the roster, and from then on any field that draws the
+# name runs that pig, stats and all. Every run is kept with the race's conditions, clustered
+# by pig so a pig's recent form is one short index range, with covering indexes for its
+# record under each track and weather condition. Results are queued by the GUI thread and
+# written by a thread of its own, a whole queue's worth per transaction.
+
+STATS = ('top_speed', 'agility', 'endurance', 'vigor', 'spirit', 'energy')
+NAME_CHUNK = 500  # Names looked up per query, well under the 999 variables older SQLite builds allow
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pigs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    top_speed REAL NOT NULL,
+    agility REAL NOT NULL,
+    endurance REAL NOT NULL,
+    vigor REAL NOT NULL,
+    spirit REAL NOT NULL,
+    energy REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS races (
+    id INTEGER PRIMARY KEY,
+    seed INTEGER NOT NULL,
+    weather TEXT NOT NULL,
+    track TEXT NOT NULL,
+    field_size INTEGER NOT NULL,
+    run_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    pig_id INTEGER NOT NULL REFERENCES pigs (id),
+    race_id INTEGER NOT NULL REFERENCES races (id),
+    lane INTEGER NOT NULL,
+    place INTEGER NOT NULL,
+    field_size INTEGER NOT NULL,
+    time REAL NOT NULL,
+    odds REAL NOT NULL,
+    weather TEXT NOT NULL,
+    track TEXT NOT NULL,
+    PRIMARY KEY (pig_id, race_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_by_track ON runs (pig_id, track, place, time);
+CREATE INDEX IF NOT EXISTS runs_by_weather ON runs (pig_id, weather, place, time);
+"""
+
+
+def connect(path):
+    # WAL lets the window read form while the writer thread commits
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def race_record(race, frame=None):
+    # Plain record of a finished race for FormDatabase.record_race, from its last frame (a
+    # played-back race's pigs never ran) and the odds each pig went off at
+    frame = frame if frame is not None else race.snapshot()
+    racers = race.racers
+    return {
+        'seed': race.seed,
+        'weather': race.weather_condition[0],
+        'track': race.track_condition[0],
+        'run_at': time.time(),
+        'runners': [(racers[lane].name, tuple(getattr(racers[lane], stat) for stat in STATS), lane, place, frame.finish_times[lane], racers[lane].odds)
+                    for place, lane in enumerate(frame.finish_order, start=1)],
+    }
+
+
+def write_races(connection, records):
+    # Every record in one transaction. A record that can't be written, such as one with two
+    # runners whose names make the same pig, is rolled back on its own and reported, and the
+    # rest still go in.
+    with connection:
+        connection.execute("BEGIN")
+        for record in records:
+            connection.execute("SAVEPOINT record")
+            try:
+                write_race(connection, record)
+            except sqlite3.IntegrityError as error:
+                connection.execute("ROLLBACK TO record")
+                log.error("Could not record race", extra=fields(seed=record['seed'], error=error))
+            connection.execute("RELEASE record")
+
+
+def write_race(connection, record):
+    runners = record['runners']
+    race_id = connection.execute("INSERT INTO races (seed, weather, track, field_size, run_at) VALUES (?, ?, ?, ?, ?)",
+                                 (record['seed'], record['weather'], record['track'], len(runners), record['run_at'])).lastrowid
+    # Names new to the roster join it with the stats they ran with
+    connection.executemany("INSERT OR IGNORE INTO pigs (name, top_speed, agility, endurance, vigor, spirit, energy) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           ((name,) + stats for name, stats, *_ in runners))
+    names = [runner[0] for runner in runners]
+    ids = {}
+    for start in range(0, len(names), NAME_CHUNK):
+        chunk = names[start:start + NAME_CHUNK]
+        ids.update(connection.execute(f"SELECT name, id FROM pigs WHERE name IN ({', '.join('?' * len(chunk))})", chunk))
+    # A pig can only run once in a race, so a repeated pig is an error, not a run to drop
+    connection.executemany("INSERT INTO runs (pig_id, race_id, lane, place, field_size, time, odds, weather, track) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           ((ids[name], race_id, lane, place, len(runners), finish_time, odds, record['weather'], record['track'])
+                            for name, _, lane, place, finish_time, odds in runners))
+
+
+class FormDatabase:
+    def __init__(self, path):
+        self.path = path
+        # Reads are on the thread that opened the database; the writer has its own connection
+        self.connection = connect(path)
+        self.connection.executescript(SCHEMA)
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name="form-writer", daemon=True)
+        self.writer.start()
+
+    def write_loop(self):
+        connection = connect(self.path)
+        closing = False
+        while not closing:
+            records = [self.queue.get()]
+            # Whatever else is waiting goes in the same transaction
+            while True:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = None in records
+            try:
+                with instrumentation.span("db.write"):
+                    write_races(connection, [record for record in records if record is not None])
+            except sqlite3.Error as error:
+                log.error("Could not write race results", extra=fields(path=self.path, error=error))
+            for _ in records:
+                self.queue.task_done()
+        connection.close()
+
+    def record_race(self, record):
+        # Never waits on the disk
+        self.queue.put(record)
+
+    def flush(self):
+        # Wait until everything queued so far is written
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.close()
+
+    def roster_stats(self, name):
+        row = self.connection.execute(f"SELECT {', '.join(STATS)} FROM pigs WHERE name = ?", (name,)).fetchone()
+        return dict(zip(STATS, row)) if row is not None else None
+
+    def roster_factory(self, racer_factory):
+        # Wraps a racer factory (as taken by race_engine.generate_field) so that a pig already
+        # on the roster runs with its roster stats. The new pig's stats are still drawn, so
+        # the rest of the field comes out the same either way.
+        def factory(name, rng=None):
+            racer = racer_factory(name, rng=rng)
+            stats = self.roster_stats(name)
+            if stats is not None:
+                for stat, value in stats.items():
+                    setattr(racer, stat, value)
+                racer.display_speed = racer.top_speed
+                racer.calculate_performance_level()
+            return racer
+        return factory
+
+    def recent_runs(self, name, limit=FORM_RUNS):
+        # The pig's last runs, latest first: (place, field size, time, track, weather, odds)
+        return self.connection.execute(
+            "SELECT place, field_size, time, track, weather, odds FROM runs "
+            "WHERE pig_id = (SELECT id FROM pigs WHERE name = ?) ORDER BY race_id DESC LIMIT ?", (name, limit)).fetchall()
+
+    def condition_record(self, name, track=None, weather=None):
+        # (runs, wins, average place, best time) under a track or weather condition, or both
+        query = "SELECT COUNT(*), COALESCE(SUM(place = 1), 0), AVG(place), MIN(time) FROM runs WHERE pig_id = (SELECT id FROM pigs WHERE name = ?)"
+        parameters = [name]
+        if track is not None:
+            query += " AND track = ?"
+            parameters.append(track)
+        if weather is not None:
+            query += " AND weather = ?"
+            parameters.append(weather)
+        return self.connection.execute(query, parameters).fetchone()
@@ -0,0 +1,227 @@
+from collections import Counter, deque
+from constants import INSTRUMENTATION, TRACE_EVENTS, LOG_LEVEL
+from contextlib import contextmanager, nullcontext
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+# Instrumentation for the hot paths: how late the worker threads wake, how many frames and
+# other signals are emitted and how many are still queued for the GUI thread, how long the
+# window takes to apply and paint a frame, and how many threads are running. It is off unless
+# enabled (main.py --instrument), and when off every entry point is one flag test and a
+# return. What it gathers can be written out as JSON or as a Chrome trace file, which
+# chrome://tracing and Perfetto open, and main.py --debug-overlay shows it over the window.
+#
+# The module also sets up logging for the program: messages carry their details as
+# key=value fields after the text, and the level (main.py --log-level) decides what shows.
+
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # Histogram bucket upper bounds
+
+enabled = INSTRUMENTATION
+counters = Counter()
+histograms = {}
+gauges = {}
+events = deque(maxlen=TRACE_EVENTS)  # Chrome trace events, the oldest dropped first
+_started = time.perf_counter()
+_lock = threading.Lock()
+
+
+class Histogram:
+    # Durations in milliseconds, counted into fixed buckets, with the total and the maximum
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.n = 0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.n += 1
+
+    def percentile(self, q):
+        # Upper bound of the bucket the q-th quantile falls in, never more than the maximum
+        if not self.n:
+            return 0.0
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * self.n:
+                return min(BUCKETS_MS[bucket], self.max) if bucket < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.n,
+            'mean_ms': self.total / self.n if self.n else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max,
+            'buckets_ms': {f"<={bound}": count for bound, count in zip(BUCKETS_MS, self.counts)} | {'more': self.counts[-1]},
+        }
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    global _started
+    with _lock:
+        counters.clear()
+        histograms.clear()
+        gauges.clear()
+        events.clear()
+        _started = time.perf_counter()
+
+
+def _timestamp_us(at):
+    return (at - _started) * 1e6
+
+
+def count(name, n=1):
+    if not enabled:
+        return
+    with _lock:
+        counters[name] += n
+
+
+def observe(name, seconds, started=None):
+    # One duration for the histogram of that name, and a span in the trace if it began at
+    # a known perf_counter time
+    if not enabled:
+        return
+    ms = seconds * 1000
+    with _lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.add(ms)
+        if started is not None:
+            events.append({'name': name, 'ph': 'X', 'ts': _timestamp_us(started), 'dur': ms * 1000, 'pid': os.getpid(), 'tid': threading.get_ident()})
+
+
+def gauge(name, value):
+    # A level that goes up and down, such as the thread count; a counter track in the trace
+    if not enabled:
+        return
+    with _lock:
+        gauges[name] = value
+        events.append({'name': name, 'ph': 'C', 'ts': _timestamp_us(time.perf_counter()), 'pid': os.getpid(), 'args': {name: value}})
+
+
+@contextmanager
+def _span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, started)
+
+
+def span(name):
+    # with span("frame.apply"): ... times the block when enabled
+    return _span(name) if enabled else nullcontext()
+
+
+def timed(name):
+    # The same as a decorator; the flag is looked at on every call
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _span(name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__qualname__ = function.__qualname__
+        return wrapper
+    return decorate
+
+
+def thread_count():
+    # Every thread in the process, Qt's and the process pool's feeders included, where the
+    # platform lists them; otherwise only the threads Python knows of
+    try:
+        return len(os.listdir('/proc/self/task'))
+    except OSError:
+        return threading.active_count()
+
+
+def sample_threads():
+    if enabled:
+        gauge('threads', thread_count())
+
+
+def signal_counts():
+    # Emitted and handled counts per signal ("signal.<name>.emitted" / ".handled"); the
+    # difference is what was still queued for the receiving thread
+    signals = {}
+    for key, value in counters.items():
+        parts = key.split('.')
+        if len(parts) == 3 and parts[0] == 'signal':
+            signals.setdefault(parts[1], {'emitted': 0, 'handled': 0})[parts[2]] = value
+    for counts in signals.values():
+        counts['queued'] = counts['emitted'] - counts['handled']
+    return signals
+
+
+def snapshot():
+    with _lock:
+        return {
+            'elapsed': time.perf_counter() - _started,
+            'counters': dict(counters),
+            'signals': signal_counts(),
+            'histograms': {name: histogram.to_dict() for name, histogram in histograms.items()},
+            'gauges': dict(gauges),
+        }
+
+
+def summary():
+    # A few lines for the debug overlay
+    data = snapshot()
+    lines = [f"{name}: p50 {h['p50_ms']:.2f}ms p99 {h['p99_ms']:.2f}ms max {h['max_ms']:.1f}ms n={h['count']}" for name, h in sorted(data['histograms'].items())]
+    lines += [f"{name}: emitted {c['emitted']} queued {c['queued']}" for name, c in sorted(data['signals'].items())]
+    lines += [f"{name}: {value}" for name, value in sorted(data['gauges'].items())]
+    return "\n".join(lines)
+
+
+def export_json(path):
+    with open(path, 'w') as file:
+        json.dump(snapshot(), file, indent=2)
+
+
+def export_chrome_trace(path):
+    with _lock:
+        trace_events = list(events)
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    trace_events += [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': {'name': name}} for ident, name in names.items()]
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, file)
+
+
+class FieldFormatter(logging.Formatter):
+    # Appends a record's fields (logged with extra=fields(...)) as key=value pairs
+    def format(self, record):
+        text = super().format(record)
+        values = getattr(record, 'fields', None)
+        if values:
+            text += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        return text
+
+
+def fields(**values):
+    # log.info("Race started", extra=fields(weather=..., track=...))
+    return {'fields': values}
+
+
+def configure_logging(level=LOG_LEVEL):
+    handler = logging.StreamHandler()
+    handler.setFormatter(FieldFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
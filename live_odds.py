@@ -0,0 +1,39 @@
+from batch_engine import BatchRace
+from constants import LIVE_ODDS_SAMPLES, LIVE_ODDS_BUDGET
+from odds_engine import OddsEstimate, placing_counts
+from race_engine import TICK_SECONDS
+import numpy as np
+import time
+
+# In-running odds. The race is saved as it stands (race_engine.RaceState: every pig's
+# distance, segment, state and timers), forked into a batch of copies on the batch engine
+# and each copy run on with charge rolls of its own until its first three are home, so the
+# Win, Place and Show chances are conditional on the race so far. Pigs already home keep
+# their places. The copies are run a chunk at a time until the sample count or the time
+# budget runs out.
+
+LIVE_CHUNK_PIG_RACES = 2500  # Cap on races x pigs per chunk, so one chunk fits in the budget
+
+
+def live_probabilities(race, samples=LIVE_ODDS_SAMPLES, time_budget=LIVE_ODDS_BUDGET, seed=None, dt=TICK_SECONDS):
+    # race is a started race_engine.Race (or FieldRace); it is only read. At least one chunk
+    # is always run, so the budget is best kept to a few chunks' worth.
+    started = time.perf_counter()
+    deadline = started + time_budget
+    state = race.save_state()
+    num_pigs = len(race.racers)
+    chunk_size = max(1, min(samples, LIVE_CHUNK_PIG_RACES // max(num_pigs, 1)))
+    batch = BatchRace.from_racers(race.racers, race.weather_condition, race.track_condition, chunk_size, np.random.default_rng(seed))
+    counts = np.zeros((3, num_pigs))
+    done_samples = 0
+    while done_samples < samples:
+        chunk_started = time.perf_counter()
+        batch.restore(state, dt)
+        batch.run_until_placed(min(3, num_pigs), dt)
+        counts += placing_counts(batch.finish_order())
+        done_samples += chunk_size
+        # Another chunk only if it should be done in time, going by how long this one took
+        now = time.perf_counter()
+        if now + (now - chunk_started) > deadline:
+            break
+    return OddsEstimate(counts, done_samples, time.perf_counter() - started, seed)
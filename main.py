@@ -1,165 +1,47 @@
-from constants import PLAYER_START_BANK, DEFAULT_BET_SIZE, CHARGING_MIN, CHARGING_MAX, TOTAL_TRACK_LENGTH, SPEED_MAX, SPEED_MIN, NORMAL, CHARGING, RECOVERING, STRAIGHTAWAY_LENGTH, TURN_LENGTH, WEATHER_CONDITIONS, TRACK_CONDITIONS, PIG_NAMES, AGILITY_MIN, AGILITY_MAX
-from functools import partial
-import logging
-from pig import Pig
-from PyQt5.QtWidgets import (
-    QApplication,
-    QMainWindow,
-    QWidget,
-    QVBoxLayout,
-    QHBoxLayout,
-    QPushButton,
-    QLabel,
-    QProgressBar )
-from PyQt5.QtCore import QThread, pyqtSignal, QObject, QTimer
-from race_controller import RaceController
-from racetrack import RaceTrackWidget
-import random
+from constants import FIELD_SIZE, PARIMUTUEL, FORM_DB, LOG_LEVEL
 import sys
 
-class RaceRecapWidget(QWidget):
-    def __init__(self):
-        super().__init__()
-        self.layout = QVBoxLayout()
-        self.setLayout(self.layout)
-        self.recap_label = QLabel("Race Recap: Top Three Positions")
-        self.layout.addWidget(self.recap_label)
-        self.labels = [QLabel("") for _ in range(3)]
-        for label in self.labels:
-            self.layout.addWidget(label)
-        
-    def display_results(self, race_results):
-        # Update results for the top three positions
-        for i, result in enumerate(race_results[:3]):
-            place = ["1st", "2nd", "3rd"][i]
-            name = result['Racer Pig']
-            time = result['Finishing Time']
-            odds = result['Win Odds']
-            performance_level = result['Performance Rating']
-            label_text = f"{place}: Racing Pig {name}, Finishing Time: {time:.2f} seconds, Win Odds: {odds:.2f}, Performance Level: {performance_level*100:.1f}"
-            self.labels[i].setText(label_text)
+# The entry point. The window lives in main_window.py and is only imported below: the odds
+# process pool spawns its workers, and a spawned worker runs this file's imports again
+# before it can take any work, so everything up here is paid once per worker.
 
-
-class MainWindow(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.race_controller = RaceController()
-        self.race_controller.race_finished.connect(self.show_race_recap)
-        self.race_results = []
-        self.init_ui()
-        self.display_pigs()
-        self.race_recap_widget = RaceRecapWidget()
-        self.race_track_widget.race_results_signal.connect(self.race_results_updated)
-        for pig in self.race_controller.pigs:
-            pig.finished.connect(self.race_track_widget.handle_pig_finished)
-        self.layout.addWidget(self.race_recap_widget)
-        self.race_recap_widget.hide()
-        self.betting_widget = self.race_track_widget.betting_widget
-        self.betting_widget.pig_selected.connect(self.prepare_to_place_bet)
-        self.betting_widget.bet_placed.connect(self.bet_has_been_placed)
-
-    def init_ui(self):
-        self.setWindowTitle("Realistic Racing Pig Simulator")
-        self.setGeometry(200, 200, 900, 300)
-        self.central_widget = QWidget()
-        self.setCentralWidget(self.central_widget)
-        self.layout = QVBoxLayout()
-        self.race_track_widget = RaceTrackWidget(self, self.race_controller)
-        self.race_track_widget.start_race_ui(
-                self.race_controller.weather_condition, 
-                self.race_controller.track_condition
-                )
-        self.layout.addWidget(self.race_track_widget)
-        self.start_button = QPushButton("Select Racer and Place Bet")
-        # The click of the so-called Start Button is here connected to the function which emits the race-starting logic
-        self.start_button.clicked.connect(self.handle_start_button)
-        self.layout.addWidget(self.start_button)
-        self.central_widget.setLayout(self.layout)
-
-    def display_pigs(self):
-        
-        for pig in self.race_controller.pigs:
-            self.race_track_widget.add_pig(pig)
-        self.race_track_widget.calculate_odds()
-
-    def prepare_to_place_bet(self):
-        self.start_button.setText("Place Bet")
-
-    def bet_has_been_placed(self):
-        self.start_button.setText("RACE IN PROGRESS")
-
-    def handle_start_button(self):
-        if self.start_button.text() == "Place Bet":
-            if self.race_track_widget.selected_pig_widget is not None:
-                # This method in the other class emits the "bet_placed" signal from the BettingWidget
-                self.betting_widget.place_bet()
-                self.start_button.setDisabled(True)
-                self.betting_widget.bet_amount_dropdown.setDisabled(True)
-                self.betting_widget.bet_type_dropdown.setDisabled(True)
-                self.race_controller.start_race()
-        if self.start_button.text() == "Race Again":
-            self.reset_race(False)
-
-    def show_results(self):
-        self.start_button.setEnabled(True)
-        self.betting_widget.bet_amount_dropdown.setEnabled(True)
-
-    def closeEvent(self, event):
-        self.race_track_widget.update_timer.stop()
-        self.race_controller.clean_up()
-        event.accept()
-
-    def race_results_updated(self, name):
-        pig = next((p for p in self.race_controller.pigs if p.name == name), None)
-        if pig:
-            self.race_results.append({'Racer Pig': pig.name, 'Finishing Time': pig.time, 'Win Odds': pig.odds, 'Performance Rating': pig.performance_level})
-        else:
-            print(f"Pig with name {name} not found.")
-
-    def reset_race(self, new = False):
-        if new:
-            self.race_track_widget.bank = PLAYER_START_BANK
-        # Check if there's enough in the bank to place any bets (if not, game over message)
-        self.race_track_widget.check_bank_status()
-        self.betting_widget.bet_amount = DEFAULT_BET_SIZE
-        self.start_button.setEnabled(True)
-        self.betting_widget.clear_racer_details()
-        self.betting_widget.bet_amount_dropdown.setEnabled(True)
-        self.betting_widget.bet_type_dropdown.setEnabled(True)
-        self.start_button.setText("Select a Racer Pig")
-        self.race_recap_widget.hide()
-        self.race_track_widget.show()
-        self.race_results.clear()
-        self.race_controller.clean_up() 
-        self.race_track_widget.selected_pig_widget = None
-        self.race_track_widget.clear_pigs()
-        # Reset the counter for the Win/Place/Show logic
-        self.race_track_widget.finished_place = 1
-        # Reset the Race Controller
-        self.race_controller = RaceController()
-        # Reconnect the origin for the finishing signal for each pig, to run the placing logic in RaceTrackWidget
-        for pig in self.race_controller.pigs:
-            pig.finished.connect(self.race_track_widget.handle_pig_finished)
-            print(f"Reconnected pig {pig.name} to the finish line proc")
-        # Reconnect the origin for the race finish, to show the race recap
-        self.race_controller.race_finished.connect(self.show_race_recap)
-        self.display_pigs()
-        # Reset the timer for updating standings and pig finish times
-        self.race_track_widget.reset_timer()
-        self.betting_widget.show()
-        self.betting_widget.update_bet_amount_options(self.race_track_widget.bank)
-
-    def show_race_recap(self):
-        sorted_results = sorted(self.race_results, key=lambda x: x['Finishing Time'])
-        self.race_recap_widget.display_results(sorted_results)
-        self.race_recap_widget.show()
-        self.start_button.setText("Race Again")
-        self.start_button.setEnabled(True)
-
-        
 if __name__ == "__main__":
+    from instrumentation import configure_logging
+    import instrumentation
+    from main_window import MainWindow
+    from PyQt5.QtWidgets import QApplication
+    from race_recording import RaceRecording
     app = QApplication(sys.argv)
-    main_window = MainWindow()
+    # Show more or less with --log-level DEBUG|INFO|WARNING|ERROR
+    configure_logging(sys.argv[sys.argv.index("--log-level") + 1] if "--log-level" in sys.argv else LOG_LEVEL)
+    # Gather tick, signal and frame timings with --instrument, written on exit to PATH.json
+    # and, as a Chrome trace, PATH.trace.json; --debug-overlay shows them over the window
+    instrument_path = sys.argv[sys.argv.index("--instrument") + 1] if "--instrument" in sys.argv else None
+    if instrument_path is not None:
+        instrumentation.enable()
+    # Replay a particular race with --seed N
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else None
+    # Recordings keep the seed as an unsigned 64-bit number
+    if seed is not None and not 0 <= seed < 2 ** 64:
+        sys.exit(f"usage: --seed N, where N is a whole number from 0 to {2 ** 64 - 1}")
+    # Or play back a race_recording file with --replay PATH
+    tape = RaceRecording(sys.argv[sys.argv.index("--replay") + 1]) if "--replay" in sys.argv else None
+    # Race a field of N pigs with --pigs N; over LARGE_FIELD_SIZE the track gives way to a standings table
+    num_pigs = int(sys.argv[sys.argv.index("--pigs") + 1]) if "--pigs" in sys.argv else FIELD_SIZE
+    if tape is not None:
+        seed = tape.seed
+        num_pigs = len(tape.field)
+    # Bet into pools shared with a simulated crowd with --parimutuel
+    # Keep a roster of pigs and their form with --form-db PATH
+    form_db_path = sys.argv[sys.argv.index("--form-db") + 1] if "--form-db" in sys.argv else FORM_DB
+    main_window = MainWindow(seed, tape, num_pigs, PARIMUTUEL or "--parimutuel" in sys.argv, form_db_path, "--debug-overlay" in sys.argv)
+    # Watch races faster than real time with --rate N, N being one of PLAYBACK_RATES
+    if "--rate" in sys.argv:
+        main_window.race_track_widget.set_playback_rate(int(sys.argv[sys.argv.index("--rate") + 1]))
     main_window.show()
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    status = app.exec_()
+    if instrument_path is not None:
+        instrumentation.export_json(instrument_path + ".json")
+        instrumentation.export_chrome_trace(instrument_path + ".trace.json")
+    sys.exit(status)
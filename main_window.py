@@ -0,0 +1,199 @@
+from constants import PLAYER_START_BANK, DEFAULT_BET_SIZE, FIELD_SIZE, PARIMUTUEL, FORM_DB
+from instrumentation import fields
+import instrumentation
+import logging
+from odds_engine import shutdown_executor
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel
+from PyQt5.QtCore import QTimer, Qt
+from race_controller import RaceController
+from racetrack import RaceTrackWidget
+
+log = logging.getLogger(__name__)
+
+DEBUG_OVERLAY_INTERVAL = 500  # ms between debug overlay refreshes
+
+class RaceRecapWidget(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+        self.recap_label = QLabel("Race Recap: Top Three Positions")
+        self.layout.addWidget(self.recap_label)
+        self.labels = [QLabel("") for _ in range(3)]
+        for label in self.labels:
+            self.layout.addWidget(label)
+        self.seed_label = QLabel("")
+        self.layout.addWidget(self.seed_label)
+        
+    def display_results(self, race_results, seed=None):
+        # Update results for the top three positions
+        for i, result in enumerate(race_results[:3]):
+            place = ["1st", "2nd", "3rd"][i]
+            name = result['Racer Pig']
+            time = result['Finishing Time']
+            odds = result['Win Odds']
+            performance_level = result['Performance Rating']
+            label_text = f"{place}: Racing Pig {name}, Finishing Time: {time:.2f} seconds, Win Odds: {odds:.2f}, Performance Level: {performance_level*100:.1f}"
+            self.labels[i].setText(label_text)
+        # The seed is all it takes to replay this race exactly (main.py --seed N)
+        self.seed_label.setText(f"Race Seed: {seed}" if seed is not None else "")
+
+
+class DebugOverlay(QLabel):
+    # The instrumentation summary drawn over the top right of the window; clicks go through
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: white; font-family: monospace; padding: 4px;")
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(DEBUG_OVERLAY_INTERVAL)
+
+    def refresh(self):
+        instrumentation.sample_threads()
+        self.setText(instrumentation.summary() or "No measurements yet")
+        self.adjustSize()
+        self.move(self.parent().width() - self.width() - 8, 8)
+        self.raise_()
+
+
+class MainWindow(QMainWindow):
+    def __init__(self, seed=None, tape=None, num_pigs=FIELD_SIZE, parimutuel=PARIMUTUEL, form_db_path=FORM_DB, debug_overlay=False):
+        super().__init__()
+        self.num_pigs = num_pigs
+        self.parimutuel = parimutuel
+        # The roster and form guide outlive every race
+        self.form_db = None
+        if form_db_path:
+            # sqlite3 is only loaded for a window that keeps form
+            from form_db import FormDatabase
+            self.form_db = FormDatabase(form_db_path)
+        self.race_controller = RaceController(seed, tape, num_pigs, parimutuel, self.form_db)
+        self.race_controller.race_finished.connect(self.show_race_recap)
+        self.race_results = []
+        self.init_ui()
+        self.connect_race_controller()
+        self.display_pigs()
+        self.race_recap_widget = RaceRecapWidget()
+        self.race_track_widget.race_results_signal.connect(self.race_results_updated)
+        self.layout.addWidget(self.race_recap_widget)
+        self.race_recap_widget.hide()
+        self.betting_widget = self.race_track_widget.betting_widget
+        self.betting_widget.form_db = self.form_db
+        self.betting_widget.pig_selected.connect(self.prepare_to_place_bet)
+        self.betting_widget.bet_placed.connect(self.bet_has_been_placed)
+        # Shows what the instrumentation is gathering, so it implies --instrument
+        self.debug_overlay = None
+        if debug_overlay:
+            instrumentation.enable()
+            self.debug_overlay = DebugOverlay(self)
+
+    def init_ui(self):
+        self.setWindowTitle("Realistic Racing Pig Simulator")
+        self.setGeometry(200, 200, 900, 300)
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.layout = QVBoxLayout()
+        self.race_track_widget = RaceTrackWidget(self, self.race_controller)
+        self.race_track_widget.start_race_ui(
+                self.race_controller.weather_condition, 
+                self.race_controller.track_condition
+                )
+        self.layout.addWidget(self.race_track_widget)
+        self.start_button = QPushButton("Select Racer and Place Bet")
+        # The click of the so-called Start Button is here connected to the function which emits the race-starting logic
+        self.start_button.clicked.connect(self.handle_start_button)
+        self.layout.addWidget(self.start_button)
+        self.central_widget.setLayout(self.layout)
+
+    def connect_race_controller(self):
+        # Frames drive the track display, and each finish runs the placing logic in RaceTrackWidget
+        self.race_controller.odds_updated.connect(self.race_track_widget.refresh_odds)
+        self.race_controller.frame_updated.connect(self.race_track_widget.apply_frame)
+        self.race_controller.pig_finished.connect(self.race_track_widget.handle_pig_finished)
+        self.race_controller.pools_updated.connect(self.race_track_widget.refresh_pool_odds)
+        self.race_controller.pools_settled.connect(self.race_track_widget.handle_pool_settlement)
+        self.race_controller.live_odds_updated.connect(self.race_track_widget.refresh_live_odds)
+        # The chosen playback speed carries over from race to race
+        self.race_controller.set_playback_rate(self.race_track_widget.playback_rate())
+
+    def display_pigs(self):
+        
+        for pig in self.race_controller.pigs:
+            self.race_track_widget.add_pig(pig)
+        self.race_track_widget.calculate_odds()
+
+    def prepare_to_place_bet(self):
+        if self.start_button.text() != "New Game":
+            self.start_button.setText("Place Bet")
+
+    def bet_has_been_placed(self):
+        self.start_button.setText("RACE IN PROGRESS")
+
+    def handle_start_button(self):
+        if self.start_button.text() == "Place Bet":
+            if self.race_track_widget.bet_ready():
+                # This method in the other class emits the "bet_placed" signal from the BettingWidget
+                self.betting_widget.place_bet()
+                self.start_button.setDisabled(True)
+                self.betting_widget.bet_amount_dropdown.setDisabled(True)
+                self.betting_widget.bet_type_dropdown.setDisabled(True)
+                self.race_controller.start_race()
+        if self.start_button.text() == "Race Again":
+            self.reset_race(False)
+        elif self.start_button.text() == "New Game":
+            self.reset_race(True)
+
+    def show_results(self):
+        self.start_button.setEnabled(True)
+        self.betting_widget.bet_amount_dropdown.setEnabled(True)
+
+    def closeEvent(self, event):
+        self.race_controller.shutdown()
+        shutdown_executor()
+        if self.form_db is not None:
+            # Waits for the last results to be written
+            self.form_db.close()
+        event.accept()
+
+    def race_results_updated(self, name):
+        pig = next((p for p in self.race_controller.pigs if p.name == name), None)
+        if pig:
+            self.race_results.append({'Racer Pig': pig.name, 'Finishing Time': pig.time, 'Win Odds': pig.odds, 'Performance Rating': pig.performance_level, 'Seed': self.race_controller.seed})
+        else:
+            log.warning("Finisher not in the field", extra=fields(pig=name))
+
+    def reset_race(self, new = False):
+        if new:
+            self.race_track_widget.bank = PLAYER_START_BANK
+            self.race_track_widget.game_over_label.hide()
+            self.betting_widget.setEnabled(True)
+        self.betting_widget.bet_amount = DEFAULT_BET_SIZE
+        self.start_button.setEnabled(True)
+        self.betting_widget.clear_racer_details()
+        self.betting_widget.bet_amount_dropdown.setEnabled(True)
+        self.betting_widget.bet_type_dropdown.setEnabled(True)
+        self.start_button.setText("Select a Racer Pig")
+        self.race_recap_widget.hide()
+        self.race_track_widget.show()
+        self.race_results.clear()
+        self.race_track_widget.selected_pig_widget = None
+        self.race_track_widget.clear_pigs()
+        # Reset the counter for the Win/Place/Show logic
+        self.race_track_widget.finished_place = 1
+        # The same controller, threads, connections and views run the next race; only the
+        # field and the conditions are new
+        self.race_controller.new_race()
+        self.race_track_widget.show_conditions(self.race_controller.weather_condition, self.race_controller.track_condition)
+        self.display_pigs()
+        self.betting_widget.show()
+        self.betting_widget.update_bet_amount_options(self.race_track_widget.bank)
+        # Check if there's enough in the bank to place any bets (if not, game over message)
+        self.race_track_widget.check_bank_status()
+
+    def show_race_recap(self):
+        sorted_results = sorted(self.race_results, key=lambda x: x['Finishing Time'])
+        self.race_recap_widget.display_results(sorted_results, self.race_controller.seed)
+        self.race_recap_widget.show()
+        self.start_button.setText("Race Again")
+        self.start_button.setEnabled(True)
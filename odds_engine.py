@@ -0,0 +1,155 @@
+from batch_engine import BatchRace
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from constants import ODDS_MAX, BET_MULTIPLIERS, HOUSE_MARGIN, ODDS_SAMPLES, ODDS_TIME_BUDGET
+from exotics import finish_indices
+import multiprocessing
+import numpy as np
+import os
+import time
+
+# Monte Carlo odds: race the actual field under the actual conditions thousands of times
+# on the batch engine and price each pig from how often it wins, places and shows.
+
+STATS = ('top_speed', 'agility', 'endurance', 'vigor', 'spirit', 'energy')
+StatLine = namedtuple('StatLine', STATS)  # A pig's stats alone; field_stats reads it like the pig
+CHUNK_SIZE = 2000  # Races per work item handed to a pool worker
+CHUNK_PIG_RACES = 40000  # Cap on races x pigs per work item, so big fields don't blow up a worker's arrays
+
+_executor = None
+
+
+class OddsEstimate:
+    # Finishing probabilities for one field. Place and Show are cumulative, so p_show is
+    # the chance of finishing in the top three.
+    def __init__(self, counts, samples, elapsed, seed, trifectas=None):
+        self.samples = samples
+        self.trifectas = trifectas  # Trifecta rank of each simulated race, see exotics
+        self.elapsed = elapsed
+        self.seed = seed
+        self.p_win, self.p_place, self.p_show = (counts / max(samples, 1)).tolist()
+
+    def odds(self, bet_type="Win"):
+        return bet_odds(self, bet_type)
+
+
+def get_executor():
+    # One pool for the life of the process. Workers are spawned rather than forked so a
+    # running Qt application is never duplicated into them.
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def stat_lines(racers):
+    # A copy of the field's stats to hand to another thread, which the pigs themselves can
+    # be redrawn under
+    return [StatLine(*(getattr(racer, stat) for stat in STATS)) for racer in racers]
+
+
+def field_stats(racers):
+    # Plain lists, so a field is cheap to pickle across to a worker
+    return {stat: [getattr(racer, stat) for racer in racers] for stat in STATS}
+
+
+def race_field(stats, weather_impact, track_impact, num_races, seed):
+    # Race the field num_races times; returns the [races x pigs] finish order
+    rng = np.random.default_rng(seed)
+    tiled = {stat: np.tile(values, (num_races, 1)) for stat, values in stats.items()}
+    batch = BatchRace(weather_impact=np.full(num_races, weather_impact), track_impact=np.full(num_races, track_impact), rng=rng, **tiled)
+    return batch.run()
+
+
+def placing_counts(order):
+    # How often each pig finished first, in the top two and in the top three
+    num_pigs = order.shape[1]
+    counts = np.zeros((3, num_pigs))
+    for place in range(min(3, num_pigs)):
+        counts[place:] += np.bincount(order[:, place], minlength=num_pigs)
+    return counts
+
+
+def simulate_placings(stats, weather_impact, track_impact, num_races, seed):
+    # Worker entry point: the placing counts over num_races races
+    return placing_counts(race_field(stats, weather_impact, track_impact, num_races, seed))
+
+
+def simulate_finishes(stats, weather_impact, track_impact, num_races, seed):
+    # Worker entry point: the placing counts, and the trifecta rank of every race for
+    # pricing the exotics (None for fields of fewer than three)
+    order = race_field(stats, weather_impact, track_impact, num_races, seed)
+    return placing_counts(order), finish_indices(order) if order.shape[1] >= 3 else None
+
+
+def estimate_probabilities(racers, weather_condition, track_condition, samples=ODDS_SAMPLES, time_budget=ODDS_TIME_BUDGET, seed=None, executor=None):
+    # Spread the samples over the pool in chunks, each chunk with its own child seed so the
+    # estimate is reproducible for a given seed whatever the number of workers. Whatever has
+    # come back when the time budget runs out is used, but at least one chunk always is.
+    executor = executor if executor is not None else get_executor()
+    stats = field_stats(racers)
+    seed_sequence = np.random.SeedSequence(seed)
+    chunk_size = max(1, min(CHUNK_SIZE, CHUNK_PIG_RACES // max(len(racers), 1)))
+    num_chunks = max(1, -(-samples // chunk_size))
+    chunk_seeds = seed_sequence.spawn(num_chunks)
+    started = time.perf_counter()
+    deadline = started + time_budget
+    pending = {executor.submit(simulate_finishes, stats, weather_condition[1], track_condition[1], min(chunk_size, samples - i * chunk_size), chunk_seed): min(chunk_size, samples - i * chunk_size)
+               for i, chunk_seed in enumerate(chunk_seeds)}
+    counts = np.zeros((3, len(racers)))
+    trifectas = []
+    done_samples = 0
+    while pending:
+        timeout = None if done_samples == 0 else max(deadline - time.perf_counter(), 0)
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            placings, finishes = future.result()
+            counts += placings
+            if finishes is not None:
+                trifectas.append(finishes)
+            done_samples += pending.pop(future)
+    for future in pending:
+        future.cancel()
+    return OddsEstimate(counts, done_samples, time.perf_counter() - started, seed_sequence.entropy, np.concatenate(trifectas) if trifectas else None)
+
+
+def odds_from_probability(p, bet_type="Win"):
+    # Odds for a bet that pays odds times its bet type's multiplier on a place the pig
+    # reaches with probability p, priced so a unit stake returns 1 - HOUSE_MARGIN on
+    # average. ODDS_MAX caps the long shots, which only ever takes more for the house; there
+    # is no floor, as raising a short price would hand the favourites an edge over the book.
+    if p <= 0:
+        return ODDS_MAX
+    return min((1 - HOUSE_MARGIN) / (p * BET_MULTIPLIERS[bet_type]), ODDS_MAX)
+
+
+def odds_from_probabilities(p, multiplier):
+    # odds_from_probability over an array of probabilities and a multiplier, or an array of them
+    p = np.asarray(p, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        odds = (1 - HOUSE_MARGIN) / (p * multiplier)
+    return np.where(p > 0, np.minimum(odds, ODDS_MAX), ODDS_MAX)
+
+
+def exact_probabilities(estimate, bet_type):
+    # Each pig's chance of finishing in exactly the place the bet type pays on, from an
+    # estimate's cumulative p_win, p_place and p_show
+    if bet_type == "Win":
+        return list(estimate.p_win)
+    if bet_type == "Place":
+        return [top_two - win for win, top_two in zip(estimate.p_win, estimate.p_place)]
+    return [top_three - top_two for top_two, top_three in zip(estimate.p_place, estimate.p_show)]
+
+
+def bet_odds(estimate, bet_type="Win"):
+    # Every pig's odds for one bet type; each bet type is priced from its own place's chances
+    return [odds_from_probability(p, bet_type) for p in exact_probabilities(estimate, bet_type)]
@@ -0,0 +1,130 @@
+from constants import POOL_TAKEOUT, BET_AMOUNTS
+from settlement import BET_TYPES, BET_PLACE_ARRAY
+import numpy as np
+
+# Parimutuel betting: every Win, Place and Show wager goes into that bet type's pool, and
+# after the takeout the pool is shared out among the tickets on the pig that finished in the
+# place the bet type pays on (1st for Win, 2nd for Place, 3rd for Show, as in settlement).
+# Each pool keeps a running total per lane, so a wager is one addition and a pig's current
+# dividend is one division however many wagers are in. Tickets are kept in flat arrays and
+# settled all together, in one pass of array work, once the result is in.
+
+INITIAL_CAPACITY = 1024  # Wagers the ticket arrays start with room for; they double as needed
+CROWD_BET_MIX = (0.5, 0.25, 0.25)  # Share of the simulated crowd's wagers on Win, Place, Show
+CROWD_NOISE = 0.3  # How far the crowd strays from the form: weight of an even spread in its picks
+
+
+class ParimutuelPools:
+    def __init__(self, num_pigs, takeout=POOL_TAKEOUT):
+        self.num_pigs = num_pigs
+        self.takeout = takeout
+        self.lane_totals = np.zeros((len(BET_TYPES), num_pigs))  # Money on each pig, per pool
+        self.totals = np.zeros(len(BET_TYPES))
+        self.count = 0
+        self.bettors = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.bet_types = np.empty(INITIAL_CAPACITY, dtype=np.int8)
+        self.lanes = np.empty(INITIAL_CAPACITY, dtype=np.int32)
+        self.amounts = np.empty(INITIAL_CAPACITY)
+        self.closed = False
+
+    def reserve(self, extra):
+        needed = self.count + extra
+        if needed <= len(self.amounts):
+            return
+        capacity = max(needed, 2 * len(self.amounts))
+        for name in ('bettors', 'bet_types', 'lanes', 'amounts'):
+            grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+            grown[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, grown)
+
+    def place(self, bettor, bet_type, lane, amount):
+        # One wager; returns its ticket number. bet_type is a name from BET_TYPES.
+        if self.closed:
+            raise ValueError("Betting has closed for this race")
+        self.reserve(1)
+        ticket = self.count
+        code = BET_TYPES.index(bet_type)
+        self.bettors[ticket] = bettor
+        self.bet_types[ticket] = code
+        self.lanes[ticket] = lane
+        self.amounts[ticket] = amount
+        self.lane_totals[code, lane] += amount
+        self.totals[code] += amount
+        self.count += 1
+        return ticket
+
+    def place_many(self, bettors, bet_types, lanes, amounts):
+        # A batch of wagers as arrays, bet_types as indices into BET_TYPES
+        if self.closed:
+            raise ValueError("Betting has closed for this race")
+        added = len(amounts)
+        self.reserve(added)
+        batch = slice(self.count, self.count + added)
+        self.bettors[batch] = bettors
+        self.bet_types[batch] = bet_types
+        self.lanes[batch] = lanes
+        self.amounts[batch] = amounts
+        np.add.at(self.lane_totals, (bet_types, lanes), amounts)
+        self.totals += np.bincount(bet_types, weights=amounts, minlength=len(BET_TYPES))
+        self.count += added
+
+    def close(self):
+        self.closed = True
+
+    def dividend(self, bet_type, lane):
+        # What a $1 ticket on the pig would return if it came in now, stake included; None
+        # while nobody has backed it
+        code = BET_TYPES.index(bet_type)
+        backed = self.lane_totals[code, lane]
+        return self.totals[code] * (1 - self.takeout) / backed if backed else None
+
+    def settle(self, finish_order):
+        # Pay out every ticket at once. A pool that nobody backed the paying pig in is
+        # refunded. Payouts are rounded down to the cent, the breakage going to the house.
+        count = self.count
+        bet_types = self.bet_types[:count]
+        lanes = self.lanes[:count]
+        amounts = self.amounts[:count]
+        winning_lanes = np.array([finish_order[place - 1] if place <= len(finish_order) else -1 for place in BET_PLACE_ARRAY])
+        winning_stakes = np.array([self.lane_totals[code, lane] if lane >= 0 else 0.0 for code, lane in enumerate(winning_lanes)])
+        refunded = winning_stakes == 0
+        dividends = np.where(refunded, 1.0, self.totals * (1 - self.takeout) / np.where(refunded, 1.0, winning_stakes))
+        winning = refunded[bet_types] | (lanes == winning_lanes[bet_types])
+        payouts = np.where(winning, np.floor(amounts * dividends[bet_types] * 100) / 100, 0.0)
+        return PoolSettlement(dividends, refunded, payouts, self.bettors[:count])
+
+
+class PoolSettlement:
+    def __init__(self, dividends, refunded, payouts, bettors):
+        self.dividends = dividends  # Per $1, per bet type, stake included
+        self.refunded = refunded
+        self.payouts = payouts  # Per ticket
+        self.bettors = bettors
+
+    def bettor_payout(self, bettor):
+        return float(self.payouts[self.bettors == bettor].sum())
+
+    def bettor_totals(self):
+        # Total paid to every bettor id, indexed by id
+        return np.bincount(self.bettors, weights=self.payouts)
+
+
+def crowd_wagers(num_wagers, p_win, p_place, p_show, rng, first_bettor=1, num_bettors=None):
+    # Wagers from a simulated crowd that follows the form loosely: each wager is on a bet type
+    # in CROWD_BET_MIX, on a pig picked in proportion to its chance of finishing in the
+    # place that pays, blended with an even spread. Returns (bettors, bet_types, lanes, amounts).
+    p_win = np.asarray(p_win)
+    exact = np.array([p_win, np.asarray(p_place) - p_win, np.asarray(p_show) - np.asarray(p_place)])
+    num_pigs = exact.shape[1]
+    picks = (1 - CROWD_NOISE) * exact / np.maximum(exact.sum(axis=1, keepdims=True), 1e-12) + CROWD_NOISE / num_pigs
+    cumulative = np.cumsum(picks, axis=1)
+    cumulative /= cumulative[:, -1:]
+    bet_types = rng.choice(len(BET_TYPES), size=num_wagers, p=CROWD_BET_MIX).astype(np.int8)
+    draws = rng.random(num_wagers)
+    lanes = np.empty(num_wagers, dtype=np.int32)
+    for code in range(len(BET_TYPES)):
+        chosen = bet_types == code
+        lanes[chosen] = np.minimum(np.searchsorted(cumulative[code], draws[chosen], side='right'), num_pigs - 1)
+    amounts = rng.choice(np.array(BET_AMOUNTS, dtype=np.float64), size=num_wagers)
+    bettors = first_bettor + rng.integers(0, num_bettors or num_wagers, size=num_wagers)
+    return bettors, bet_types, lanes, amounts
@@ -1,81 +1,425 @@
-from betting import BettingWidget
-from constants import CHARGING_MIN, CHARGING_MAX, TOTAL_TRACK_LENGTH, SPEED_MAX, SPEED_MIN, NORMAL, CHARGING, RECOVERING, STRAIGHTAWAY_LENGTH, TURN_LENGTH, WEATHER_CONDITIONS, TRACK_CONDITIONS, PIG_NAMES, AGILITY_MIN, AGILITY_MAX
-from functools import partial
+from analytic_odds import analytic_probabilities
+from batch_engine import FieldRace
+from constants import RECORDING_DIR, LARGE_FIELD_SIZE, LIVE_ODDS_INTERVAL, PARIMUTUEL, CROWD_WAGERS, CROWD_BATCH, CROWD_INTERVAL, THREAD_STOP_TIMEOUT
+from exotics import ExoticPrices
+from instrumentation import fields
+import instrumentation
+from live_odds import live_probabilities
+from odds_engine import estimate_probabilities, stat_lines
+from parimutuel import ParimutuelPools, crowd_wagers
+from pig import PigPool
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal, QObject
+from race_engine import TICK_SECONDS, Race, Racer, new_seed
+from race_recording import LiveTape, RaceRecorder, RaceTape
+from settlement import BET_TYPES
 import logging
-from pig import Pig
-from PyQt5.QtWidgets import (
-    QApplication,
-    QMainWindow,
-    QWidget,
-    QVBoxLayout,
-    QHBoxLayout,
-    QPushButton,
-    QLabel,
-    QProgressBar )
-from PyQt5.QtCore import QThread, pyqtSignal, QObject, QTimer
-import random
-import sys
+import numpy as np
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class RaceScheduler(QObject):
+    # Plays a race back from one worker thread. The race is simulated to the finish up front
+    # (or comes ready-made from a recording), so presenting it is just a playback clock: every
+    # dt of real time the clock moves on by dt times the playback rate and the GUI thread is
+    # handed the RaceFrame showing at that moment. The simulation costs the same at any rate,
+    # and a late wake-up simply lands further along the tape instead of falling behind.
+    # The scheduler and its thread last as long as the RaceController; each race is queued to
+    # play() under the id the controller gave it, and a race whose id is no longer current
+    # (see stop) stops playing, or never starts.
+    frame = pyqtSignal(int, object)
+
+    def __init__(self, dt=TICK_SECONDS):
+        super().__init__()
+        self.dt = dt
+        self.rate = 1
+        self.race_id = None
+        self.tape = None
+        self._skip = False
+        self._wake_event = threading.Event()
+        # Clear from when a race is queued until its play() returns
+        self.idle = threading.Event()
+        self.idle.set()
+
+    def queue(self, race_id, rate):
+        # Called on the GUI thread just before the race is queued to play()
+        self.race_id = race_id
+        self.rate = rate
+        self._skip = False
+        self.idle.clear()
+
+    def play(self, race_id, race, tape):
+        try:
+            if race_id == self.race_id:
+                self.run(race_id, race, tape)
+        finally:
+            self.idle.set()
+
+    def run(self, race_id, race, tape):
+        if tape is None:
+            tape = RaceTape.from_race(race, self.dt)
+        self.tape = tape
+        playback_clock = 0.0
+        last_clock = None
+        now = time.monotonic()
+        next_wake = now
+        while self.race_id == race_id:
+            previous, now = now, time.monotonic()
+            # How far past its due time this wake-up came
+            instrumentation.observe("tick.scheduler.late", max(now - next_wake, 0))
+            playback_clock += (now - previous) * self.rate
+            if self._skip:
+                playback_clock = tape.duration
+            frame = tape.frame_at(min(playback_clock, tape.duration))
+            if frame.clock != last_clock:
+                last_clock = frame.clock
+                instrumentation.count("signal.frame.emitted")
+                self.frame.emit(race_id, frame)
+            # A live tape's duration is only known once its race has finished
+            if playback_clock >= tape.duration:
+                break
+            next_wake = max(next_wake + self.dt, now)
+            # Sleep until the next frame is due; stop() and skip_to_finish() cut the wait short
+            if self._wake_event.wait(max(next_wake - time.monotonic(), 0)):
+                self._wake_event.clear()
+
+    def set_rate(self, rate):
+        # Takes effect from the next wake-up; the clock never jumps backwards
+        self.rate = rate
+
+    def skip_to_finish(self):
+        self._skip = True
+        self._wake_event.set()
+
+    def stop(self):
+        self.race_id = None
+        self._wake_event.set()
+
+
+class OddsWorker(QObject):
+    # Runs the Monte Carlo odds off the GUI thread; the simulations themselves go to the process pool
+    finished = pyqtSignal(int, object)
+
+    def __init__(self):
+        super().__init__()
+        self.race_id = None
+
+    def price(self, race_id, racers, weather_condition, track_condition, seed):
+        # A field that was replaced while it waited its turn is not worth pricing
+        if race_id != self.race_id:
+            return
+        with instrumentation.span("odds.simulated"):
+            estimate = estimate_probabilities(racers, weather_condition, track_condition, seed=seed)
+        instrumentation.count("signal.odds.emitted")
+        self.finished.emit(race_id, estimate)
+
+
+class LiveOddsWorker(QObject):
+    # Prices the race as it plays, from its own copy of the race rebuilt from the seed. Every
+    # LIVE_ODDS_INTERVAL it moves the copy up to the clock playback has reached and simulates
+    # the rest of the race from there (see live_odds). The GUI thread only ever sets the clock,
+    # so neither the scheduler nor the display waits on it. Like the scheduler, it lasts as
+    # long as the controller and prices whichever race id is current.
+    odds = pyqtSignal(int, object)
+
+    def __init__(self, dt=TICK_SECONDS):
+        super().__init__()
+        self.dt = dt
+        self.clock = 0.0
+        self.race_id = None
+        self._wake_event = threading.Event()
+
+    def queue(self, race_id):
+        self.race_id = race_id
+        self.clock = 0.0
+
+    def set_clock(self, clock):
+        self.clock = clock
+
+    def run(self, race_id, race):
+        dt = self.dt
+        race.start()
+        priced_clock = None
+        next_wake = time.monotonic()
+        while self.race_id == race_id:
+            instrumentation.observe("tick.live_odds.late", max(time.monotonic() - next_wake, 0))
+            while not race.finished and race.clock + dt <= self.clock + 1e-9:
+                race.step(dt)
+            if race.finished:
+                break
+            if race.clock != priced_clock:
+                priced_clock = race.clock
+                # Seeded by the tick, so a replay shows the same odds at the same moments
+                with instrumentation.span("odds.live"):
+                    estimate = live_probabilities(race, seed=[race.seed, 3, round(race.clock / dt)], dt=dt)
+                if self.race_id == race_id:
+                    instrumentation.count("signal.live_odds.emitted")
+                    self.odds.emit(race_id, estimate)
+            next_wake = max(next_wake + LIVE_ODDS_INTERVAL, time.monotonic())
+            if self._wake_event.wait(max(next_wake - time.monotonic(), 0)):
+                self._wake_event.clear()
+
+    def stop(self):
+        self.race_id = None
+        self._wake_event.set()
+
 
 class RaceController(QObject):
+    # Qt adapter over race_engine.Race: owns the scheduler thread and turns its frames into signals
     race_finished = pyqtSignal()
     update_race_recap_signal = pyqtSignal(list)
-    def __init__(self):
+    odds_updated = pyqtSignal()
+    frame_updated = pyqtSignal(object)
+    pig_finished = pyqtSignal(str, float)
+    pools_updated = pyqtSignal()
+    pools_settled = pyqtSignal(object)
+    live_odds_updated = pyqtSignal()
+    play_requested = pyqtSignal(int, object, object)
+    price_requested = pyqtSignal(int, object, object, object, object)
+    live_odds_requested = pyqtSignal(int, object)
+    PLAYER_BETTOR = 0  # The player's bettor id in the pools; the crowd's ids follow
+    def __init__(self, seed=None, tape=None, num_pigs=None, parimutuel=PARIMUTUEL, form_db=None):
         super().__init__()
-        num_pigs = random.randint(5, 10)
-        self.pigs = [Pig(name.replace(' ', '') + (str(random.randint(1, 9999)) if random.random() < 0.03 else '')) for name in random.sample(PIG_NAMES, num_pigs)]
-        self.threads = []
+        # One controller runs race after race (see new_race). Its worker threads, timer,
+        # signal connections and pig objects are made once here and reused by every race.
+        self.num_pigs = num_pigs
+        self.parimutuel = parimutuel
+        self.form_db = form_db
+        self.playback_rate = 1
+        self.pig_pool = PigPool()
+        self.race_id = 0  # Tells each race's frames and odds from a previous race's stragglers
+        self.pigs = []
         self.race_results = []
-        self._race_started = False
-        self._race_finished = False
+        self.crowd_timer = QTimer(self)
+        self.crowd_timer.timeout.connect(self.feed_crowd)
+        self.scheduler, self.scheduler_thread = self.start_worker(RaceScheduler())
+        self.scheduler.frame.connect(self.handle_frame)
+        self.play_requested.connect(self.scheduler.play)
+        self.odds_worker, self.odds_thread = self.start_worker(OddsWorker())
+        self.odds_worker.finished.connect(self.apply_odds)
+        self.price_requested.connect(self.odds_worker.price)
+        self.live_odds_worker, self.live_odds_thread = self.start_worker(LiveOddsWorker())
+        self.live_odds_worker.odds.connect(self.apply_live_odds)
+        self.live_odds_requested.connect(self.live_odds_worker.run)
+        self.new_race(seed, tape)
+
+    def start_worker(self, worker):
+        thread = QThread()
+        thread.setObjectName(type(worker).__name__)
+        worker.moveToThread(thread)
+        thread.start()
+        return worker, thread
+
+    def new_race(self, seed=None, tape=None):
+        # Everything about the race follows from its seed (and field size), so any race can be
+        # replayed exactly. A tape (such as a race_recording.RaceRecording of this seed) is
+        # played back as is instead of being simulated again. Large fields run on the
+        # array-backed FieldRace, which gives the same results. With a form database, pigs
+        # already on its roster run with their roster stats. The pigs are the last race's,
+        # redrawn (see pig.PigPool).
+        self.clean_up()
+        self.race_id += 1
+        race_class = FieldRace if self.num_pigs is not None and self.num_pigs > LARGE_FIELD_SIZE else Race
+        self.race = race_class.from_seed(seed if seed is not None else new_seed(), num_pigs=self.num_pigs, racer_factory=self.roster(self.pig_pool))
+        self.tape = tape
+        self.seed = self.race.seed
+        self.pigs = self.race.racers
+        self.frame = self.race.snapshot()
+        self.live_odds = None  # Each pig's in-running Win odds, once the race is off
+        self.exotic_prices = None  # Exacta, Quinella and Trifecta prices, set with the odds
+        # In parimutuel mode Win, Place and Show bets go into pools shared with a simulated crowd
+        self.pools = ParimutuelPools(len(self.pigs)) if self.parimutuel else None
+        self.crowd = None
+        self.crowd_placed = 0
+        self.weather_condition = self.race.weather_condition
+        self.track_condition = self.race.track_condition
+        log.info("New race", extra=fields(seed=self.seed, weather=self.weather_condition[0], track=self.track_condition[0], pigs=len(self.pigs)))
+
+    def request_odds(self):
+        # Price the field in the background; odds_updated fires once the simulated odds are in.
+        # The worker prices a copy of the stats, as these pigs go back to the pool with the race.
+        self.odds_worker.race_id = self.race_id
+        self.price_requested.emit(self.race_id, stat_lines(self.pigs), self.weather_condition, self.track_condition, self.seed)
+
+    def apply_odds(self, race_id, estimate):
+        # Odds are frozen once the race is off
+        instrumentation.count("signal.odds.handled")
+        if race_id != self.race_id or self._race_started:
+            return
+        self.set_odds(estimate)
+        log.info("Simulated odds", extra=fields(samples=estimate.samples, seconds=f"{estimate.elapsed:.2f}"))
+        self.odds_updated.emit()
+
+    def estimate_odds(self):
+        # Closed-form odds, there the moment the field is; request_odds replaces them with
+        # the simulated ones when those come back
+        estimate = analytic_probabilities(self.pigs, self.weather_condition, self.track_condition)
+        self.set_odds(estimate)
+        log.debug("Analytic odds", extra=fields(ms=f"{estimate.elapsed * 1000:.2f}"))
+
+    def set_odds(self, estimate):
+        self.exotic_prices = ExoticPrices(estimate.p_win, estimate.trifectas)
+        if self.pools is not None and self.crowd is None:
+            self.open_pools(estimate)
+        odds = {bet_type: estimate.odds(bet_type) for bet_type in BET_TYPES}
+        for i, pig in enumerate(self.pigs):
+            pig.bet_odds = {bet_type: bet_type_odds[i] for bet_type, bet_type_odds in odds.items()}
+            pig.odds = pig.bet_odds["Win"]
+            pig.win_probability = estimate.p_win[i]
+            pig.place_probability = estimate.p_place[i]
+            pig.show_probability = estimate.p_show[i]
+
+    def open_pools(self, estimate):
+        # The crowd bets on the first odds there are. Its wagers are drawn up front and fed
+        # into the pools a batch at a time, so the pool odds move while the player chooses.
+        rng = np.random.default_rng([self.seed, len(self.pigs)])
+        self.crowd = crowd_wagers(CROWD_WAGERS, estimate.p_win, estimate.p_place, estimate.p_show, rng, first_bettor=self.PLAYER_BETTOR + 1)
+        self.crowd_placed = 0
+        self.crowd_timer.start(CROWD_INTERVAL)
+
+    def feed_crowd(self, batch=CROWD_BATCH):
+        start = self.crowd_placed
+        self.crowd_placed = min(start + batch, CROWD_WAGERS)
+        self.pools.place_many(*(column[start:self.crowd_placed] for column in self.crowd))
+        if self.crowd_placed == CROWD_WAGERS:
+            self.crowd_timer.stop()
+        self.pools_updated.emit()
+
+    def place_wager(self, bet_type, lane, amount):
+        # The player's Win/Place/Show bet in parimutuel mode; returns the ticket number
+        return self.pools.place(self.PLAYER_BETTOR, bet_type, lane, amount)
+
+    def close_pools(self):
+        # Betting closes at the off; whatever the crowd still had to bet goes in first
+        self.crowd_timer.stop()
+        if self.crowd is not None and self.crowd_placed < CROWD_WAGERS:
+            self.feed_crowd(CROWD_WAGERS)
+        self.pools.close()
 
-        weather_weights = self.generate_weights(len(WEATHER_CONDITIONS))
-        track_weights = self.generate_weights(len(TRACK_CONDITIONS))
-        random_weather_key = self.weighted_choice(WEATHER_CONDITIONS, weather_weights)
-        random_track_key = self.weighted_choice(TRACK_CONDITIONS, track_weights)
-        self.weather_condition = (random_weather_key, WEATHER_CONDITIONS[random_weather_key])
-        self.track_condition = (random_track_key, TRACK_CONDITIONS[random_track_key])
-        print("Selected Weather Condition:", self.weather_condition)
-        print("Selected Track Condition:", self.track_condition)
-
-    def weighted_choice(self, options, weights):
-        keys = list(options.keys())
-        return random.choices(keys, weights=weights, k=1)[0]
-    
-    def generate_weights(self, num_items):
-        return [0.9 - (i * (0.6 / (num_items - 1))) for i in range(num_items)]
-    
     def start_race(self):
         self._race_started = True
-        print(f"Race started with weather: {self.weather_condition[0]} and track: {self.track_condition[0]}")
-        for pig in self.pigs:
-            pig_thread = QThread()
-            pig.moveToThread(pig_thread)
-            pig_thread.started.connect(partial(pig.run, self.weather_condition, self.track_condition))
-            pig.finished.connect(self.check_finish)
-            pig.finished.connect(pig_thread.quit)
-            self.threads.append(pig_thread)
-            pig_thread.start()
-            pig.state = 'CHARGING'
-
-    def check_finish(self, name, time):
-        # Find the pig object by name
-        pig = next((p for p in self.pigs if p.name == name), None)
-        if pig:
-            if len(self.race_results) < 3:
-                self.race_results.append(pig)
-                self.update_race_recap_signal.emit(self.race_results)
-                if all(pig.time is not None for pig in self.pigs):
-                    self._race_finished = True
-                    self.race_finished.emit()
+        if self.pools is not None:
+            self.close_pools()
+        log.info("Race started", extra=fields(seed=self.seed, weather=self.weather_condition[0], track=self.track_condition[0], rate=self.playback_rate))
+        tape = self.tape
+        if tape is None and len(self.pigs) > LARGE_FIELD_SIZE:
+            # Too many frames to keep; simulate the race as it plays instead
+            recorder = RaceRecorder(self.recording_path(), self.race) if RECORDING_DIR else None
+            tape = LiveTape(self.race, recorder=recorder)
+        self.scheduler.queue(self.race_id, self.playback_rate)
+        self.play_requested.emit(self.race_id, self.race, tape)
+        if len(self.pigs) <= LARGE_FIELD_SIZE:
+            self.start_live_odds()
+
+    def start_live_odds(self):
+        # In-running odds for the lanes view. Large fields keep their starting odds: a thousand
+        # pigs can't be priced afresh several times a second.
+        self.live_odds_worker.queue(self.race_id)
+        self.live_odds_requested.emit(self.race_id, Race.from_seed(self.seed, num_pigs=len(self.pigs), racer_factory=self.roster(Racer)))
+
+    def roster(self, racer_factory):
+        return self.form_db.roster_factory(racer_factory) if self.form_db is not None else racer_factory
+
+    def apply_live_odds(self, race_id, estimate):
+        # The bets are settled at the odds they were struck at; these are only shown
+        instrumentation.count("signal.live_odds.handled")
+        if race_id != self.race_id or self._race_finished:
+            return
+        self.live_odds = estimate.odds()
+        self.live_odds_updated.emit()
+
+    def stop_live_odds(self):
+        # Its thread carries on; it gives up the race within a pricing
+        self.live_odds_worker.stop()
+
+    def handle_frame(self, race_id, frame):
+        # Runs on the GUI thread, once per scheduler tick. The GUI only ever looks at frames,
+        # never at the pigs the scheduler is busy moving.
+        instrumentation.count("signal.frame.handled")
+        instrumentation.sample_threads()
+        if race_id != self.race_id:
+            return
+        finished_before = len(self.frame.finish_order)
+        self.frame = frame
+        self.live_odds_worker.set_clock(frame.clock)
+        self.frame_updated.emit(frame)
+        for lane in frame.finish_order[finished_before:]:
+            pig = self.pigs[lane]
+            # A replayed tape never ran the pigs, so their times come from the frames
+            pig.time = frame.finish_times[lane]
+            self.pig_finished.emit(pig.name, frame.finish_times[lane])
+            self.check_finish(pig)
+        if not self._race_finished and len(frame.finish_order) == len(self.pigs):
+            self._race_finished = True
+            self.stop_live_odds()
+            self.save_recording()
+            if self.form_db is not None and self.tape is None:
+                # Written off the GUI thread. form_db (and sqlite3) is only loaded by a
+                # window that keeps form.
+                from form_db import race_record
+                self.form_db.record_race(race_record(self.race, frame))
+            if self.pools is not None:
+                # Every ticket in one pass
+                self.pools_settled.emit(self.pools.settle(frame.finish_order))
+            self.race_finished.emit()
+
+    def check_finish(self, pig):
+        if len(self.race_results) < 3:
+            self.race_results.append(pig)
+            self.update_race_recap_signal.emit(self.race_results)
+
+    def set_playback_rate(self, rate):
+        self.playback_rate = rate
+        self.scheduler.set_rate(rate)
+
+    def skip_to_finish(self):
+        self.scheduler.skip_to_finish()
+
+    def save_recording(self):
+        # Only races simulated here are recorded; a replayed tape is a recording already
+        if not RECORDING_DIR or self.tape is not None:
+            return
+        tape = self.scheduler.tape
+        if isinstance(tape, LiveTape):
+            # Recorded as it played
+            tape.close()
         else:
-            print(f"Pig with name {name} not found.")
+            tape.save(self.recording_path(), self.race)
+        log.info("Race recorded", extra=fields(path=self.recording_path()))
+
+    def recording_path(self):
+        os.makedirs(RECORDING_DIR, exist_ok=True)
+        return os.path.join(RECORDING_DIR, f"{self.seed}.pigr")
 
     def clean_up(self):
-        for thread in self.threads:
-            thread.quit()
-            thread.wait()
-        self.pigs.clear()
-        self.threads.clear()
+        # Ends the current race, whatever it has running, and hands its pigs back to the pool.
+        # The worker threads stay up for the next race.
+        self.crowd_timer.stop()
+        self.scheduler.stop()
+        # Back within a tick; from here on nothing moves the pigs. A scheduler that doesn't
+        # come back has its race's pigs left to it, so it can't move the next field.
+        stopped = self.scheduler.idle.wait(THREAD_STOP_TIMEOUT)
+        if not stopped:
+            log.error("Scheduler did not stop", extra=fields(race_id=self.race_id, timeout=THREAD_STOP_TIMEOUT))
+        if isinstance(self.scheduler.tape, LiveTape) and stopped:
+            self.scheduler.tape.close()
+        self.scheduler.tape = None
+        self.stop_live_odds()
+        if stopped:
+            self.pig_pool.release(self.pigs)
+        self.pigs = []
         self._race_started = False
         self._race_finished = False
         self.race_results.clear()
+
+    def shutdown(self):
+        # For good, when the window closes. The odds worker may still be finishing a field,
+        # which the odds time budget bounds.
+        self.clean_up()
+        for thread in (self.scheduler_thread, self.odds_thread, self.live_odds_thread):
+            thread.quit()
+            if not thread.wait(int(THREAD_STOP_TIMEOUT * 1000)):
+                log.error("Worker thread did not stop", extra=fields(thread=thread.objectName(), timeout=THREAD_STOP_TIMEOUT))
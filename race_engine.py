@@ -0,0 +1,306 @@
+from constants import SPEED_WEIGHT, ENDURANCE_WEIGHT, AGILITY_WEIGHT, ENERGY_WEIGHT, SPIRIT_WEIGHT, VIGOR_WEIGHT, ENERGY_MIN, ENERGY_MAX, END_MIN, END_MAX, VIG_MIN, VIG_MAX, CHARGING_MIN, CHARGING_MAX, SPEED_MAX, SPEED_MIN, NORMAL, CHARGING, RECOVERING, WEATHER_CONDITIONS, TRACK_CONDITIONS, AGILITY_MIN, AGILITY_MAX, FIELD_SIZE_MIN, FIELD_SIZE_MAX, TURN_PENALTY
+from collections import namedtuple
+import random
+from track import SEGMENT_ENDS, segment_speeds
+
+# Pure-Python simulation core. Nothing in here may import PyQt5, so races can be
+# simulated headless (batch jobs, worker processes) as fast as the CPU allows.
+
+TICK_SECONDS = 0.1  # The simulation step the real-time race has always used
+SEED_LIMIT = 2 ** 63  # Race seeds are drawn from [0, SEED_LIMIT)
+
+# Immutable picture of a race at one instant. Everything is indexed by lane (a pig's index
+# in Race.racers): distances, states and finish_times (None until the pig crosses the line)
+# per lane, order is the lanes in current standings order and finish_order the lanes that
+# have finished, winner first.
+RaceFrame = namedtuple('RaceFrame', ['clock', 'distances', 'states', 'order', 'finish_order', 'finish_times'])
+# Everything a race needs to carry on from one instant, per lane: a RaceFrame shows the race,
+# a RaceState is enough to fork it (see BatchRace.restore). Timers are as in Racer.
+RaceState = namedtuple('RaceState', ['clock', 'distances', 'segments', 'states', 'state_timers', 'charge_check_timers', 'finish_times'])
+
+
+class Racer:
+    # Stats and race state of a single pig, with no Qt dependencies. Stats are drawn from
+    # rng (the global random module if none is given); the charge rolls during a race come
+    # from the pig's own stream, which Race.start seeds from the race seed.
+    def __init__(self, name=None, rng=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = random.Random()
+        self.redraw(name, rng)
+
+    def redraw(self, name=None, rng=None):
+        # Turns this racer into a new pig: a name, freshly drawn stats and a clean slate. The
+        # draws are the same as a new Racer's, so a reused racer runs the same race.
+        rng = rng if rng is not None else random
+        self.name = name
+        self.is_selected = False
+        self.agility = rng.uniform(AGILITY_MIN, AGILITY_MAX)
+        self.top_speed = rng.uniform(SPEED_MIN, SPEED_MAX)  # Top speed in km/h
+        self.display_speed = self.top_speed
+        self.endurance = rng.uniform(END_MIN, END_MAX)  # Time in seconds the pig can maintain CHARGING, higher = better
+        self.vigor = rng.uniform(VIG_MIN, VIG_MAX)  # Time in seconds the pig is in RECOVERING, lower = better
+        self.spirit = rng.uniform(CHARGING_MIN, CHARGING_MAX)  # Chance to go into CHARGING state, higher = better
+        self.energy = rng.uniform(ENERGY_MIN, ENERGY_MAX) # Time in between charge checks, lower = better
+        self.segment_speeds = ()  # Cruising speed per track segment, set by Race.start
+        self.calculate_performance_level()
+        self.odds = 0  # Win odds
+        self.bet_odds = {}  # Odds per straight bet type, filled in by the odds engine
+        self.win_probability = None  # Filled in by the odds engine
+        self.place_probability = None
+        self.show_probability = None
+        self.reset()
+
+    def reset(self):
+        # Put the pig back in the starting gate
+        self.distance_covered = 0.0
+        self.segment = 0  # Index into track.SEGMENTS of the segment the pig is on
+        self.running = False
+        self.state = 'READY'  # Current state of the pig: 'CHARGING', 'NORMAL', 'RECOVERING'
+        self.state_timer = 0  # Timer to track how long we've been in the current state
+        self.charge_check_timer = 0  # Milliseconds since the last charge check
+        self.elapsed = 0.0
+        self.time = None  # Finishing time, set when the pig crosses the line
+
+    @property
+    def base_speed_mps(self):
+        return min(((self.top_speed * 1000) / 3600), 60)
+
+    @property
+    def charge_check_interval(self):
+        return self.energy * 100  # Check for charge according to the pig's stat
+
+    @property
+    def crossed_line(self):
+        # Not called finished, which is the name of the Qt Pig's finish signal
+        return self.time is not None
+
+    def step(self, dt):
+        # Advance the pig by one tick of dt seconds. Returns the new state name if the
+        # state changed during this tick, otherwise None.
+        self.state_timer += dt
+        self.charge_check_timer += dt * 1000
+        self.elapsed += dt
+        new_state = None
+        # First set a normal speed multiplier
+        speed_multiplier = NORMAL
+        if self.state == 'READY':
+            self.state = new_state = 'CHARGING'
+            speed_multiplier = CHARGING
+        elif self.state == 'NORMAL' and self.charge_check_timer >= self.charge_check_interval:
+            speed_multiplier = NORMAL
+            self.charge_check_timer = 0  # Reset timer
+            if self.rng.random() < self.spirit:
+                self.state = new_state = 'CHARGING'
+                self.state_timer = 0
+        elif self.state == 'CHARGING':
+            speed_multiplier = CHARGING
+            if self.state_timer >= self.endurance:
+                self.state = new_state = 'RECOVERING'
+                self.state_timer = 0
+        elif self.state == 'RECOVERING':
+            speed_multiplier = RECOVERING
+            if self.state_timer >= self.vigor:
+                self.state = new_state = 'NORMAL'
+                self.state_timer = 0
+        # We should now have the correct speed_multiplier. A pig that reaches the end of its
+        # segment during the tick runs the rest of the tick at the next segment's speed, and
+        # the end of the last segment is the line.
+        remaining = dt
+        while True:
+            actual_speed_mps = self.segment_speeds[self.segment] * speed_multiplier
+            reach = (SEGMENT_ENDS[self.segment] - self.distance_covered) / actual_speed_mps
+            if reach > remaining:
+                self.distance_covered += actual_speed_mps * remaining
+                break
+            self.distance_covered = SEGMENT_ENDS[self.segment]
+            remaining -= reach
+            if self.segment == len(SEGMENT_ENDS) - 1:
+                self.running = False
+                self.time = self.elapsed - remaining
+                break
+            self.segment += 1
+        return new_state
+
+    def get_speed_modifier(self, weather_conditions, track_conditions, is_turn=False):
+        weather_impact = weather_conditions[1]
+        track_impact = track_conditions[1]
+        base_impact = (weather_impact + track_impact) / 2
+        if is_turn:
+            base_impact *= TURN_PENALTY
+        agility_factor = (self.agility - 50) / 50
+        speed_modifier = max(1 - base_impact * (1 - agility_factor), 0.3)  # This ensures the modifier is never below 0.3
+        return speed_modifier
+
+    def stop(self):
+        self.running = False
+
+    def calculate_performance_level(self):
+        normalized_speed = (self.top_speed - SPEED_MIN) / (SPEED_MAX - SPEED_MIN)
+        normalized_agility = (self.agility - AGILITY_MIN) / (AGILITY_MAX - AGILITY_MIN)
+        normalized_endurance = (self.endurance - END_MIN) / (END_MAX - END_MIN)
+        normalized_vigor = (self.vigor - VIG_MIN) / (VIG_MAX - VIG_MIN)
+        normalized_spirit = (self.spirit - CHARGING_MIN) / (CHARGING_MAX - CHARGING_MIN)
+        normalized_energy = (self.energy - ENERGY_MIN) / (ENERGY_MAX - ENERGY_MIN)
+        self.performance_level = (normalized_speed * SPEED_WEIGHT +
+                                  normalized_agility * AGILITY_WEIGHT +
+                                  normalized_endurance * ENDURANCE_WEIGHT +
+                                  normalized_vigor * VIGOR_WEIGHT +
+                                  normalized_spirit * SPIRIT_WEIGHT +
+                                  normalized_energy * ENERGY_WEIGHT)
+
+
+class Race:
+    # A whole field racing under one set of conditions. Drive it with step(dt) from any
+    # clock you like, or call run() to simulate the race to completion at full speed.
+    # Every race has a seed: each start() reseeds every pig's charge rolls from it, so a
+    # race started again runs exactly the same way, and Race.from_seed rebuilds the field
+    # and conditions as well.
+    def __init__(self, racers, weather_condition, track_condition, seed=None):
+        self.racers = racers
+        for lane, racer in enumerate(racers):
+            racer.lane = lane
+        self.weather_condition = weather_condition
+        self.track_condition = track_condition
+        self.seed = seed if seed is not None else new_seed()
+        self.clock = 0.0
+        self.finish_order = []
+        # Speed modifiers only depend on the pig, the conditions and whether it is on a turn,
+        # so they are all worked out here, once per race, and looked up from then on
+        self.speed_modifiers = {}
+        for racer in racers:
+            for is_turn in (False, True):
+                self.speed_modifier(racer, is_turn)
+
+    @classmethod
+    def from_seed(cls, seed, num_pigs=None, weather_condition=None, track_condition=None, racer_factory=None):
+        # The same seed always gives the same field, conditions and charge rolls
+        racers = generate_field(num_pigs, racer_factory=racer_factory or Racer, seed=seed)
+        weather, track = choose_conditions(seeded_rng(seed, 'conditions'))
+        return cls(racers, weather_condition or weather, track_condition or track, seed=seed)
+
+    def start(self):
+        self.clock = 0.0
+        self.finish_order = []
+        for racer in self.racers:
+            racer.reset()
+            racer.rng = seeded_rng(self.seed, 'rolls', racer.lane)
+            # The tick loop only looks speeds up
+            racer.segment_speeds = segment_speeds(racer.base_speed_mps, self.speed_modifier(racer), self.speed_modifier(racer, is_turn=True))
+            racer.running = True
+
+    @property
+    def finished(self):
+        return len(self.finish_order) == len(self.racers)
+
+    def speed_modifier(self, racer, is_turn=False):
+        key = (racer.lane, self.weather_condition, self.track_condition, is_turn)
+        modifier = self.speed_modifiers.get(key)
+        if modifier is None:
+            modifier = self.speed_modifiers[key] = racer.get_speed_modifier(self.weather_condition, self.track_condition, is_turn)
+        return modifier
+
+    def step(self, dt=TICK_SECONDS):
+        # Advance every running pig by dt. Returns (state_changes, finishers) for this tick,
+        # where state_changes is a list of (racer, new_state) and finishers a list of racers.
+        self.clock += dt
+        state_changes = []
+        finishers = []
+        for racer in self.racers:
+            if not racer.running:
+                continue
+            new_state = racer.step(dt)
+            if new_state is not None:
+                state_changes.append((racer, new_state))
+            if racer.crossed_line:
+                finishers.append(racer)
+        # Pigs crossing on the same tick are ordered by when they crossed
+        finishers.sort(key=lambda racer: racer.time)
+        self.finish_order.extend(finishers)
+        return state_changes, finishers
+
+    def run(self, dt=TICK_SECONDS):
+        self.start()
+        while not self.finished:
+            self.step(dt)
+        return self.finish_order
+
+    def results(self):
+        # Plain record of a finished race, seed included, so it can be replayed
+        return {
+            'seed': self.seed,
+            'weather': self.weather_condition[0],
+            'track': self.track_condition[0],
+            'finish_order': [{'name': racer.name, 'lane': racer.lane, 'time': racer.time} for racer in self.finish_order],
+        }
+
+    def snapshot(self):
+        # Copy the race out into a RaceFrame that can safely be handed to another thread
+        finish_order = tuple(racer.lane for racer in self.finish_order)
+        running = sorted((racer for racer in self.racers if not racer.crossed_line), key=lambda racer: racer.distance_covered, reverse=True)
+        return RaceFrame(self.clock,
+                         tuple(racer.distance_covered for racer in self.racers),
+                         tuple(racer.state for racer in self.racers),
+                         finish_order + tuple(racer.lane for racer in running),
+                         finish_order,
+                         tuple(racer.time for racer in self.racers))
+
+    def save_state(self):
+        racers = self.racers
+        return RaceState(self.clock,
+                         tuple(racer.distance_covered for racer in racers),
+                         tuple(racer.segment for racer in racers),
+                         tuple(racer.state for racer in racers),
+                         tuple(racer.state_timer for racer in racers),
+                         tuple(racer.charge_check_timer for racer in racers),
+                         tuple(racer.time for racer in racers))
+
+
+def new_seed():
+    return random.SystemRandom().randrange(SEED_LIMIT)
+
+
+def seeded_rng(seed, *stream):
+    # Independent, reproducible stream for one purpose within a race. Seeding from a
+    # string hashes it with SHA-512, so the stream is the same in every process.
+    return random.Random(':'.join(str(part) for part in (seed,) + stream))
+
+
+def generate_weights(num_items):
+    return [0.9 - (i * (0.6 / (num_items - 1))) for i in range(num_items)]
+
+
+def weighted_choice(options, weights, rng=random):
+    keys = list(options.keys())
+    return rng.choices(keys, weights=weights, k=1)[0]
+
+
+def choose_conditions(rng=random):
+    # Better conditions are listed first and are weighted to come up more often
+    weather_key = weighted_choice(WEATHER_CONDITIONS, generate_weights(len(WEATHER_CONDITIONS)), rng)
+    track_key = weighted_choice(TRACK_CONDITIONS, generate_weights(len(TRACK_CONDITIONS)), rng)
+    return (weather_key, WEATHER_CONDITIONS[weather_key]), (track_key, TRACK_CONDITIONS[track_key])
+
+
+def generate_field(num_pigs=None, racer_factory=Racer, seed=None):
+    # With a seed, the field size and names come from one stream and each pig's stats from
+    # a stream of its own, so the same seed always lines up the same field
+    rng = seeded_rng(seed, 'field') if seed is not None else random
+    # The size is always drawn, so a seed raced at the size it drew lines up the same field
+    # as the seed left to choose, which is how replays give the field size back
+    drawn_size = rng.randint(FIELD_SIZE_MIN, FIELD_SIZE_MAX)
+    num_pigs = drawn_size if num_pigs is None else num_pigs
+    # Loaded on the first field drawn; the odds workers never draw one
+    from pig_names import PIG_NAMES
+    if num_pigs <= len(PIG_NAMES):
+        names = [name.replace(' ', '') + (str(rng.randint(1, 9999)) if rng.random() < 0.03 else '') for name in rng.sample(PIG_NAMES, num_pigs)]
+    else:
+        # More runners than names: names repeat, so every pig carries its lane number
+        names = [name.replace(' ', '') + str(lane + 1) for lane, name in enumerate(rng.choices(PIG_NAMES, k=num_pigs))]
+    return [racer_factory(name, rng=seeded_rng(seed, 'pig', lane) if seed is not None else None) for lane, name in enumerate(names)]
+
+
+def simulate_race(num_pigs=None, weather_condition=None, track_condition=None, dt=TICK_SECONDS, seed=None):
+    # Convenience for headless use: build a field from a seed and run it to the finish
+    race = Race.from_seed(seed if seed is not None else new_seed(), num_pigs, weather_condition, track_condition)
+    race.run(dt)
+    return race
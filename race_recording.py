@@ -0,0 +1,400 @@
+from bisect import bisect_right
+from race_engine import TICK_SECONDS, RaceFrame
+import math
+import mmap
+import struct
+
+# Compact on-disk race recordings.
+#
+# A recording is a header (seed, tick length, conditions and the whole field with its stats)
+# followed by one record per recorded tick and, at the end, an index of keyframes:
+#
+#   keyframe  b'K' tick:u32 then, per lane, distance in mm (varint) and state code (u8),
+#             then the finishers so far: count (varint) and lane (varint) + time (f64) each
+#   delta     b'D' ticks since the previous record (varint), per lane the mm gained since
+#             the previous record (varint), then the state changes: count (varint) and
+#             lane (varint) + state code (u8) each, then the new finishers as above
+#   index     count (u32) then tick:u32 offset:u64 per keyframe
+#   footer    index offset (u64) and FOOTER_MAGIC
+#
+# Distances only ever grow, so the deltas are small non-negative varints, usually a byte or
+# two per pig per tick. Seeking bisects the keyframe index for the last keyframe at or before
+# the wanted tick and decodes at most one keyframe interval of deltas from there, reading
+# straight out of a memory-mapped file.
+
+MAGIC = b'PIGR'
+FOOTER_MAGIC = b'PIGX'
+VERSION = 1
+KEYFRAME_INTERVAL = 50  # ticks between keyframes, 5 seconds of race
+STATE_NAMES = ('READY', 'CHARGING', 'NORMAL', 'RECOVERING')
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+STATS = ('top_speed', 'agility', 'endurance', 'vigor', 'spirit', 'energy')
+
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_F64 = struct.Struct('<d')
+_INDEX_ENTRY = struct.Struct('<IQ')
+_FOOTER = struct.Struct('<Q4s')
+
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def write_string(buffer, text):
+    encoded = text.encode('utf-8')
+    buffer += _U16.pack(len(encoded))
+    buffer += encoded
+
+
+def read_string(data, offset):
+    (length,) = _U16.unpack_from(data, offset)
+    offset += _U16.size
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+
+class RaceRecorder:
+    # Streams a race to disk tick by tick. Feed it RaceFrames (from Race.snapshot or the
+    # scheduler) in order; frames may skip ticks. Use as a context manager or call close().
+    def __init__(self, path, race, dt=TICK_SECONDS, keyframe_interval=KEYFRAME_INTERVAL):
+        self.file = open(path, 'wb')
+        self.dt = dt
+        self.keyframe_interval = keyframe_interval
+        self.num_lanes = len(race.racers)
+        self.index = []
+        self.last_tick = None
+        self.last_keyframe_tick = None
+        self.last_mm = None
+        self.last_states = None
+        self.finished = 0
+        self.write_header(race)
+
+    def write_header(self, race):
+        header = bytearray(MAGIC)
+        header += _U16.pack(VERSION)
+        header += _U64.pack(race.seed)
+        header += _F64.pack(self.dt)
+        header += _U16.pack(self.keyframe_interval)
+        for name, impact in (race.weather_condition, race.track_condition):
+            write_string(header, name)
+            header += _F64.pack(impact)
+        header += _U16.pack(self.num_lanes)
+        for racer in race.racers:
+            write_string(header, racer.name)
+            for stat in STATS:
+                header += _F64.pack(getattr(racer, stat))
+        self.file.write(header)
+
+    def record(self, frame):
+        tick = int(round(frame.clock / self.dt))
+        mm = [int(round(distance * 1000)) for distance in frame.distances]
+        states = [STATE_CODES[state] for state in frame.states]
+        record = bytearray()
+        if self.last_tick is None or tick - self.last_keyframe_tick >= self.keyframe_interval:
+            self.index.append((tick, self.file.tell()))
+            self.last_keyframe_tick = tick
+            record += b'K'
+            record += _U32.pack(tick)
+            for lane in range(self.num_lanes):
+                write_varint(record, mm[lane])
+                record.append(states[lane])
+            self.write_finishers(record, frame, 0)
+        else:
+            record += b'D'
+            write_varint(record, tick - self.last_tick)
+            for lane in range(self.num_lanes):
+                write_varint(record, mm[lane] - self.last_mm[lane])
+            changes = [lane for lane in range(self.num_lanes) if states[lane] != self.last_states[lane]]
+            write_varint(record, len(changes))
+            for lane in changes:
+                write_varint(record, lane)
+                record.append(states[lane])
+            self.write_finishers(record, frame, self.finished)
+        self.file.write(record)
+        self.last_tick = tick
+        self.last_mm = mm
+        self.last_states = states
+        self.finished = len(frame.finish_order)
+
+    def write_finishers(self, record, frame, already_written):
+        finishers = frame.finish_order[already_written:]
+        write_varint(record, len(finishers))
+        for lane in finishers:
+            write_varint(record, lane)
+            record += _F64.pack(frame.finish_times[lane])
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        footer = bytearray(_U32.pack(len(self.index)))
+        for tick, offset in self.index:
+            footer += _INDEX_ENTRY.pack(tick, offset)
+        footer += _FOOTER.pack(index_offset, FOOTER_MAGIC)
+        self.file.write(footer)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RaceRecording:
+    # Read side of a recording, memory-mapped so a replay only touches the pages it shows
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.read_header()
+        self.read_index()
+        self.duration = self.read_duration()
+
+    def read_header(self):
+        data = self.data
+        if data[:4] != MAGIC:
+            raise ValueError("Not a race recording")
+        offset = 4
+        (version,) = _U16.unpack_from(data, offset)
+        if version != VERSION:
+            raise ValueError(f"Unsupported race recording version {version}")
+        offset += _U16.size
+        (self.seed,) = _U64.unpack_from(data, offset)
+        offset += _U64.size
+        (self.dt,) = _F64.unpack_from(data, offset)
+        offset += _F64.size
+        (self.keyframe_interval,) = _U16.unpack_from(data, offset)
+        offset += _U16.size
+        conditions = []
+        for _ in range(2):
+            name, offset = read_string(data, offset)
+            (impact,) = _F64.unpack_from(data, offset)
+            offset += _F64.size
+            conditions.append((name, impact))
+        self.weather_condition, self.track_condition = conditions
+        (num_lanes,) = _U16.unpack_from(data, offset)
+        offset += _U16.size
+        self.field = []
+        for _ in range(num_lanes):
+            name, offset = read_string(data, offset)
+            stats = {'name': name}
+            for stat in STATS:
+                (stats[stat],) = _F64.unpack_from(data, offset)
+                offset += _F64.size
+            self.field.append(stats)
+        self.num_lanes = num_lanes
+        self.body_offset = offset
+
+    def read_index(self):
+        data = self.data
+        index_offset, magic = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            raise ValueError("Race recording was not closed properly")
+        (count,) = _U32.unpack_from(data, index_offset)
+        entries = [_INDEX_ENTRY.unpack_from(data, index_offset + _U32.size + i * _INDEX_ENTRY.size) for i in range(count)]
+        self.keyframe_ticks = [tick for tick, _ in entries]
+        self.keyframe_offsets = [offset for _, offset in entries]
+        self.body_end = index_offset
+
+    def read_duration(self):
+        # The clock of the last frame, decoded once from the last keyframe on, as the file
+        # never changes once it is closed
+        last = None
+        for last in self.frames(self.keyframe_ticks[-1] * self.dt):
+            pass
+        return last.clock if last is not None else 0.0
+
+    def frame_at(self, seconds):
+        # The race as it stood at the given time: the last recorded tick at or before it
+        tick = int(math.floor(seconds / self.dt + 1e-9))
+        position = max(bisect_right(self.keyframe_ticks, tick) - 1, 0)
+        frame = None
+        for record_tick, state in self.decode(self.keyframe_offsets[position]):
+            if record_tick > tick and frame is not None:
+                break
+            frame = self.to_frame(record_tick, state)
+        return frame
+
+    def frames(self, start=0.0):
+        # Every recorded frame from the given time to the end of the race, decoded lazily
+        tick = int(math.floor(start / self.dt + 1e-9))
+        position = max(bisect_right(self.keyframe_ticks, tick) - 1, 0)
+        previous = None
+        for record_tick, state in self.decode(self.keyframe_offsets[position]):
+            if record_tick < tick:
+                # Built now, as decode reuses the state's lists for the next record
+                previous = self.to_frame(record_tick, state)
+                continue
+            if previous is not None and record_tick > tick:
+                # Start from the frame that was showing at the requested time
+                yield previous
+            previous = None
+            yield self.to_frame(record_tick, state)
+
+    def decode(self, offset):
+        # Walk the records from a keyframe offset, yielding (tick, (mm, states, finish_order,
+        # finish_times)). The lists are reused between records, so copy what you keep.
+        data = self.data
+        num_lanes = self.num_lanes
+        mm = [0] * num_lanes
+        states = [0] * num_lanes
+        finish_order = []
+        finish_times = [None] * num_lanes
+        tick = 0
+        while offset < self.body_end:
+            kind = data[offset:offset + 1]
+            offset += 1
+            if kind == b'K':
+                (tick,) = _U32.unpack_from(data, offset)
+                offset += _U32.size
+                for lane in range(num_lanes):
+                    mm[lane], offset = read_varint(data, offset)
+                    states[lane] = data[offset]
+                    offset += 1
+                finish_order.clear()
+                finish_times = [None] * num_lanes
+            else:
+                step, offset = read_varint(data, offset)
+                tick += step
+                for lane in range(num_lanes):
+                    gained, offset = read_varint(data, offset)
+                    mm[lane] += gained
+                changes, offset = read_varint(data, offset)
+                for _ in range(changes):
+                    lane, offset = read_varint(data, offset)
+                    states[lane] = data[offset]
+                    offset += 1
+            finishers, offset = read_varint(data, offset)
+            for _ in range(finishers):
+                lane, offset = read_varint(data, offset)
+                (finish_times[lane],) = _F64.unpack_from(data, offset)
+                offset += _F64.size
+                finish_order.append(lane)
+            yield tick, (mm, states, finish_order, finish_times)
+
+    def to_frame(self, tick, state):
+        mm, states, finish_order, finish_times = state
+        distances = tuple(value / 1000 for value in mm)
+        finished = set(finish_order)
+        running = sorted((lane for lane in range(self.num_lanes) if lane not in finished), key=lambda lane: distances[lane], reverse=True)
+        return RaceFrame(tick * self.dt, distances, tuple(STATE_NAMES[code] for code in states),
+                         tuple(finish_order) + tuple(running), tuple(finish_order), tuple(finish_times))
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RaceTape:
+    # In-memory counterpart of RaceRecording: every frame of a race, computed ahead so it can
+    # be played back at any speed, with the same frame_at / frames / duration interface
+    def __init__(self, frames):
+        self.frame_list = list(frames)
+        self.clocks = [frame.clock for frame in self.frame_list]
+
+    @classmethod
+    def from_race(cls, race, dt=TICK_SECONDS):
+        race.start()
+        frames = [race.snapshot()]
+        while not race.finished:
+            race.step(dt)
+            frames.append(race.snapshot())
+        return cls(frames)
+
+    @property
+    def duration(self):
+        return self.clocks[-1]
+
+    def frame_at(self, seconds):
+        return self.frame_list[max(bisect_right(self.clocks, seconds + 1e-9) - 1, 0)]
+
+    def frames(self, start=0.0):
+        first = max(bisect_right(self.clocks, start + 1e-9) - 1, 0)
+        return iter(self.frame_list[first:])
+
+    def save(self, path, race, dt=TICK_SECONDS, keyframe_interval=KEYFRAME_INTERVAL):
+        with RaceRecorder(path, race, dt, keyframe_interval) as recorder:
+            for frame in self.frame_list:
+                recorder.record(frame)
+
+
+class LiveTape:
+    # Tape for fields too big to keep every frame of: the race is simulated as it is played,
+    # and only the latest frame is held, so memory stays flat however big the field or long
+    # the race. Playback can only go forwards. Frames can be recorded on the way past.
+    def __init__(self, race, dt=TICK_SECONDS, recorder=None):
+        self.race = race
+        self.dt = dt
+        self.recorder = recorder
+        race.start()
+        self.frame = race.snapshot()
+        if recorder is not None:
+            recorder.record(self.frame)
+
+    @property
+    def duration(self):
+        return self.race.clock if self.race.finished else math.inf
+
+    def frame_at(self, seconds):
+        race = self.race
+        stepped = False
+        while not race.finished and race.clock + self.dt <= seconds + 1e-9:
+            race.step(self.dt)
+            stepped = True
+            if self.recorder is not None:
+                self.frame = race.snapshot()
+                self.recorder.record(self.frame)
+        if stepped and self.recorder is None:
+            # Only the frame actually shown is snapshotted
+            self.frame = race.snapshot()
+        return self.frame
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+def check_seeks(recording):
+    # Seeks to the middle of every gap between recorded frames and checks that frames(t)
+    # starts from the frame frame_at(t) gives; returns the times where they differ
+    clocks = [frame.clock for frame in recording.frames()]
+    mismatches = []
+    for earlier, later in zip(clocks, clocks[1:]):
+        seconds = (earlier + later) / 2
+        if next(recording.frames(seconds)) != recording.frame_at(seconds):
+            mismatches.append(seconds)
+    return mismatches
+
+
+def record_race(race, path, dt=TICK_SECONDS, keyframe_interval=KEYFRAME_INTERVAL):
+    # Run a race from the start, recording every tick, and return its finish order
+    race.start()
+    with RaceRecorder(path, race, dt, keyframe_interval) as recorder:
+        recorder.record(race.snapshot())
+        while not race.finished:
+            race.step(dt)
+            recorder.record(race.snapshot())
+    return race.finish_order
@@ -1,39 +1,37 @@
 from betting import BettingWidget
-from constants import ODDS_MIN, ODDS_MAX, PLAYER_START_BANK, BET_MULTIPLIERS, DEFAULT_BET_SIZE
+from constants import PLAYER_START_BANK, BET_MULTIPLIERS, DEFAULT_BET_SIZE, PLAYBACK_RATES, LARGE_FIELD_SIZE
+from instrumentation import fields
+import instrumentation
+import logging
 from PyQt5.QtWidgets import (
     QWidget,
     QVBoxLayout,
     QHBoxLayout,
     QLabel,
-    QProgressBar,
+    QComboBox,
+    QPushButton,
     QFrame )
-from PyQt5.QtCore import pyqtSignal, QTimer, Qt
-from PyQt5.QtGui import QFont
-
-class ClickableLabel(QLabel):
-    clicked = pyqtSignal(object)  # Signal to emit the pig object
-    def __init__(self, pig, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.pig = pig  # Store a reference to the pig
-        self.setText(self.pig.name)
-        self.setMouseTracking(True)
-        self.setStyleSheet("QLabel { border: 2px solid transparent; }")
-
-    def mousePressEvent(self, event):
-        super().mousePressEvent(event)
-        self.clicked.emit(self.pig)
+from PyQt5.QtCore import pyqtSignal, Qt
+from PyQt5.QtGui import QColor, QFont
+from settlement import BET_TYPES, EXOTIC_LEGS, MIN_BET, PLACE_NAMES, bet_pays, calculate_payout, credit_payout, place_bet, settle_exotic
+from standings import StandingsView
+from track_view import TrackView
 
+log = logging.getLogger(__name__)
 
 class RaceTrackWidget(QWidget):
     race_results_signal = pyqtSignal(str, float)
     def __init__(self, main_window, race_controller):
         super().__init__()
         self.selected_pig_widget = None
+        self.ticket = []  # Pigs on an exotic ticket, in the order they were picked
+        self.pool_ticket = None  # The player's ticket number in the pools, in parimutuel mode
         # MainWindow is the parent in normal PyQt pattern. Here I'm passing it explicitly and storing it as an attribute.
         self.main_window = main_window
         self.init_ui()
-        self.pig_widgets = []
-        self.init_timer()
+        self.pigs = []
+        # State each lane's label last showed, so frames only rewrite labels that changed
+        self.lane_states = {}
         self.race_controller = race_controller
         self.first_pig_finished = False
 
@@ -76,10 +74,27 @@ class RaceTrackWidget(QWidget):
         lower_horizontal_line.setFrameShape(QFrame.HLine)
         lower_horizontal_line.setFrameShadow(QFrame.Sunken)
         self.layout.addWidget(lower_horizontal_line)
-        # Named separate place to put the racing pig widgets
-        self.pigs_layout = QVBoxLayout()
-        # Add that one to the overall layout as well
-        self.layout.addLayout(self.pigs_layout)
+        # All the lanes are drawn by the one track view
+        self.track_view = TrackView(self)
+        self.track_view.pig_clicked.connect(self.update_racer_details)
+        self.layout.addWidget(self.track_view)
+        # Large fields are listed in a standings table instead, which only draws the rows on screen
+        self.standings_view = StandingsView(self)
+        self.standings_view.pig_clicked.connect(self.update_racer_details)
+        self.standings_view.hide()
+        self.layout.addWidget(self.standings_view)
+        # Playback controls; the race is already decided, these only change how it is shown
+        playback_layout = QHBoxLayout()
+        playback_layout.addWidget(QLabel("Playback Speed:"))
+        self.playback_rate_dropdown = QComboBox(self)
+        self.playback_rate_dropdown.addItems([f"{rate}x" for rate in PLAYBACK_RATES])
+        self.playback_rate_dropdown.currentIndexChanged.connect(self.change_playback_rate)
+        playback_layout.addWidget(self.playback_rate_dropdown)
+        self.skip_button = QPushButton("Skip to Finish")
+        self.skip_button.clicked.connect(self.skip_to_finish)
+        playback_layout.addWidget(self.skip_button)
+        playback_layout.addStretch()
+        self.layout.addLayout(playback_layout)
         # Create a new widget to govern the betting process
         self.bank = PLAYER_START_BANK
         self.betting_widget = BettingWidget(self, self.bank)
@@ -97,110 +112,136 @@ class RaceTrackWidget(QWidget):
         self.game_over_label.hide()
         self.layout.addWidget(self.game_over_label)
 
-    def init_timer(self):
-        # Initialize the timer only if it has not been created before
-        if not hasattr(self, 'update_timer'):
-            self.update_timer = QTimer(self)
-            self.update_timer.setInterval(100)  # 100 ms
-        # Connect the timeout signal to the update_standings method
-        self.update_timer.timeout.connect(self.update_standings)
-        # Start the timer
-        self.update_timer.start()
-
-    def reset_timer(self):
-        # Stop the timer
-        self.update_timer.stop()
-        # Disconnect all signals from the timeout signal
-        self.update_timer.timeout.disconnect()
-        # Reconnect the timeout signal to the update_standings method
-        self.update_timer.timeout.connect(self.update_standings)
-        # Start the timer again
-        self.update_timer.start()
-
     def add_pig(self, pig):
-        progress_bar = QProgressBar()
-        label_text = self.get_pig_label_text(pig)
-        # Instantiate a new pig racer as a custom PyQt5 class
-        pig.label = ClickableLabel(pig)
-        pig.label.clicked.connect(lambda pig=pig: self.update_racer_details(pig))
-        pig.label.setText(label_text)
-        pig.label.setMouseTracking(True)
-        pig.label.setStyleSheet("QLabel { border: 2px solid transparent; }")
-        progress_bar.setValue(0)
-        pig.progress_updated.connect(progress_bar.setValue)
-        pig.state_changed.connect(lambda state, pig=pig, label=pig.label, progress_bar=progress_bar: self.update_pig_state_label(pig, label, progress_bar, state))
-        pig.label.clicked.connect(self.update_racer_details)
-        self.pig_widgets.append((pig, pig.label, progress_bar))
-        self.pigs_layout.addWidget(pig.label)
-        self.pigs_layout.addWidget(progress_bar)
+        self.pigs.append(pig)
+        # The NORMAL colour only depends on the race conditions, so it is worked out once here
+        # from the race's own modifier cache
+        color = self.get_color_based_on_modifier(self.race_controller.race.speed_modifier(pig))
+        large_field = self.is_large_field()
+        self.track_view.setVisible(not large_field)
+        self.standings_view.setVisible(large_field)
+        if large_field:
+            self.standings_view.standings_model.add_pig(pig, self.track_view.brush_for(color))
+        else:
+            self.track_view.add_pig(pig, color)
+            self.update_pig_state_label(pig, pig.state)
+
+    def is_large_field(self):
+        return len(self.race_controller.pigs) > LARGE_FIELD_SIZE
 
     def start_race_ui(self, weather_condition, track_condition):
-        self.weather_label.setText(f"Weather Conditions: {weather_condition[0]}")
-        self.track_label.setText(f"Track Conditions: {track_condition[0]}")
+        self.show_conditions(weather_condition, track_condition)
         self.bank_label.setText(f"Player Bank: ${self.bank}")
         self.bet_amount_label.setText(f"Bet Amount: ${self.bet_amount}")
         self.bet_type_label.setText(f"Bet Category: {self.bet_type}")
         self.bet_amount = DEFAULT_BET_SIZE
         self.bet_type = "Win"
 
+    def show_conditions(self, weather_condition, track_condition):
+        self.weather_label.setText(f"Weather Conditions: {weather_condition[0]}")
+        self.track_label.setText(f"Track Conditions: {track_condition[0]}")
+
     def calculate_odds(self):
-        min_per = min(pig.performance_level for pig, _, _ in self.pig_widgets)
-        max_per = max(pig.performance_level for pig, _, _ in self.pig_widgets)
-        for pig, label, _ in self.pig_widgets:
-            normalized_per = (pig.performance_level - min_per) / (max_per - min_per) if max_per != min_per else 1
-            odds = ((1 - normalized_per) * (ODDS_MAX - ODDS_MIN)) + ODDS_MIN
-            pig.odds = max(min(odds, ODDS_MAX), ODDS_MIN)
-            self.update_pig_state_label(pig, label, None, pig.state)
-
-    def remove_pig(self, progress_bar, label):
-        self.pig_widgets = [
-            tup
-            for tup in self.pig_widgets
-            if tup[1] != label and tup[2] != progress_bar
-        ]
-        self.pigs_layout.removeWidget(progress_bar)
-        self.pigs_layout.removeWidget(label)
-        if self.selected_pig_widget in self.pig_widgets:
-            self.selected_pig_widget = None
-        progress_bar.deleteLater()
-        label.deleteLater()
+        # Closed-form odds straight away, until the simulated odds come back
+        self.race_controller.estimate_odds()
+        for pig in self.pigs:
+            self.update_pig_state_label(pig, pig.state)
+        self.standings_view.standings_model.refresh()
+        self.race_controller.request_odds()
+
+    def refresh_odds(self):
+        # Simulated odds have arrived for the current field
+        self.refresh_pool_odds()
+        if self.bet_type in EXOTIC_LEGS:
+            if self.ticket:
+                self.betting_widget.show_ticket(self.bet_type, self.ticket, self.ticket_odds())
+        elif self.selected_pig_widget is not None:
+            self.betting_widget.show_racer_details(self.selected_pig_widget, self.race_controller.track_condition)
+
+    def refresh_pool_odds(self):
+        # Also called as the pools fill up in parimutuel mode
+        for pig in self.pigs:
+            self.update_pig_state_label(pig, pig.state)
+        self.standings_view.standings_model.refresh()
+
+    def refresh_live_odds(self):
+        # In-running odds while the race plays; states come from the last frame shown
+        frame = self.race_controller.frame
+        for pig in self.pigs:
+            self.update_pig_state_label(pig, frame.states[pig.lane] if frame.finish_times[pig.lane] is None else "FINISHED")
 
     def clear_pigs(self):
-        for pig, label, progress_bar in self.pig_widgets:
-            self.pigs_layout.removeWidget(label)
-            self.pigs_layout.removeWidget(progress_bar)
-            label.deleteLater()
-            progress_bar.deleteLater()
-        self.pig_widgets.clear() 
+        self.track_view.clear()
+        self.standings_view.standings_model.clear()
+        self.pigs.clear()
+        self.lane_states.clear()
+        self.ticket = []
+        self.pool_ticket = None
 
     def update_racer_details(self, pig):
             if self.race_controller._race_started:
                 return
+            if self.bet_type in EXOTIC_LEGS:
+                self.add_to_ticket(pig)
+                return
             if self.selected_pig_widget:
-                self.selected_pig_widget.label.setStyleSheet("QLabel { border: 2px solid transparent; }")
                 self.betting_widget.clear_racer_details()  # Clear previous details
             self.selected_pig_widget = pig
-            pig.label.setStyleSheet("QLabel { border: 1px solid blue; }")
-            self.betting_widget.show_racer_details(pig)  # Show the details of the selected pig
-            for pig_widget, label, _ in self.pig_widgets:
-                label.setText(self.get_pig_label_text(pig_widget))
-
-    def update_standings(self):
-        if self.race_controller._race_started and not self.race_controller._race_finished:
-            self.pig_widgets.sort(key=lambda x: x[0].distance_covered, reverse=True)
-            
-            for _, label, progress_bar in self.pig_widgets:
-                self.pigs_layout.removeWidget(label)
-                self.pigs_layout.removeWidget(progress_bar)
-                label.hide()
-                progress_bar.hide()
-            # Re-add the widgets in the sorted order.
-            for pig, label, progress_bar in self.pig_widgets:
-                self.update_progress_bar_color(pig, progress_bar)
-                self.pigs_layout.addWidget(label)
-                self.pigs_layout.addWidget(progress_bar)
-                label.show()
-                progress_bar.show()
+            self.track_view.set_selected(pig)
+            self.standings_view.standings_model.set_selected(pig)
+            self.betting_widget.show_racer_details(pig, self.race_controller.track_condition)  # Show the details of the selected pig
+
+    def add_to_ticket(self, pig):
+        if pig in self.ticket:
+            return
+        if len(self.ticket) == EXOTIC_LEGS[self.bet_type]:
+            # A full ticket starts over with the next pick
+            self.ticket = []
+        self.ticket.append(pig)
+        self.selected_pig_widget = self.ticket[0]
+        self.track_view.set_selected(pig)
+        self.standings_view.standings_model.set_selected(pig)
+        self.betting_widget.show_ticket(self.bet_type, self.ticket, self.ticket_odds())
+
+    def ticket_odds(self):
+        if len(self.ticket) < EXOTIC_LEGS[self.bet_type] or self.race_controller.exotic_prices is None:
+            return None
+        return self.race_controller.exotic_prices.odds(self.bet_type, [pig.lane for pig in self.ticket])
+
+    def bet_ready(self):
+        # A pig is picked, and for an exotic the whole ticket is filled in
+        if self.bet_type in EXOTIC_LEGS:
+            return len(self.ticket) == EXOTIC_LEGS[self.bet_type]
+        return self.selected_pig_widget is not None
+
+    def apply_frame(self, frame):
+        if not self.standings_view.isHidden():
+            with instrumentation.span("frame.standings"):
+                self.standings_view.standings_model.apply_frame(frame)
+            return
+        # The track view draws positions and standings straight from the frame; here only the
+        # labels of lanes whose state changed need new text
+        with instrumentation.span("frame.apply"):
+            for pig in self.pigs:
+                state = frame.states[pig.lane] if frame.finish_times[pig.lane] is None else "FINISHED"
+                if self.lane_states.get(pig.lane) != state:
+                    self.update_pig_state_label(pig, state)
+            self.track_view.apply_frame(frame)
+
+    def playback_rate(self):
+        return PLAYBACK_RATES[self.playback_rate_dropdown.currentIndex()]
+
+    def set_playback_rate(self, rate):
+        if rate in PLAYBACK_RATES:
+            self.playback_rate_dropdown.setCurrentIndex(PLAYBACK_RATES.index(rate))
+        else:
+            log.warning("Unknown playback rate", extra=fields(rate=rate, rates=PLAYBACK_RATES))
+
+    def change_playback_rate(self, index):
+        self.race_controller.set_playback_rate(PLAYBACK_RATES[index])
+
+    def skip_to_finish(self):
+        self.race_controller.skip_to_finish()
 
     def get_color_based_on_modifier(self, modifier):
         # Exponential scaling factors, these can be tweaked
@@ -211,27 +252,38 @@ class RaceTrackWidget(QWidget):
         red_intensity = max(0, min(255, red_intensity))
         green_intensity = max(0, min(255, green_intensity))
         blue_intensity = 0
-        return f"rgb({int(red_intensity)}, {int(green_intensity)}, {int(blue_intensity)})"
+        return QColor(int(red_intensity), int(green_intensity), int(blue_intensity))
 
     def get_pig_label_text(self, pig, state=None):
         # If a specific state is provided, use that. Otherwise, use the pig's current state.
         pig_state = state if state is not None else pig.state
+        if self.is_parimutuel():
+            # What a $1 Win ticket would return if the race went off now
+            dividend = self.race_controller.pools.dividend("Win", pig.lane)
+            price = f"Win Pool: ${dividend:.2f}" if dividend is not None else "Win Pool: -"
+            return f"Name: {pig.name} PER: {pig.performance_level*100:.1f} {price} State: {pig_state}"
+        live_odds = self.race_controller.live_odds
+        if live_odds is not None:
+            return f"Name: {pig.name} PER: {pig.performance_level*100:.1f} Odds: {pig.odds:.2f} Live: {live_odds[pig.lane]:.2f} State: {pig_state}"
         return f"Name: {pig.name} PER: {pig.performance_level*100:.1f} Odds: {pig.odds:.2f} State: {pig_state}"
 
-    def update_pig_state_label(self, pig, label, progress_bar, state):
-        # Update the label text to include the pig's current state
-        label_text = self.get_pig_label_text(pig, state)
-        label.setText(label_text)
-        self.update_progress_bar_color(pig, progress_bar)
+    def update_pig_state_label(self, pig, state):
+        # Update the label text to include the pig's current state. The standings table
+        # renders its own text, so there is nothing to do for a large field.
+        if not self.standings_view.isHidden():
+            return
+        self.lane_states[pig.lane] = state
+        self.track_view.set_lane_text(pig.lane, self.get_pig_label_text(pig, state))
     
     def handle_bet_placed(self, bet_amount, bet_type):
-        print(f"Called RaceTrackWidget.handle_bet_placed")
         self.bet_amount = bet_amount
         self.bet_details = bet_type
         # Deducts the cost of the bet from the player's bank directly
-        print(f"Bank: {self.bank}")
-        self.bank = round(self.bank - self.bet_amount, 2)
+        log.info("Bet placed", extra=fields(bet=bet_type, amount=bet_amount, bank=self.bank))
+        self.bank = place_bet(self.bank, self.bet_amount)
         self.update_bank_label()
+        if self.is_parimutuel() and bet_type not in EXOTIC_LEGS:
+            self.pool_ticket = self.race_controller.place_wager(bet_type, self.selected_pig_widget.lane, bet_amount)
     
     def update_bank_label(self):
         self.bank_label.setText(f"Player Bank: ${self.bank}")
@@ -243,72 +295,85 @@ class RaceTrackWidget(QWidget):
     def update_bet_type_label(self, bet_type):
         self.bet_type = bet_type
         self.bet_type_label.setText(f"Bet Category: {self.bet_type}")
+        # Tickets are for one bet type
+        self.ticket = []
     
     def calculate_payout(self, bet_type, bet_amount, odds):
-        multiplier = BET_MULTIPLIERS.get(bet_type, 1)
-        print(f"Calculating payout. {bet_amount} * {odds} * {multiplier:.2f}")
-        return bet_amount * odds * multiplier
+        payout = calculate_payout(bet_type, bet_amount, odds)
+        log.debug("Payout", extra=fields(bet=bet_type, amount=bet_amount, odds=odds, multiplier=f"{BET_MULTIPLIERS.get(bet_type, 1):.2f}", payout=payout))
+        return payout
     
     def handle_pig_finished(self, name, time):
-        # Remove the finished pig's widgets and emit race results first as it's a common operation
-        self.remove_finished_pig_widgets(name)
+        # Emit race results first as it's a common operation
         self.emit_race_results_and_check_end(name, time)
+        # finished_place is the place this pig finished in; the bet is settled by settlement's rules
+        place = self.finished_place
         self.finished_place += 1
-        if self.selected_pig_widget and self.selected_pig_widget.name == name:
-            if self.finished_place == 1:
-                self.process_payout(name, "Winner", self.bet_type == "Win")
-            elif self.finished_place == 2 and self.bet_type in ["Place", "Show"]:
-                self.process_payout(name, "Pig Placed (2nd)", self.bet_type == "Place")
-            elif self.finished_place == 3 and self.bet_type == "Show":
-                self.process_payout(name, "Pig Showed (3rd)", True)
+        if self.bet_type in EXOTIC_LEGS:
+            # A ticket is settled as soon as its last leg is home
+            if place == EXOTIC_LEGS[self.bet_type] and self.bet_ready():
+                self.settle_ticket(self.race_controller.frame.finish_order)
+        elif self.is_parimutuel():
+            # Pool bets are paid out all together once everyone is home
+            return
+        elif self.selected_pig_widget and self.selected_pig_widget.name == name:
+            if place in PLACE_NAMES:
+                self.process_payout(name, PLACE_NAMES[place], bet_pays(self.bet_type, place), place)
             else:
-                print(f"Pig {name} finished {self.finished_place}th but did not meet bet conditions.")
+                log.info("Bet lost", extra=fields(pig=name, bet=self.bet_type, place=place))
 
-    def process_payout(self, name, status, is_payout_valid):
+    def process_payout(self, name, status, is_payout_valid, place):
         if is_payout_valid:
             # Calculate and process the payout
-            payout = round(self.calculate_payout(self.bet_amount, self.selected_pig_widget.odds), 2)
-            self.bank = round(self.bank + payout)
+            payout = self.calculate_payout(self.bet_type, self.bet_amount, self.selected_pig_widget.bet_odds[self.bet_type])
+            self.bank = credit_payout(self.bank, payout)
             self.update_bank_label()
-            print(f"{status}! Pig: {name}, Payout: ${payout}")
+            log.info("Bet won", extra=fields(pig=name, bet=self.bet_type, place=status, payout=payout))
         else:
-            print(f"No payout for {name}. Bet was for {self.bet_type}, but pig finished {self.finished_place}th.")
+            log.info("Bet lost", extra=fields(pig=name, bet=self.bet_type, place=place))
 
-    def remove_finished_pig_widgets(self, name):
-        # Remove the widgets of the pig that finished.
-        for pig, label, progress_bar in self.pig_widgets[:]:
-            if pig.name == name:
-                self.remove_pig(progress_bar, label)
-                break
+    def settle_ticket(self, finish_order):
+        lanes = [pig.lane for pig in self.ticket]
+        names = ", ".join(pig.name for pig in self.ticket)
+        odds = self.ticket_odds()
+        payout = settle_exotic(self.bet_type, self.bet_amount, odds, lanes, finish_order)
+        if payout:
+            self.bank = credit_payout(self.bank, payout)
+            self.update_bank_label()
+            log.info("Ticket won", extra=fields(bet=self.bet_type, ticket=names, odds=f"{odds:.2f}", payout=payout))
+        else:
+            log.info("Ticket lost", extra=fields(bet=self.bet_type, ticket=names))
+
+    def handle_pool_settlement(self, settlement):
+        dividends = {f"dividend_{bet_type.lower()}": f"{dividend:.2f}" for bet_type, dividend in zip(BET_TYPES, settlement.dividends)}
+        log.info("Pools settled", extra=fields(tickets=len(settlement.payouts), **dividends))
+        if self.pool_ticket is None:
+            return
+        payout = float(settlement.payouts[self.pool_ticket])
+        self.pool_ticket = None
+        if payout:
+            self.bank = credit_payout(self.bank, payout)
+            self.update_bank_label()
+            log.info("Pool bet won", extra=fields(bet=self.bet_type, payout=payout))
+        else:
+            log.info("Pool bet lost", extra=fields(bet=self.bet_type))
+
+    def is_parimutuel(self):
+        return self.race_controller.pools is not None
 
     def emit_race_results_and_check_end(self, name, time):
-        # Emit the race results and check if all pigs have finished.
+        # Emit the race results and check if all pigs have finished. The recap follows on
+        # the race controller's race_finished.
         self.race_results_signal.emit(name, time)
-        if not any(pig.running for pig, _, _ in self.pig_widgets):
-            self.race_controller._race_finished = True
-            self.update_timer.stop()
+        if len(self.race_controller.frame.finish_order) == len(self.race_controller.pigs):
             self.betting_widget.hide()
-            self.main_window.show_race_recap()
-
-    def update_progress_bar_color(self, pig, progress_bar):
-        if progress_bar is not None:
-            if pig.state == "CHARGING":
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: lightblue; }")
-            elif pig.state == "RECOVERING":
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: red; }")
-            else:
-                color = self.get_color_based_on_modifier(pig.get_speed_modifier(
-                    self.race_controller.weather_condition,
-                    self.race_controller.track_condition
-                ))
-                progress_bar.setStyleSheet(f"QProgressBar::chunk {{ background-color: {color}; }}")
 
     def start_new_game(self):
         # Reset the game state and set the bank to the starting value
         self.main_window.reset_race(True)
 
     def check_bank_status(self):
-        if self.bank < 5: # Minimum bet size
+        if self.bank < MIN_BET:
             self.display_game_over()
 
     def display_game_over(self):
@@ -317,8 +382,7 @@ class RaceTrackWidget(QWidget):
             # Disable betting widgets to prevent new bets
             self.betting_widget.setEnabled(False)
             self.game_over_label.show()
-            # Change the main window start button text to indicate a new game can be started
+            # Change the main window start button text to indicate a new game can be started;
+            # MainWindow.handle_start_button starts one when it is clicked
             self.main_window.start_button.setText("New Game")
-            # Connect the button click to a method that resets the game
-            self.main_window.start_button.clicked.disconnect()
-            self.main_window.start_button.clicked.connect(self.main_window.reset_race)
\ No newline at end of file
+            self.main_window.start_button.setEnabled(True)
\ No newline at end of file
@@ -0,0 +1,65 @@
+from constants import BET_MULTIPLIERS, BET_AMOUNTS
+import numpy as np
+
+# The betting rules on their own, with no Qt, so the window and the backtester settle bets
+# the same way. A straight bet is on one pig finishing in exactly one position: Win pays on
+# 1st, Place on 2nd and Show on 3rd. An exotic bet is a ticket on the first two or three
+# home: an Exacta names the first two in order, a Quinella the first two in either order and
+# a Trifecta the first three in order. A winning bet pays the stake times its odds times the
+# bet type's multiplier; the stake itself is not handed back.
+
+BET_TYPES = ("Win", "Place", "Show")
+BET_PLACES = {"Win": 1, "Place": 2, "Show": 3}
+EXOTIC_LEGS = {"Exacta": 2, "Quinella": 2, "Trifecta": 3}  # Pigs named on a ticket
+EXOTIC_TYPES = tuple(EXOTIC_LEGS)
+PLACE_NAMES = {1: "Winner", 2: "Pig Placed (2nd)", 3: "Pig Showed (3rd)"}
+MIN_BET = min(BET_AMOUNTS)
+# The same rules as arrays, indexed by position in BET_TYPES, for settling many bets at once
+BET_PLACE_ARRAY = np.array([BET_PLACES[bet_type] for bet_type in BET_TYPES])
+BET_MULTIPLIER_ARRAY = np.array([BET_MULTIPLIERS.get(bet_type, 1) for bet_type in BET_TYPES], dtype=np.float64)
+
+
+def bet_pays(bet_type, place):
+    # place is the pig's 1-based finishing position
+    return BET_PLACES.get(bet_type) == place
+
+
+def calculate_payout(bet_type, bet_amount, odds):
+    return round(bet_amount * odds * BET_MULTIPLIERS.get(bet_type, 1), 2)
+
+
+def settle(bet_type, bet_amount, odds, place):
+    # What a bet pays back, 0 if it lost
+    return calculate_payout(bet_type, bet_amount, odds) if bet_pays(bet_type, place) else 0
+
+
+def exotic_pays(bet_type, lanes, finish_order):
+    # finish_order is the lanes in the order they came home; only the first legs matter
+    legs = EXOTIC_LEGS[bet_type]
+    home = tuple(finish_order[:legs])
+    if len(home) < legs:
+        return False
+    if bet_type == "Quinella":
+        return sorted(home) == sorted(lanes)
+    return home == tuple(lanes)
+
+
+def settle_exotic(bet_type, bet_amount, odds, lanes, finish_order):
+    return calculate_payout(bet_type, bet_amount, odds) if exotic_pays(bet_type, lanes, finish_order) else 0
+
+
+def place_bet(bank, bet_amount):
+    # The stake comes straight off the bank
+    return round(bank - bet_amount, 2)
+
+
+def credit_payout(bank, payout):
+    # Banks are kept in whole dollars once a bet has paid
+    return round(bank + payout)
+
+
+def settle_many(bet_types, bet_amounts, odds, places):
+    # Vectorized settle: bet_types are indices into BET_TYPES, and every argument is an array
+    # of the same shape. Returns the payouts.
+    pays = places == BET_PLACE_ARRAY[bet_types]
+    return np.where(pays, np.round(bet_amounts * odds * BET_MULTIPLIER_ARRAY[bet_types], 2), 0.0)
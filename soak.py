@@ -0,0 +1,147 @@
+from constants import FIELD_SIZE
+from instrumentation import thread_count
+from PyQt5.QtCore import QCoreApplication, QEvent, QObject
+from settlement import EXOTIC_LEGS
+import argparse
+import gc
+import os
+import random
+import resource
+import sys
+import time
+
+# Soak test for the window's race lifecycle. One window plays race after race the way a
+# player would: pick a bet type and pigs, place the bet, skip to the finish, then Race Again
+# (or New Game once the bank runs dry). After a warm-up, the process's resident memory, the
+# live QObjects and the thread count are sampled every so often, and the run fails if any of
+# them has grown past its allowance by the end. Runs on Qt's offscreen platform unless
+# QT_QPA_PLATFORM says otherwise.
+#
+#   python soak.py --races 10000
+#   python soak.py --races 2000 --pigs 200 --parimutuel
+
+RACES = 10000
+WARMUP = 200  # Races before the baseline sample, so pools and caches have filled
+SAMPLE_EVERY = 500
+RSS_SLACK_MB = 16.0  # Growth in resident memory allowed over the whole run
+QOBJECT_SLACK = 0  # Live QObjects allowed over the baseline
+RACE_TIMEOUT = 30.0  # seconds a race may take to finish before the run fails
+SOAK_SEED = 1234
+
+
+def rss_mb():
+    # Resident memory now; where /proc is missing, the peak, which still shows growth
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def qobject_count():
+    # QObjects with a Python wrapper still alive, widgets, timers, workers and threads alike
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, QObject))
+
+
+def sample(window):
+    gc.collect()
+    return {
+        'rss_mb': rss_mb(),
+        'qobjects': qobject_count(),
+        'children': len(window.findChildren(QObject)),
+        'threads': thread_count(),
+    }
+
+
+def wait_until(app, done, timeout):
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() > deadline:
+            raise RuntimeError("timed out waiting on the window")
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+def play_race(app, window, rng):
+    # One race through the same calls the buttons and lanes make
+    controller = window.race_controller
+    track = window.race_track_widget
+    betting = window.betting_widget
+    if window.start_button.text() == "New Game":
+        window.handle_start_button()
+        controller = window.race_controller
+    bet_types = [betting.bet_type_dropdown.itemText(index) for index in range(betting.bet_type_dropdown.count())]
+    betting.bet_type_dropdown.setCurrentIndex(bet_types.index(rng.choice(bet_types)))
+    picks = EXOTIC_LEGS.get(track.bet_type, 1)
+    for pig in rng.sample(controller.pigs, picks):
+        track.update_racer_details(pig)
+    window.start_button.setText("Place Bet")
+    window.handle_start_button()
+    controller.skip_to_finish()
+    wait_until(app, lambda: controller._race_finished, RACE_TIMEOUT)
+    app.processEvents()
+    window.handle_start_button()  # Race Again, or New Game's turn comes next race
+    # Objects handed to deleteLater() (Qt's own layout animations among them) are only freed
+    # by a running event loop, which processEvents() from out here is not
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+
+def check(baseline, final, rss_slack_mb=RSS_SLACK_MB, qobject_slack=QOBJECT_SLACK):
+    # Returns what grew past its allowance
+    failures = []
+    if final['rss_mb'] - baseline['rss_mb'] > rss_slack_mb:
+        failures.append(f"resident memory grew {final['rss_mb'] - baseline['rss_mb']:.1f} MB (allowed {rss_slack_mb} MB)")
+    if final['qobjects'] - baseline['qobjects'] > qobject_slack:
+        failures.append(f"live QObjects grew from {baseline['qobjects']} to {final['qobjects']}")
+    if final['children'] - baseline['children'] > qobject_slack:
+        failures.append(f"the window's child objects grew from {baseline['children']} to {final['children']}")
+    if final['threads'] > baseline['threads']:
+        failures.append(f"threads grew from {baseline['threads']} to {final['threads']}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play thousands of races in one window and check that nothing grows.")
+    parser.add_argument('--races', type=int, default=RACES)
+    parser.add_argument('--warmup', type=int, default=WARMUP)
+    parser.add_argument('--sample-every', type=int, default=SAMPLE_EVERY)
+    parser.add_argument('--pigs', type=int, default=FIELD_SIZE, help="field size (default: drawn per race)")
+    parser.add_argument('--parimutuel', action='store_true')
+    parser.add_argument('--rss-slack', type=float, default=RSS_SLACK_MB, help="resident memory growth allowed, in MB")
+    parser.add_argument('--seed', type=int, default=SOAK_SEED, help="seeds the first race and the bets")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from main_window import MainWindow
+    from odds_engine import shutdown_executor
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = MainWindow(args.seed, num_pigs=args.pigs, parimutuel=args.parimutuel)
+    window.show()
+    rng = random.Random(args.seed)
+    baseline = None
+    started = time.monotonic()
+    try:
+        for race in range(1, args.races + 1):
+            play_race(app, window, rng)
+            if race == args.warmup or (baseline is None and race == args.races):
+                baseline = sample(window)
+                print(f"{'race':>7} {'rss MB':>8} {'qobjects':>9} {'children':>9} {'threads':>8} {'races/s':>8}")
+                print(f"{race:>7} {baseline['rss_mb']:>8.1f} {baseline['qobjects']:>9} {baseline['children']:>9} {baseline['threads']:>8} {race / (time.monotonic() - started):>8.1f}")
+            elif baseline is not None and (race % args.sample_every == 0 or race == args.races):
+                now = sample(window)
+                print(f"{race:>7} {now['rss_mb']:>8.1f} {now['qobjects']:>9} {now['children']:>9} {now['threads']:>8} {race / (time.monotonic() - started):>8.1f}")
+        final = sample(window)
+    finally:
+        window.close()
+        shutdown_executor()
+    failures = check(baseline, final, args.rss_slack)
+    for failure in failures:
+        print("LEAK:", failure)
+    print(f"{args.races} races, {'leaked' if failures else 'flat'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
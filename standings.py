@@ -0,0 +1,156 @@
+from constants import TOTAL_TRACK_LENGTH
+from PyQt5.QtWidgets import QAbstractItemView, QHeaderView, QStyledItemDelegate, QTableView
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QBrush, QColor, QFont
+
+# Standings table for large fields. The model only answers for the rows the view asks
+# about, which are the rows on screen, so a frame costs the same with fifty pigs or five
+# thousand: applying one just swaps the frame in and tells the view every row changed.
+
+COLUMNS = ("Pos", "Pig", "PER", "Odds", "State", "Progress")
+PROGRESS_COLUMN = COLUMNS.index("Progress")
+ROW_HEIGHT = 20
+PROGRESS_ROLE = Qt.UserRole  # Share of the course covered, 0 to 1
+STATE_ROLE = Qt.UserRole + 1
+
+
+class StandingsModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pigs = []
+        self.lane_brushes = []  # Bar brush for a NORMAL pig in each lane
+        self.frame = None
+        self.order = []  # Lane shown on each row
+        self.selected_lane = None
+        self.bold_font = QFont()
+        self.bold_font.setBold(True)
+
+    def add_pig(self, pig, brush):
+        row = len(self.pigs)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.pigs.append(pig)
+        self.lane_brushes.append(brush)
+        self.order.append(pig.lane)  # A list until the first frame's order replaces it
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.pigs = []
+        self.lane_brushes = []
+        self.frame = None
+        self.order = []
+        self.selected_lane = None
+        self.endResetModel()
+
+    def apply_frame(self, frame):
+        self.frame = frame
+        self.order = frame.order
+        self.refresh()
+
+    def refresh(self):
+        # One signal for the whole table; the view only repaints the rows it is showing
+        if self.pigs:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.pigs) - 1, len(COLUMNS) - 1))
+
+    def set_selected(self, pig):
+        self.selected_lane = pig.lane if pig is not None else None
+        self.refresh()
+
+    def pig_at(self, row):
+        return self.pigs[self.order[row]]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.pigs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def lane_state(self, lane):
+        frame = self.frame
+        if frame is None:
+            return self.pigs[lane].state
+        if frame.finish_times[lane] is not None:
+            return "FINISHED"
+        return frame.states[lane]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        lane = self.order[row]
+        pig = self.pigs[lane]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return str(row + 1)
+            if column == 1:
+                return pig.name
+            if column == 2:
+                return f"{pig.performance_level*100:.1f}"
+            if column == 3:
+                return f"{pig.odds:.2f}"
+            if column == 4:
+                state = self.lane_state(lane)
+                return f"{state} {self.frame.finish_times[lane]:.2f}s" if state == "FINISHED" else state
+            return None
+        if role == PROGRESS_ROLE:
+            return self.frame.distances[lane] / TOTAL_TRACK_LENGTH if self.frame is not None else 0.0
+        if role == STATE_ROLE:
+            return self.lane_state(lane)
+        if role == Qt.BackgroundRole and column == PROGRESS_COLUMN:
+            return self.lane_brushes[lane]
+        if role == Qt.FontRole and lane == self.selected_lane:
+            return self.bold_font
+        return None
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    # Paints the progress column as a bar in the pig's state colour, like TrackView's lanes
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.track_brush = QBrush(QColor(235, 235, 235))
+        self.state_brushes = {"CHARGING": QBrush(QColor("lightblue")), "RECOVERING": QBrush(QColor("red"))}
+
+    def paint(self, painter, option, index):
+        rect = QRectF(option.rect).adjusted(2, 3, -2, -3)
+        fraction = min(index.data(PROGRESS_ROLE), 1.0)
+        brush = self.state_brushes.get(index.data(STATE_ROLE), index.data(Qt.BackgroundRole))
+        painter.save()
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self.track_brush)
+        painter.drawRect(rect)
+        painter.setBrush(brush)
+        painter.drawRect(QRectF(rect.left(), rect.top(), rect.width() * fraction, rect.height()))
+        painter.restore()
+
+
+class StandingsView(QTableView):
+    pig_clicked = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.standings_model = StandingsModel(self)
+        self.setModel(self.standings_model)
+        self.setItemDelegateForColumn(PROGRESS_COLUMN, ProgressDelegate(self))
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setShowGrid(False)
+        # Fixed row heights let the view work out what is on screen without asking the model
+        self.verticalHeader().hide()
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        header = self.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        header.setStretchLastSection(True)
+        self.setColumnWidth(0, 50)
+        self.setColumnWidth(1, 180)
+        self.setColumnWidth(2, 60)
+        self.setColumnWidth(3, 60)
+        self.setColumnWidth(4, 140)
+        self.setMinimumHeight(ROW_HEIGHT * 12)
+        self.clicked.connect(lambda index: self.pig_clicked.emit(self.standings_model.pig_at(index.row())))
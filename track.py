@@ -0,0 +1,39 @@
+from bisect import bisect_right
+from collections import namedtuple
+from constants import STRAIGHTAWAY_LENGTH, TURN_LENGTH, TOTAL_TRACK_LENGTH
+
+# The oval as a table of segments, laid out once at import: the race starts at the head of
+# the back straight and runs straight, turn, straight, turn to the line. Each pig's speed on
+# every segment only depends on its stats and the race conditions, so the engines work it
+# out once per race (segment_speeds) and then only ever look it up by segment index.
+
+Segment = namedtuple('Segment', ['start', 'end', 'is_turn'])
+
+
+def build_segments(layout):
+    # layout is a sequence of (length, is_turn), in running order
+    segments = []
+    start = 0
+    for length, is_turn in layout:
+        segments.append(Segment(start, start + length, is_turn))
+        start += length
+    return tuple(segments)
+
+
+SEGMENTS = build_segments(((STRAIGHTAWAY_LENGTH, False), (TURN_LENGTH, True), (STRAIGHTAWAY_LENGTH, False), (TURN_LENGTH, True)))
+SEGMENT_STARTS = tuple(segment.start for segment in SEGMENTS)
+SEGMENT_ENDS = tuple(segment.end for segment in SEGMENTS)
+TURNS = tuple(segment.is_turn for segment in SEGMENTS)
+assert SEGMENT_ENDS[-1] == TOTAL_TRACK_LENGTH, "The segments have to add up to the race distance"
+
+
+def segment_at(distance):
+    # Index of the segment a distance falls in; the line itself counts as the last segment
+    return min(max(bisect_right(SEGMENT_STARTS, distance) - 1, 0), len(SEGMENTS) - 1)
+
+
+def segment_speeds(base_speed_mps, straight_modifier, turn_modifier):
+    # Cruising speed in m/s on each segment, before the state multiplier
+    straight = base_speed_mps * straight_modifier
+    turn = base_speed_mps * turn_modifier
+    return tuple(turn if is_turn else straight for is_turn in TURNS)
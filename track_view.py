@@ -0,0 +1,181 @@
+from constants import TOTAL_TRACK_LENGTH
+import instrumentation
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import pyqtSignal, QRectF, QTimer, Qt
+from PyQt5.QtGui import QBrush, QColor, QFont, QFontMetrics, QGuiApplication, QPainter, QPen
+from race_engine import TICK_SECONDS
+import time
+from track import SEGMENTS
+
+ROW_HEIGHT_MAX = 34  # pixels per lane when there is room
+ROW_HEIGHT_MIN = 6  # below this the field is simply taller than the widget
+TEXT_ROW_HEIGHT = 14  # lanes shorter than this are drawn without their label
+LABEL_FRACTION = 0.45  # share of the width given to the lane labels
+
+
+class TrackView(QWidget):
+    # Draws every lane, the standings order, state colours and the finish line in a single
+    # paintEvent. Frames arrive every TICK_SECONDS of real time whatever the playback rate; in
+    # between, positions (and standings rows) are interpolated at the display refresh rate, and
+    # the repaint timer idles as soon as the picture stops moving.
+    pig_clicked = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pigs = []
+        self.texts = {}  # Label text per lane, set by RaceTrackWidget
+        self.elided_texts = {}  # lane -> (text, width, elided text), so paints don't re-measure
+        self.lane_brushes = {}  # Bar brush for a NORMAL pig in each lane, fixed for the race
+        self.brushes = {}  # One brush per distinct colour, shared by the lanes of a field
+        self.state_brushes = {"CHARGING": QBrush(QColor("lightblue")), "RECOVERING": QBrush(QColor("red"))}
+        self.track_brush = QBrush(QColor(235, 235, 235))
+        self.turn_brush = QBrush(QColor(215, 215, 215))
+        self.selected_pen = QPen(QColor("blue"), 1)
+        self.finish_pen = QPen(QColor("black"), 2, Qt.DashLine)
+        self.text_pen = QPen(QColor("black"))
+        self.label_font = QFont()
+        self.font_metrics = QFontMetrics(self.label_font)
+        self.selected_lane = None
+        self.frame = None
+        self.previous_frame = None
+        self.frame_arrived = 0.0
+        self.rows = {}  # Current standings row of each lane
+        self.previous_rows = {}
+        self.setMinimumHeight(ROW_HEIGHT_MAX * 5)
+        self.animation_timer = QTimer(self)
+        self.animation_timer.setInterval(max(1, int(1000 / self.refresh_rate())))
+        self.animation_timer.timeout.connect(self.animate)
+
+    def refresh_rate(self):
+        screen = QGuiApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return rate if rate > 0 else 60
+
+    def add_pig(self, pig, color):
+        self.pigs.append(pig)
+        self.lane_brushes[pig.lane] = self.brush_for(color)
+        self.rows[pig.lane] = len(self.rows)
+        self.previous_rows = dict(self.rows)
+        self.setMinimumHeight(max(ROW_HEIGHT_MAX * 5, ROW_HEIGHT_MIN * len(self.pigs)))
+        self.update()
+
+    def brush_for(self, color):
+        brush = self.brushes.get(color.rgba())
+        if brush is None:
+            brush = self.brushes[color.rgba()] = QBrush(color)
+        return brush
+
+    def clear(self):
+        self.animation_timer.stop()
+        self.pigs = []
+        self.texts.clear()
+        self.elided_texts.clear()
+        self.lane_brushes.clear()
+        # Colours are per pig, so a cache kept across races would grow with every field
+        self.brushes.clear()
+        self.rows.clear()
+        self.previous_rows.clear()
+        self.selected_lane = None
+        self.frame = None
+        self.previous_frame = None
+        self.update()
+
+    def set_lane_text(self, lane, text):
+        if self.texts.get(lane) != text:
+            self.texts[lane] = text
+            self.update()
+
+    def set_selected(self, pig):
+        self.selected_lane = pig.lane if pig is not None else None
+        self.update()
+
+    def apply_frame(self, frame):
+        self.previous_frame = self.frame if self.frame is not None else frame
+        self.previous_rows = self.rows
+        self.rows = {lane: row for row, lane in enumerate(frame.order)}
+        self.frame = frame
+        self.frame_arrived = time.monotonic()
+        if not self.animation_timer.isActive():
+            self.animation_timer.start()
+        self.update()
+
+    def progress(self):
+        # How far we are from the previous frame towards the current one, 0 to 1, moving
+        # over the real time until the next frame is due, which at 4x covers four ticks of race
+        if self.frame is None or self.frame.clock <= self.previous_frame.clock:
+            return 1.0
+        return min((time.monotonic() - self.frame_arrived) / TICK_SECONDS, 1.0)
+
+    def animate(self):
+        self.update()
+        if self.progress() >= 1.0:
+            # Nothing left to interpolate until the next frame arrives
+            self.animation_timer.stop()
+
+    def row_height(self):
+        if not self.pigs:
+            return ROW_HEIGHT_MAX
+        return max(ROW_HEIGHT_MIN, min(ROW_HEIGHT_MAX, self.height() / len(self.pigs)))
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        row = int(event.y() / self.row_height())
+        lane = next((lane for lane, lane_row in self.rows.items() if lane_row == row), None)
+        if lane is not None:
+            self.pig_clicked.emit(next(pig for pig in self.pigs if pig.lane == lane))
+
+    def elided_text(self, lane, text, width):
+        cached = self.elided_texts.get(lane)
+        if cached is None or cached[0] != text or cached[1] != width:
+            cached = (text, width, self.font_metrics.elidedText(text, Qt.ElideRight, width))
+            self.elided_texts[lane] = cached
+        return cached[2]
+
+    @instrumentation.timed("frame.paint")
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setFont(self.label_font)
+        row_height = self.row_height()
+        width = self.width()
+        label_width = width * LABEL_FRACTION if row_height >= TEXT_ROW_HEIGHT else 0
+        track_left = label_width + 4
+        track_width = max(width - track_left - 8, 1)
+        finish_x = track_left + track_width
+        alpha = self.progress()
+        frame = self.frame
+        previous = self.previous_frame
+        bar_height = max(row_height - 6, 2) if row_height >= TEXT_ROW_HEIGHT else max(row_height - 1, 1)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self.track_brush)
+        painter.drawRect(QRectF(track_left, 0, track_width, row_height * len(self.pigs)))
+        # Shade the turns, where agility counts
+        painter.setBrush(self.turn_brush)
+        for segment in SEGMENTS:
+            if segment.is_turn:
+                left = track_left + track_width * segment.start / TOTAL_TRACK_LENGTH
+                painter.drawRect(QRectF(left, 0, track_width * (segment.end - segment.start) / TOTAL_TRACK_LENGTH, row_height * len(self.pigs)))
+        for pig in self.pigs:
+            lane = pig.lane
+            row = self.previous_rows.get(lane, 0) + (self.rows.get(lane, 0) - self.previous_rows.get(lane, 0)) * alpha
+            top = row * row_height
+            if frame is not None:
+                distance = previous.distances[lane] + (frame.distances[lane] - previous.distances[lane]) * alpha
+                state = frame.states[lane]
+            else:
+                distance = 0.0
+                state = pig.state
+            fraction = min(distance / TOTAL_TRACK_LENGTH, 1.0)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(self.state_brushes.get(state, self.lane_brushes.get(lane)))
+            painter.drawRect(QRectF(track_left, top + (row_height - bar_height) / 2, track_width * fraction, bar_height))
+            if label_width:
+                painter.setPen(self.text_pen)
+                text = self.elided_text(lane, self.texts.get(lane, pig.name), int(label_width - 8))
+                painter.drawText(QRectF(4, top, label_width - 4, row_height), Qt.AlignVCenter | Qt.AlignLeft, text)
+            if lane == self.selected_lane:
+                painter.setPen(self.selected_pen)
+                painter.setBrush(Qt.NoBrush)
+                painter.drawRect(QRectF(1, top + 1, width - 2, row_height - 2))
+        painter.setPen(self.finish_pen)
+        painter.drawLine(int(finish_x), 0, int(finish_x), int(row_height * len(self.pigs)))
+        painter.end()